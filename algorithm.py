@@ -1,16 +1,22 @@
 # pylint: disable=C0321,C0103,W0613,R0201,R0913, R0904, C0111
 try: QCAlgorithm
 except NameError:
-    from mocked import TradeBarConsolidator, OrderType, OrderEvent, Symbol, SecurityType, QCAlgorithm, Resolution
+    from mocked import OrderType, OrderEvent, Symbol, SecurityType, QCAlgorithm, Resolution, \
+        Chart, Series, SeriesType, RollingWindow, TradeBar
 
 import math
 from datetime import timedelta
-from decorators import accepts, convert_to_symbol
+from decorators import accepts, convert_to_symbol, post
 from market import Portfolio, InternalOrder, Broker, BenchmarkSymbol
-from singleton import Singleton, Email
+from singleton import Singleton, Email, Digest
+from snapshot import Snapshot
+from universe import CoarseUniverse, FineUniverse, select
+from consolidators import ConsolidatorRegistry
 
 
 class AlgorithmManager(QCAlgorithm):
+    __on_data = []
+    __on_data_algorithms = []
 
     @accepts(self=object, algorithms=list, reserve=float, reset=bool, plot_orders=bool, plot_value=bool, plot_allocation=bool, email_address=str)
     def registerAlgorithms(self, algorithms, reserve=0.0, reset=True, plot_orders=True, plot_value=True, plot_allocation=True, email_address=None):
@@ -21,11 +27,23 @@ class AlgorithmManager(QCAlgorithm):
 
         if not hasattr(self, '_benchmark'):
             self._benchmark = None
+        if not hasattr(self, '_snapshot_key'):
+            self._snapshot_key = None
+        if not hasattr(self, '_selection_workers'):
+            self._selection_workers = 1
 
         self.__algorithms = algorithms
+        # bound OnData of the algorithms that override it, so that the per-bar path only calls them
+        self.__on_data_algorithms = [i for i in algorithms
+                                     if getattr(i.OnData, '__func__', None) is not SimpleAlgorithm.OnData]
+        self.__on_data = [i.OnData for i in self.__on_data_algorithms]
+        self.__coarse_algorithms = [i for i in algorithms if getattr(i.CoarseSelectionFunction, '__func__', None)
+                                    is not SimpleAlgorithm.CoarseSelectionFunction]
+        self.__fine_algorithms = [i for i in algorithms if getattr(i.FineSelectionFunction, '__func__', None)
+                                  is not SimpleAlgorithm.FineSelectionFunction]
         self.__reserve = reserve
         self.__reset = reset
-        self.__email_address = email_address
+        self.__digest = Digest(email_address, transport=Singleton.EmailTransport) if email_address else Singleton.Email
 
         self.__year = None
         self.__month = None
@@ -45,7 +63,7 @@ class AlgorithmManager(QCAlgorithm):
                 i.Allocation = algorithms_allocation / len(algorithms)
             total_allocation += i.Allocation
 
-        assert total_allocation <= 1.00, \
+        assert round(total_allocation, 6) <= 1.00, \
             f"Total allocation exceeds 100%: {round(100 * total_allocation, 1)}%"
 
         plot = Chart('Annual Saw Tooth Returns')
@@ -75,11 +93,14 @@ class AlgorithmManager(QCAlgorithm):
                 self.Plot("Allocation", i.Name, round(100.0 * i.Allocation, 1))
             self.AddChart(plot)
 
-        if self.__email_address:
+        if self.__digest:
             for i in self.__algorithms:
-                i.Email.SetEmailAddress(self.__email_address)
+                i.Email.SetEmailAddress(self.__digest.Address)
                 i.Email.AppendText("Algorithm started")
-                i.Email.Send(f"{i.Name} (Started)")
+            self.__digest.Send("Started", self.__email_sections(), force=True)
+
+        if self.LiveMode:
+            self.RestoreRollingWindows()
 
 
     def ResetPlot(self):
@@ -106,60 +127,209 @@ class AlgorithmManager(QCAlgorithm):
     def SetBenchmark(self, benchmark, security_type=SecurityType.Equity):
         self._benchmark = BenchmarkSymbol(benchmark, security_type=security_type)
 
+    def SetSnapshotKey(self, key):
+        """Save state to the ObjectStore under key every day, and resume from it on live restarts.
+
+        Call before registerAlgorithms so that rolling windows are restored before the warm-up.
+        """
+        self._snapshot_key = key
+
+    def SetJournal(self, journal):
+        """Record order events, prices and orders to journal.Journal, starting from the current state.
+
+        Call after registerAlgorithms.
+        """
+        Singleton.Journal = journal
+        journal.RecordSnapshot(self.__algorithms, Singleton.Broker)
+
+    def SetReconciler(self, reconciler):
+        """Check the portfolios against the brokerage at the end of every day and on reconnects.
+
+        Call after registerAlgorithms.
+        """
+        Singleton.Reconciler = reconciler
+        self.__rebuild_reconciler()
+
+    def __rebuild_reconciler(self):
+        if Singleton.Reconciler is not None:
+            Singleton.Reconciler.Rebuild([i.Portfolio for i in self.__algorithms] + [Singleton.Broker.Portfolio])
+
+    def SetExecutionEngine(self, engine):
+        """Slice large orders with an execution.ExecutionEngine; it steps on every OnData unless on_data=False."""
+        Singleton.Execution = engine
+
+    def SetRiskEngine(self, risk):
+        """Check orders against risk.RiskEngine limits before they reach the broker.
+
+        Call after registerAlgorithms.
+        """
+        Singleton.Risk = risk
+        self.__rebuild_risk()
+
+    def __rebuild_risk(self):
+        if Singleton.Risk is not None:
+            Singleton.Risk.Rebuild([i.Portfolio for i in self.__algorithms])
+
+    def _snapshot_metrics(self):
+        return {
+            "initial_value": getattr(self, "_AlgorithmManager__initial_value", None),
+            "initial_cost": self.__initial_cost,
+            "cost": self.__cost,
+            "year": self.__year,
+            "month": self.__month,
+            "plot_every_n_days_i": self.__plot_every_n_days_i,
+        }
+
+    def SaveSnapshot(self):
+        data = Snapshot.Dump(self.Time, self.__algorithms, Singleton.Broker, self._snapshot_metrics())
+        self.ObjectStore.SaveBytes(self._snapshot_key, bytearray(data))
+        Singleton.Debug(f"Saved snapshot {self._snapshot_key} ({len(data)} bytes)")
+
+    def RestoreRollingWindows(self):
+        """Refill rolling windows from the snapshot and only warm up the days since it was taken."""
+        if not self._snapshot_key or not self.ObjectStore.ContainsKey(self._snapshot_key):
+            return
+        data = self.ObjectStore.ReadBytes(self._snapshot_key)
+        time, restored = Snapshot.LoadRollingWindows(data, self.__algorithms)
+
+        gap = (self.Time - time).days + 1
+        for i in restored:
+            i.WarmUpPeriod = min(self._warm_up_period(i), gap)
+        Singleton.ShortenWarmUp(max([self._warm_up_period(i) for i in self.__algorithms]))
+        self.Log(f"Restored rolling windows from {time}, warming up {Singleton._warm_up} days")
+
+    def RestoreSnapshot(self, unmanaged=False):
+        if not self._snapshot_key or not self.ObjectStore.ContainsKey(self._snapshot_key):
+            return None
+        data = self.ObjectStore.ReadBytes(self._snapshot_key)
+        snapshot = Snapshot.Load(data, self.__algorithms, Singleton.Broker, unmanaged=unmanaged)
+
+        metrics = snapshot.Metrics
+        self.__initial_cost = metrics.get("initial_cost", self.__initial_cost)
+        self.__plot_every_n_days_i = int(metrics.get("plot_every_n_days_i", 0))
+        if "year" in metrics:
+            self.__year = int(metrics["year"])
+        if "month" in metrics:
+            self.__month = int(metrics["month"])
+        self.Log(f"Restored snapshot {self._snapshot_key} from {snapshot.Time}")
+        return snapshot
+
+    def SetSelectionWorkers(self, workers):
+        """Run the algorithms' selection functions in a pool of this many threads."""
+        self._selection_workers = workers
+
     def CoarseSelectionFunction(self, coarse):
-        symbols = []
-        for i in self.__algorithms:
-            symbols.extend(i.CoarseSelectionFunction(coarse))
-        return symbols
+        Singleton.InvalidateStep()
+        return select(self.__coarse_algorithms, "CoarseSelectionFunction", CoarseUniverse(coarse),
+                      workers=self._selection_workers)
 
     def FineSelectionFunction(self, fine):
-        symbols = []
-        for i in self.__algorithms:
-            symbols.extend(i.FineSelectionFunction(fine))
-        return symbols
+        Singleton.InvalidateStep()
+        return select(self.__fine_algorithms, "FineSelectionFunction", FineUniverse(fine),
+                      workers=self._selection_workers)
 
     def OnWarmupFinished(self):
+        Singleton.InvalidateStep()
         Singleton.Debug("OnWarmupFinished")
 
+        restored = None
         if self.LiveMode:
             Singleton.Broker.ImportFromBroker()
 
             self.__initial_value = Singleton.Portfolio.TotalPortfolioValue
             self.Log(f"setting initial value to {self.__initial_value}")
 
+            # Resume each algorithm's positions instead of re-allocating cash.
+            restored = self.RestoreSnapshot()
+
         self.__cost = 0.0
+        unmanaged = Singleton.Broker.Portfolio
         for i in self.__algorithms:
+            i.Portfolio.SetAccountCurrency(unmanaged.AccountCurrency)
             # TypeError : unsupported operand type(s) for -=: 'Cash' and 'CashAmount'
-            Singleton.Broker.Portfolio.Cash -= i.Portfolio.Cash
+            unmanaged.Cash -= i.Portfolio.Cash
+            unmanaged.CashBook[unmanaged.CashBook.AccountCurrency] = unmanaged.Cash
             for symbol, position in i.Portfolio.items():
                 Singleton.Broker.Portfolio[symbol].Quantity -= position.Quantity
 
-            cost = i.Allocation * self.__initial_value
-            i.Portfolio.SetCash(cost)
+            if restored is None:
+                cost = i.Allocation * self.__initial_value
+                i.Portfolio.SetCash(cost)
             self.__cost += i.Portfolio.TotalPortfolioValue
 
-        self.__initial_cost = self.__cost
+        if restored is None:
+            self.__initial_cost = self.__cost
 
+        self.__rebuild_reconciler()
+        self.__rebuild_risk()
         for i in self.__algorithms:
             i.OnWarmupFinished()
 
+    @classmethod
+    def _warm_up_period(cls, algorithm):
+        # algorithms that never asked for a warm-up follow the global one
+        if algorithm.WarmUpPeriod is None:
+            return Singleton._warm_up or 0
+        return algorithm.WarmUpPeriod
+
+    def _warm_up_days_remaining(self):
+        return (self.StartDate - self.Time).total_seconds() / 86400.0
+
+    @post
     def OnData(self, data):
-        Singleton.Debug("OnData")
-        for i in self.__algorithms:
-            i.OnData(data)
+        Singleton.InvalidateStep()
+        if Singleton.ConversionRates is not None:
+            Singleton.ConversionRates.Update()
+        if Singleton.Journal is not None:
+            Singleton.Journal.RecordPrices(data.Bars)
+        if self.IsWarmingUp:
+            self._on_data_warming_up(data)
+            return
+
+        for on_data in self.__on_data:
+            on_data(data)
+        if Singleton.Execution is not None and Singleton.Execution.StepOnData:
+            Singleton.Execution.Step()
+
+    def __post(self):
+        """Execute the orders every algorithm queued during this step in one batch."""
+        broker = Singleton.Broker
+        if not broker.Pending and not broker.Held:
+            return
+        orders = broker.TakePendingOrders()
+        # LEAN does not send orders during the warm-up, so neither do we, later;
+        # held buys also expire here
+        if not self.IsWarmingUp:
+            broker.ExecuteOrders(orders)
+
+    def _on_data_warming_up(self, data):
+        # Only feed algorithms once the remaining warm-up fits in their own period.
+        remaining = self._warm_up_days_remaining()
+        for i in self.__on_data_algorithms:
+            if remaining <= self._warm_up_period(i):
+                i.OnData(data)
 
     def OnDividend(self):
+        Singleton.InvalidateStep()
         Singleton.Debug("OnDividend")
         for i in self.__algorithms:
             i.OnDividend()
 
     def OnSecuritiesChanged(self, changes):
+        Singleton.InvalidateStep()
         Singleton.Debug(f"OnSecuritiesChanged {changes}")
+        for security in list(changes.AddedSecurities) + list(changes.RemovedSecurities):
+            Singleton.SecurityCache.pop(security.Symbol, None)
         for i in self.__algorithms:
             # Only call if there's a relevant stock in i
             i.OnSecuritiesChanged(changes)
 
+        for security in changes.RemovedSecurities:
+            for i in self.__algorithms:
+                i.RemoveRollingWindows(security.Symbol)
+
     def OnEndOfDay(self):
+        Singleton.InvalidateStep()
         Singleton.Debug("OnEndOfDay: {}".format(Singleton.Time))
         for i in self.__algorithms:
             i.OnEndOfDay()
@@ -199,24 +369,49 @@ class AlgorithmManager(QCAlgorithm):
 
         self.__plot_every_n_days_i += 1
 
-        if self.__email_address:
-            for i in self.__algorithms:
-                if i.Email.HasContent:
-                    i.Email.Send(f"{i.Name} (OnEndOfDay)")
+        if self.__digest:
+            self.__digest.Send(f"Daily digest {self.Time.date()}", self.__email_sections())
+
+        if self._snapshot_key and not self.IsWarmingUp:
+            self.SaveSnapshot()
+
+        if Singleton.Latency is not None:
+            Singleton.Latency.Export()
+
+        if Singleton.Reconciler is not None:
+            Singleton.Reconciler.Reconcile()
+        self.__rebuild_risk()
+
+        if Singleton.Journal is not None:
+            Singleton.Journal.Flush()
+
+    def __email_sections(self):
+        return [(i.Name, i.Email) for i in self.__algorithms]
 
     def GetTotalPortfolioValue(self):
         return sum([i.Portfolio.TotalPortfolioValue for i in self.__algorithms])
 
     def OnEndOfAlgorithm(self):
+        Singleton.InvalidateStep()
         for i in self.__algorithms:
             i.OnEndOfAlgorithm()
             i.Log(f"Total Orders: {i.TotalOrders}")
             i.Log(f"Performance: {i.Performance}")
             i.Log(f"Value: {i.Portfolio.TotalPortfolioValue}")
 
-        if self.__email_address:
+        if Singleton.Ledger is not None:
+            summary = Singleton.Ledger.Summary()
             for i in self.__algorithms:
-                i.Email.Send(f"{i.Name} (Stopped)")
+                if i.Name in summary:
+                    i.Log(f"Trades: {summary[i.Name]}")
+
+        if self.__digest:
+            for i in self.__algorithms:
+                i.Email.AppendText("Algorithm stopped")
+            self.__digest.Send("Stopped", self.__email_sections(), force=True)
+
+        if Singleton.Journal is not None:
+            Singleton.Journal.Flush()
 
     def readjust_allocation(self):
         # total_value = self.GetTotalPortfolioValue()
@@ -226,10 +421,13 @@ class AlgorithmManager(QCAlgorithm):
             i.Allocation = math.floor(allocation * 100) / 100
 
     def OnBrokerageReconnect(self):
-        __sync_cashbook()
+        Singleton.InvalidateStep()
+        if Singleton.Reconciler is not None:
+            Singleton.Reconciler.Reconcile()
 
     @accepts(self=object, order_event=OrderEvent)
     def OnOrderEvent(self, order_event):
+        Singleton.InvalidateStep()
         Singleton.Debug(f"> OnOrderEvent: {order_event}")
         Singleton.Broker.HandleOrderEvent(order_event)
 
@@ -237,15 +435,26 @@ class SimpleAlgorithm(object):
     def __init__(self, name="anonymous", allocation=None, initialize=True):
         self.Name = name
         self.Allocation = allocation
+        self.WarmUpPeriod = None
         if initialize:
             self.Initialize()
 
     def __getattr__(self, attr):
         """Delegate to parent."""
-        if hasattr(Singleton, attr):
-            return getattr(Singleton, attr)
-        else:
-            raise AttributeError(attr)
+        return getattr(Singleton, attr)
+
+    # read on every bar; properties skip the failed lookup that precedes __getattr__
+    @property
+    def Time(self):
+        return Singleton.Time
+
+    @property
+    def Securities(self):
+        return Singleton.Securities
+
+    @property
+    def Transactions(self):
+        return Singleton.Transactions
 
     @property
     def Performance(self):
@@ -260,12 +469,15 @@ class SimpleAlgorithm(object):
     def OnEndOfDay(self): pass
     def OnEndOfAlgorithm(self): pass
     def OnSecuritiesChanged(self, changes): pass
+    def RemoveRollingWindows(self, symbol): pass
     def OnOrderEvent(self, order_event): pass
     def Initialize(self): self.Debug("Initialize call ignored")
     def SetCash(self, cash): self.Debug("SetCash call ignored")
     def SetStartDate(self, year, month, day): self.Debug("SetStartDate call ignored")
     def SetEndDate(self, year, month, day): self.Debug("SetEndDate call ignored")
-    def SetWarmUp(self, period, resolution=Resolution.Daily): Singleton.SetWarmUpFromAlgorithm(period)
+    def SetWarmUp(self, period, resolution=Resolution.Daily):
+        self.WarmUpPeriod = Singleton._convert_period_to_int(period)
+        Singleton.SetWarmUpFromAlgorithm(period)
     def Log(self, message): Singleton.Log("[%s] %s" % (self.Name, message))
     def Debug(self, message): Singleton.Debug("[%s] %s" % (self.Name, message))
     def Error(self, message): Singleton.Error("[%s] %s" % (self.Name, message))
@@ -275,14 +487,15 @@ class Algorithm(SimpleAlgorithm):
         super().__init__(name=name, allocation=allocation, initialize=False)
         self.Options = options
         self.Portfolio = Portfolio(algorithm=self)
+        self.Portfolio.MaxFeeRatio = options.get("max_fee_ratio")
+        self.Portfolio.CostBasis = options.get("cost_basis")
         self.Schedule = ScheduleWrapperManager(self)
         self.Email = Email()
         self.TotalOrders = 0
+        self.RollingWindows = []
+        self._window_subscriptions = {}
         self.Initialize()
 
-    def post(self):
-        self.Portfolio.ExecuteOrders()
-
     def __str__(self):
         return "[%s] %s" % (self.Name, str(self.Portfolio))
 
@@ -389,37 +602,83 @@ class Algorithm(SimpleAlgorithm):
             qty -= qty % lot_size
 
         # Calculate total unfilled quantity for open market orders
-        order_ids = self.Broker.GetOrderIdsForPortfolio(self.Portfolio)
-        open_orders = [Singleton.Transactions.GetOrderById(order_id) for order_id in order_ids]
-        market_orders_quantity = sum([order.Quantity for order in open_orders
-                                      if order.Symbol == symbol and order.Type in (OrderType.Market, OrderType.MarketOnOpen)])
-
-        qty -= market_orders_quantity
+        qty -= self.Broker.OpenQuantity(self.Portfolio, symbol)
+        qty -= self.Broker.HeldQuantity(self.Portfolio, symbol)
+        if Singleton.Execution is not None:
+            qty -= Singleton.Execution.Outstanding(self.Portfolio, symbol)
 
         return InternalOrder(portfolio=self.Portfolio, symbol=symbol, quantity=qty, tag=tag)
 
     ######################################################################
-    def CreateRollingWindow(self, symbol, window_size):
+    def CreateRollingWindow(self, symbol, window_size, period=timedelta(1)):
         rolling_window = RollingWindow[TradeBar](window_size)
-        consolidator = TradeBarConsolidator(timedelta(1))
-        consolidator.DataConsolidated += lambda _, bar: rolling_window.Add(bar)
-        self.SubscriptionManager.AddConsolidator(symbol, consolidator)
+        handler = lambda bar: self._add_bar(rolling_window, bar)
+        ConsolidatorRegistry.Instance().Subscribe(symbol, period, handler)
+        self.RollingWindows.append((symbol, rolling_window))
+        self._window_subscriptions[id(rolling_window)] = (period, handler)
         return rolling_window
 
+    def RemoveRollingWindows(self, symbol):
+        """Stop feeding the rolling windows of symbol, e.g. once it left the universe."""
+        registry = ConsolidatorRegistry.Instance()
+        for window_symbol, rolling_window in self.RollingWindows:
+            if window_symbol == symbol:
+                period, handler = self._window_subscriptions.pop(id(rolling_window))
+                registry.Unsubscribe(symbol, period, handler)
+        self.RollingWindows = [(s, w) for s, w in self.RollingWindows if s != symbol]
+
+    @classmethod
+    def _add_bar(cls, rolling_window, bar):
+        # Skip bars replayed by a warm-up that a restored window already holds.
+        if rolling_window.Count > 0 and bar.EndTime <= rolling_window[0].EndTime:
+            return
+        rolling_window.Add(bar)
+
 class ScheduleWrapperManager(object):
     def __init__(self, algorithm):
         self._algorithm = algorithm
-        self._func = None
+        self._funcs = []
 
     def On(self, date_rules, time_rules, func):
-        self._func = ScheduleWrapper(func, self._algorithm.post)
-        Singleton.Schedule.On(date_rules, time_rules, self._func.run)
+        self._funcs.append(func)
+        ScheduleWrapper.For(date_rules, time_rules).Add(self._algorithm, func)
 
 class ScheduleWrapper(object):
-    def __init__(self, func, post):
-        self._func = func
-        self._post = post
+    '''One LEAN scheduled event for all callbacks with identical date and time rules.'''
+
+    def __init__(self):
+        self._callbacks = []
+
+    @classmethod
+    def _rule_key(cls, rule):
+        # rules without a Name only coalesce with the same rule object
+        return getattr(rule, "Name", None) or rule
+
+    @classmethod
+    def For(cls, date_rules, time_rules):
+        key = (cls._rule_key(date_rules), cls._rule_key(time_rules))
+        wrapper = Singleton._schedules.get(key)
+        if wrapper is None:
+            wrapper = cls()
+            Singleton._schedules[key] = wrapper
+            Singleton.Schedule.On(date_rules, time_rules, wrapper.run)
+        return wrapper
+
+    def Add(self, algorithm, func):
+        self._callbacks.append((algorithm, func))
 
     def run(self):
-        self._func()
-        self._post()
+        Singleton.InvalidateStep()
+        algorithms = []
+        for algorithm, func in self._callbacks:
+            func()
+            if algorithm not in algorithms:
+                algorithms.append(algorithm)
+
+        # one execution pass over the orders of every algorithm that ran
+        orders = []
+        for algorithm in algorithms:
+            orders.extend(algorithm.Portfolio.TakeOrders())
+        # orders queued during the warm-up are dropped, as in OnData
+        if not Singleton.IsWarmingUp:
+            Singleton.Broker.ExecuteOrders(orders)
@@ -0,0 +1,50 @@
+# pylint: disable=C0111,C0103
+import itertools
+import timeit
+
+BENCHMARKS = []
+
+
+def benchmark(name, **params):
+    """Register a factory that sets up state and returns the callable to time.
+
+    Keyword arguments are lists of values; the factory runs once per combination.
+    """
+    def register(factory):
+        keys = sorted(params)
+        for values in itertools.product(*[params[key] for key in keys]):
+            kwargs = dict(zip(keys, values))
+            suffix = ",".join(f"{key}={value}" for key, value in kwargs.items())
+            BENCHMARKS.append((f"{name}[{suffix}]" if suffix else name, factory, kwargs))
+        return factory
+    return register
+
+
+def run(name_filter=None, repeat=5, min_time=0.2):
+    results = {}
+    for name, factory, kwargs in BENCHMARKS:
+        if name_filter and name_filter not in name:
+            continue
+        timer = timeit.Timer(factory(**kwargs))
+        number = 1
+        while timer.timeit(number) < min_time and number < 1_000_000:
+            number *= 10
+        times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+        results[name] = {
+            "min": min(times),
+            "median": sorted(times)[len(times) // 2],
+            "number": number,
+            "repeat": repeat,
+        }
+    return results
+
+
+def compare(baseline, results, threshold=1.10):
+    """Yield (name, baseline, current, ratio, regressed) for benchmarks present in both."""
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["min"]
+        after = result["min"]
+        ratio = after / before if before else float("inf")
+        yield name, before, after, ratio, ratio > threshold
@@ -0,0 +1,65 @@
+# pylint: disable=C0111,C0103
+"""Run with `python -m benchmark [--json out.json] [--compare baseline.json]`."""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+from benchmark import run, compare
+import benchmark.bench_market  # pylint: disable=W0611
+import benchmark.bench_algorithm  # pylint: disable=W0611
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="compare against a previous --json file")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=1.10,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(name_filter=args.filter, repeat=args.repeat)
+    for name, result in results.items():
+        print(f"{name:<55} {format_time(result['min']):>12}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print(f"\nCompared to {baseline.get('revision')}:")
+        for name, before, after, ratio, regressed in compare(baseline["results"], results, args.threshold):
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:<55} {format_time(before):>12} -> {format_time(after):>12} ({ratio:.2f}x){flag}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# pylint: disable=C0111,C0103,W0212
+from mocked import LocalEngine, Slice, CoarseFundamental
+from market import Portfolio, Broker
+from algorithm import Algorithm
+from singleton import Singleton
+from benchmark import benchmark
+from benchmark.common import QuietManager, setup, make_symbols, random_walk_bars
+from synthetic import SyntheticMarket, UniverseRamp, IlliquidLots
+
+
+class RotationAlgorithm(Algorithm):
+    def Initialize(self):
+        self.Day = 0
+
+    def OnData(self, args):
+        symbols = list(args.Bars.keys())
+        self.SetHoldings(symbols[self.Day % len(symbols)], 0.1)
+        self.Day += 1
+
+
+class LiquidityAlgorithm(Algorithm):
+    def CoarseSelectionFunction(self, coarse):
+        return coarse.Top(coarse.DollarVolume, 50, mask=coarse.HasFundamentalData & (coarse.Price > 5.0))
+
+
+class ListeningAlgorithm(Algorithm):
+    def OnData(self, args): pass
+
+
+def register(qc, algorithms):
+    qc.registerAlgorithms(algorithms, plot_orders=False, plot_value=False, plot_allocation=False)
+
+
+@benchmark("Algorithm.SetHoldings", algorithms=[1, 10, 50])
+def set_holdings(algorithms):
+    symbol, = make_symbols(1)
+    qc = setup([symbol])
+    instances = [Algorithm(name=f"alg{i}") for i in range(algorithms)]
+    register(qc, instances)
+
+    def op():
+        for i in instances:
+            i.SetHoldings(symbol, 0.5)
+            i.Portfolio.ExecuteOrders()
+        Singleton.Broker._submitted.clear()
+        qc.Transactions.clear()
+    return op
+
+
+@benchmark("SimpleAlgorithm.__getattr__", attribute=["Time", "Securities", "LiveMode"])
+def delegated_attribute(attribute):
+    symbols = make_symbols(1)
+    qc = setup(symbols)
+    algorithm = Algorithm(name="alg")
+    register(qc, [algorithm])
+    return lambda: getattr(algorithm, attribute)
+
+
+@benchmark("AlgorithmManager.CoarseSelectionFunction", algorithms=[5], symbols=[8000])
+def coarse_selection(algorithms, symbols):
+    qc = setup([])
+    register(qc, [LiquidityAlgorithm(name=f"alg{i}") for i in range(algorithms)])
+    coarse = [CoarseFundamental(symbol, 1.0 + i % 100, 1000.0 * (i % 37), i % 3 != 0)
+              for i, symbol in enumerate(make_symbols(symbols))]
+    return lambda: qc.CoarseSelectionFunction(coarse)
+
+
+@benchmark("AlgorithmManager.OnData", algorithms=[10], overriding=[0, 10])
+def on_data(algorithms, overriding):
+    symbols = make_symbols(10)
+    qc = setup(symbols)
+    register(qc, [ListeningAlgorithm(name=f"alg{i}") if i < overriding else Algorithm(name=f"alg{i}")
+                  for i in range(algorithms)])
+    data = Slice(random_walk_bars(symbols, 1)[0][1])
+    return lambda: qc.OnData(data)
+
+
+@benchmark("AlgorithmManager.Run[year]", algorithms=[1, 5], symbols=[10])
+def full_year(algorithms, symbols):
+    symbol_list = make_symbols(symbols)
+    steps = random_walk_bars(symbol_list, 365)
+
+    def op():
+        qc = setup(symbol_list)
+        register(qc, [RotationAlgorithm(name=f"alg{i}") for i in range(algorithms)])
+        LocalEngine(qc).Run(steps)
+    return op
+
+
+@benchmark("AlgorithmManager.Run[synthetic]", symbols=[100, 1000, 5000])
+def synthetic_universe(symbols):
+    data = SyntheticMarket(symbols=symbols, days=20, scenarios=[UniverseRamp(0.5, 1.0), IlliquidLots(0.2)]).Generate()
+    steps = list(data.Steps())
+
+    def op():
+        qc = QuietManager()
+        qc.Securities = data.SecurityManager()
+        qc.Portfolio = Portfolio(cash=1_000_000.0)
+        Singleton.Setup(qc, broker=Broker(), log_level=Singleton.ERROR)
+        register(qc, [RotationAlgorithm(name=f"alg{i}") for i in range(3)])
+        LocalEngine(qc).Run(steps)
+    return op
@@ -0,0 +1,110 @@
+# pylint: disable=C0111,C0103,W0212
+from mocked import OrderBookSimulator, OrderEvent, OrderStatus, OrderType, TradeBar
+from market import Portfolio, Position, InternalOrder
+from journal import Journal, Replay
+from singleton import Singleton
+from benchmark import benchmark
+from benchmark.common import setup, make_symbols
+
+
+@benchmark("Portfolio._fill_order")
+def fill_order():
+    symbol, = make_symbols(1)
+    setup([symbol])
+    portfolio = Portfolio(cash=1_000_000.0)
+
+    def op():
+        portfolio._fill_order(symbol, 1.0, 10.0)
+        portfolio._fill_order(symbol, -1.0, 10.0)
+    return op
+
+
+@benchmark("Portfolio.TotalPortfolioValue", positions=[10, 100, 1000])
+def total_portfolio_value(positions):
+    symbols = make_symbols(positions)
+    setup(symbols)
+    portfolio = Portfolio(cash=1_000_000.0)
+    for symbol in symbols:
+        portfolio[symbol] = Position(symbol, 10, 10.0)
+    return lambda: portfolio.TotalPortfolioValue
+
+
+@benchmark("Broker.ExecuteOrder", matching=["internal", "external"])
+def execute_order(matching):
+    symbol, = make_symbols(1)
+    qc = setup([symbol])
+    broker = Singleton.Broker
+    if matching == "internal":
+        broker.Portfolio[symbol] = Position(symbol, 1e12, 10.0)
+    portfolio = Portfolio(cash=1_000_000.0)
+
+    def op():
+        broker.ExecuteOrder(InternalOrder(portfolio, symbol, 1))
+        broker._submitted.clear()
+        qc.Transactions.clear()
+    return op
+
+
+@benchmark("Broker.HandleOrderEvent", open_orders=[10, 1000, 10000])
+def handle_order_event(open_orders):
+    symbol, = make_symbols(1)
+    qc = setup([symbol])
+    broker = Singleton.Broker
+    portfolio = Portfolio(cash=1_000_000.0)
+    for _ in range(open_orders):
+        order = InternalOrder(portfolio, symbol, 1)
+        order.Ticket = qc.MarketOrder(symbol, 1.0, False, "")
+        broker._submitted[order.Ticket.OrderId] = order
+    order_id = order.Ticket.OrderId
+    event = OrderEvent(order_id, symbol, 1.0, 10.0, status=OrderStatus.Filled)
+
+    def op():
+        broker.HandleOrderEvent(event)
+        broker._submitted[order_id] = order
+    return op
+
+
+@benchmark("OrderBookSimulator.OnBar", working_orders=[100, 10000])
+def order_book(working_orders):
+    """One marketable limit order matched and handled by the broker, behind many resting ones."""
+    symbol, = make_symbols(1)
+    qc = setup([symbol])
+    qc.OrderBook = OrderBookSimulator(qc, participation=1.0)
+    broker = Singleton.Broker
+    portfolio = Portfolio(cash=1e12)
+    for i in range(working_orders):
+        broker._execute_order(InternalOrder(portfolio, symbol, 1, order_type=OrderType.Limit,
+                                            limit_price=5.0 - i * 1e-4))
+    bar = TradeBar(qc.Time, symbol, 10.0, 10.0, 9.0, 10.0, 1e6)
+
+    def op():
+        broker._execute_order(InternalOrder(portfolio, symbol, 1, order_type=OrderType.Limit, limit_price=9.5))
+        qc.OrderBook.OnBar(symbol, bar)
+    return op
+
+
+@benchmark("Replay.Run", orders=[1000])
+def replay(orders):
+    """Throughput on a journal of alternating price updates, orders and fills."""
+    symbols = make_symbols(10)
+    qc = setup(symbols)
+    journal = Journal()
+    Singleton.Journal = journal
+    broker = Singleton.Broker
+    portfolio = Portfolio(cash=1_000_000.0)
+    for i in range(orders):
+        price = 10.0 + i % 7
+        journal.RecordPrices({symbol: TradeBar(qc.Time, symbol, price, price, price, price, 0)
+                              for symbol in symbols})
+        symbol = symbols[i % len(symbols)]
+        quantity = -1.0 if (i // len(symbols)) % 4 == 3 else 1.0
+        broker._execute_order(InternalOrder(portfolio, symbol, quantity))
+        order_id = max(broker._submitted)
+        broker.HandleOrderEvent(OrderEvent(order_id, symbol, quantity, price, status=OrderStatus.Filled))
+    data = journal.Value()
+
+    def op():
+        setup(symbols)
+        Replay(data).Run([])
+    return op
+
@@ -0,0 +1,44 @@
+# pylint: disable=C0111,C0103
+import random
+from datetime import datetime, timedelta
+
+from mocked import Symbol, InternalSecurityManager, TradeBar
+from market import Portfolio, Broker
+from algorithm import AlgorithmManager
+from singleton import Singleton
+
+
+class QuietManager(AlgorithmManager):
+    def Log(self, message): pass
+    def Debug(self, message): pass
+    def Error(self, message): pass
+
+
+def make_symbols(count):
+    return [Symbol(f"S{i:05d}") for i in range(count)]
+
+
+def setup(symbols, price=10.0, cash=1_000_000.0):
+    qc = QuietManager()
+    qc.Securities = InternalSecurityManager([(symbol, price) for symbol in symbols])
+    qc.Portfolio = Portfolio(cash=cash)
+    qc.Time = datetime(2019, 1, 1)
+    Singleton.Setup(qc, broker=Broker(), log_level=Singleton.ERROR)
+    return qc
+
+
+def random_walk_bars(symbols, days, start=datetime(2019, 1, 1), seed=42):
+    """[(time, {symbol: TradeBar})] of daily bars."""
+    rng = random.Random(seed)
+    prices = {symbol: 10.0 for symbol in symbols}
+    steps = []
+    for day in range(days):
+        time = start + timedelta(day)
+        bars = {}
+        for symbol in symbols:
+            open_ = prices[symbol]
+            close = open_ * (1.0 + rng.gauss(0.0, 0.02))
+            prices[symbol] = close
+            bars[symbol] = TradeBar(time, symbol, open_, max(open_, close), min(open_, close), close, 1000.0)
+        steps.append((time, bars))
+    return steps
@@ -0,0 +1,59 @@
+# pylint: disable=C0321,W0401,W0614
+try: QCAlgorithm
+except NameError: from mocked import *
+
+from singleton import Singleton
+
+# pylint: disable=C0111,C0103,R0903
+
+
+class SharedConsolidator(object):
+    def __init__(self, symbol, period):
+        self.Symbol = symbol
+        self.Period = period
+        self.Consolidator = TradeBarConsolidator(period)
+        self.Handlers = []
+        self.Consolidator.DataConsolidated += self.OnDataConsolidated
+
+    def OnDataConsolidated(self, _sender, bar):
+        for handler in self.Handlers:
+            handler(bar)
+
+
+class ConsolidatorRegistry(object):
+    '''One consolidator per (symbol, period), shared by every subscriber and removed with the last one.'''
+
+    def __init__(self, subscription_manager):
+        self.SubscriptionManager = subscription_manager
+        self.__consolidators = {}
+
+    @classmethod
+    def Instance(cls):
+        """Registry of the current QCAlgorithm, created on first use."""
+        registry = Singleton.Consolidators
+        if registry is None:
+            # Singleton.Setup drops it; pythonnet wraps SubscriptionManager anew on every access
+            registry = Singleton.Consolidators = cls(Singleton.QCAlgorithm.SubscriptionManager)
+        return registry
+
+    def __len__(self):
+        return len(self.__consolidators)
+
+    def Subscribe(self, symbol, period, handler):
+        """Call handler(bar) with every consolidated bar of symbol."""
+        shared = self.__consolidators.get((symbol, period))
+        if shared is None:
+            shared = SharedConsolidator(symbol, period)
+            self.SubscriptionManager.AddConsolidator(symbol, shared.Consolidator)
+            self.__consolidators[(symbol, period)] = shared
+        shared.Handlers.append(handler)
+        return shared
+
+    def Unsubscribe(self, symbol, period, handler):
+        shared = self.__consolidators.get((symbol, period))
+        if shared is None or handler not in shared.Handlers:
+            return
+        shared.Handlers.remove(handler)
+        if not shared.Handlers:
+            self.SubscriptionManager.RemoveConsolidator(symbol, shared.Consolidator)
+            del self.__consolidators[(symbol, period)]
@@ -0,0 +1,151 @@
+# pylint: disable=C0321,W0401,W0614
+try: QCAlgorithm
+except NameError: from mocked import *
+
+import math
+from market import InternalOrder
+from singleton import Singleton
+
+# pylint: disable=C0111,C0103,R0903,R0913
+
+TWAP = "twap"
+VWAP = "vwap"
+
+
+class SlicedOrder(object):
+    '''A parent InternalOrder sent to the market as one child order per step.'''
+
+    def __init__(self, order, weights, interval=None, limit_offset=None):
+        self.Order = order
+        self.Quantity = order.Quantity
+        self.Unsent = order.Quantity
+        self.Filled = 0.0
+        self.Weights = weights
+        self.Interval = interval
+        self.LimitOffset = limit_offset
+        self.Child = None
+        self.NextAt = None
+        self.Slice = 0
+        self.__canceling = False
+
+    @property
+    def Outstanding(self):
+        """Unsent quantity plus what an open limit child has not filled; open market orders are counted elsewhere."""
+        child = self.Child
+        if child is None or child.OrderType in (OrderType.Market, OrderType.MarketOnOpen):
+            return self.Unsent
+        return self.Unsent + child.Quantity - child.Filled
+
+    @property
+    def Done(self):
+        return self.Child is None and math.isclose(self.Unsent, 0.0, abs_tol=1e-9)
+
+    def _lot(self, quantity):
+        lot_size = Singleton.Securities[self.Order.Symbol].SymbolProperties.LotSize
+        if lot_size <= 0:
+            return quantity
+        return math.copysign(math.floor(abs(quantity) / lot_size + 1e-9) * lot_size, quantity)
+
+    def _next_quantity(self):
+        if self.Slice >= len(self.Weights) - 1:
+            return self.Unsent
+        quantity = self._lot(self.Quantity * self.Weights[self.Slice])
+        return quantity if abs(quantity) < abs(self.Unsent) else self.Unsent
+
+    def _cancel_child(self):
+        """Ask LEAN once to cancel the open limit child; market children are left to fill."""
+        child = self.Child
+        if self.__canceling or child.OrderType in (OrderType.Market, OrderType.MarketOnOpen):
+            return
+        child.Ticket.Cancel("Replaced by next slice")
+        self.__canceling = True
+
+    def _child_done(self, child):
+        """Called by Broker once the child is filled or canceled; what it did not fill goes back to Unsent."""
+        if child is not self.Child:
+            return
+        self.Unsent += child.Quantity - child.Filled
+        self.Child = None
+        self.__canceling = False
+
+    def Step(self, broker):
+        """Send the next child order if due; returns the child or None."""
+        time = Singleton.QCAlgorithm.Time
+        if self.NextAt is not None and time < self.NextAt:
+            return None
+        if self.Child is not None:
+            # the child stays with the broker until LEAN reports it filled or canceled
+            self._cancel_child()
+            return None
+        if self.Done:
+            return None
+
+        quantity = self._next_quantity()
+        last = self.Slice >= len(self.Weights) - 1
+        self.Slice += 1
+        if quantity == 0:
+            return None
+
+        parent = self.Order
+        price = Singleton.QCAlgorithm.Securities[parent.Symbol].Price
+        if self.LimitOffset is None or last:
+            child = InternalOrder(parent.Portfolio, parent.Symbol, quantity, tag=parent.tag)
+        else:
+            limit_price = price * (1.0 + math.copysign(self.LimitOffset, quantity))
+            child = InternalOrder(parent.Portfolio, parent.Symbol, quantity, order_type=OrderType.Limit,
+                                  limit_price=limit_price, tag=parent.tag)
+        child.Parent = self
+        child.Allocations = parent.Allocations
+        child.QueuedAt = parent.QueuedAt
+        self.Child = child
+        self.Unsent -= quantity
+        if self.Interval is not None:
+            self.NextAt = time + self.Interval
+        broker._execute_order(child)
+        return child
+
+
+class ExecutionEngine(object):
+    '''Splits large orders into TWAP or VWAP child orders, driven by OnData or a scheduled Step.
+
+    Orders worth at least min_notional are sliced; volume_profile gives the share of each slice
+    for VWAP, e.g. the historical volume of each interval of the day.
+    '''
+
+    def __init__(self, min_notional, slices=10, style=TWAP, interval=None, limit_offset=None,
+                 volume_profile=None, on_data=True):
+        if style == VWAP and not volume_profile:
+            raise ValueError("VWAP needs a volume_profile")
+        self.MinNotional = min_notional
+        self.Style = style
+        self.Interval = interval
+        self.LimitOffset = limit_offset
+        self.StepOnData = on_data
+        profile = volume_profile if style == VWAP else [1.0] * slices
+        total = float(sum(profile))
+        self.Weights = [volume / total for volume in profile]
+        self.Active = []
+
+    def Accept(self, order):
+        """Take over order if it is large enough to slice; the first child is sent at once."""
+        price = Singleton.QCAlgorithm.Securities[order.Symbol].Price
+        if abs(order.Quantity * price) < self.MinNotional:
+            return False
+        sliced = SlicedOrder(order, self.Weights, interval=self.Interval, limit_offset=self.LimitOffset)
+        self.Active.append(sliced)
+        sliced.Step(Singleton.Broker)
+        return True
+
+    def Unsent(self, portfolio, symbol):
+        """Quantity of portfolio's sliced orders in symbol that has not been sent yet."""
+        return sum([i.Unsent * i.Order.Share(portfolio) for i in self.Active if i.Order.Symbol == symbol])
+
+    def Outstanding(self, portfolio, symbol):
+        """Quantity of portfolio's sliced orders in symbol that is neither filled nor in an open market order."""
+        return sum([i.Outstanding * i.Order.Share(portfolio) for i in self.Active if i.Order.Symbol == symbol])
+
+    def Step(self):
+        broker = Singleton.Broker
+        for sliced in self.Active:
+            sliced.Step(broker)
+        self.Active = [i for i in self.Active if not i.Done]
@@ -1,17 +1,219 @@
-class CoinbaseFeeModel(FeeModel):
-    def __init__(self, algorithm):
-        self.algorithm = algorithm
+# pylint: disable=C0321,W0401,W0614
+try: QCAlgorithm
+except NameError: from mocked import *
+
+import bisect
+import numpy as np
+from singleton import Singleton
+
+# pylint: disable=C0111,C0103,R0903,R0913
+
+
+class FeeSchedule(object):
+    '''Maker/taker tier table indexed by 30-day volume.'''
+
+    def __init__(self, tiers, per_share=False, minimum_fee=0.0, maximum_fee_percentage=None):
+        # tiers: [(volume threshold, maker rate, taker rate), ...] in ascending order
+        self.Thresholds = [float(tier[0]) for tier in tiers]
+        self.MakerRates = [float(tier[1]) for tier in tiers]
+        self.TakerRates = [float(tier[2]) for tier in tiers]
+        self.PerShare = per_share
+        self.MinimumFee = minimum_fee
+        self.MaximumFeePercentage = maximum_fee_percentage
+
+    def Tier(self, volume):
+        return max(bisect.bisect_right(self.Thresholds, volume) - 1, 0)
+
+    def Rate(self, volume, is_maker):
+        tier = self.Tier(volume)
+        return self.MakerRates[tier] if is_maker else self.TakerRates[tier]
+
+    def Volume(self, quantity, unit_price):
+        """Amount a fill adds to the rolling volume (shares or notional)."""
+        return abs(quantity) if self.PerShare else abs(quantity) * unit_price
+
+    def Fee(self, quantity, unit_price, rate):
+        if quantity == 0:
+            return 0.0
+        value = abs(quantity) * unit_price
+        if not self.PerShare:
+            return value * rate
+
+        fee = max(abs(quantity) * rate, self.MinimumFee)
+        if self.MaximumFeePercentage is not None:
+            fee = min(fee, value * self.MaximumFeePercentage)
+        return fee
+
+    def Fees(self, quantities, unit_prices, rates):
+        """Vectorized Fee() over NumPy arrays."""
+        quantities = np.abs(quantities)
+        values = quantities * unit_prices
+        if not self.PerShare:
+            return values * rates
+
+        fees = np.maximum(quantities * rates, self.MinimumFee)
+        if self.MaximumFeePercentage is not None:
+            fees = np.minimum(fees, values * self.MaximumFeePercentage)
+        return np.where(quantities > 0, fees, 0.0)
+
+
+# Coinbase Pro (GDAX), 30-day USD volume.
+GDAX_FEE_SCHEDULE = FeeSchedule([
+    (0, 0.0050, 0.0050),
+    (10_000, 0.0035, 0.0035),
+    (50_000, 0.0015, 0.0025),
+    (100_000, 0.0010, 0.0020),
+    (1_000_000, 0.0008, 0.0018),
+    (10_000_000, 0.0005, 0.0015),
+    (50_000_000, 0.0000, 0.0010),
+    (100_000_000, 0.0000, 0.0007),
+    (300_000_000, 0.0000, 0.0006),
+    (500_000_000, 0.0000, 0.0005),
+    (1_000_000_000, 0.0000, 0.0004),
+])
+
+# Interactive Brokers tiered US equities, monthly share volume, USD per share.
+INTERACTIVE_BROKERS_FEE_SCHEDULE = FeeSchedule([
+    (0, 0.0035, 0.0035),
+    (300_000, 0.0020, 0.0020),
+    (3_000_000, 0.0015, 0.0015),
+    (20_000_000, 0.0010, 0.0010),
+    (100_000_000, 0.0005, 0.0005),
+], per_share=True, minimum_fee=0.35, maximum_fee_percentage=0.01)
+
+
+class RollingVolume(object):
+    '''Traded volume over the last N days, kept in a ring of daily buckets.'''
+
+    def __init__(self, days=30):
+        self.__days = days
+        self.__buckets = [0.0] * days
+        self.__last_day = None
+        self.__total = 0.0
+
+    def __advance(self, ordinal):
+        if self.__last_day is None:
+            self.__last_day = ordinal
+            return
+        gap = ordinal - self.__last_day
+        if gap <= 0:
+            return
+        for day in range(self.__last_day + 1, self.__last_day + min(gap, self.__days) + 1):
+            index = day % self.__days
+            self.__total -= self.__buckets[index]
+            self.__buckets[index] = 0.0
+        self.__last_day = ordinal
+        # prevent float residue from pushing volume below the first tier
+        self.__total = max(self.__total, 0.0)
+
+    def Add(self, day, volume):
+        ordinal = day.toordinal()
+        self.__advance(ordinal)
+        if ordinal <= self.__last_day - self.__days:
+            return
+        self.__buckets[ordinal % self.__days] += volume
+        self.__total += volume
+
+    def Value(self, day):
+        self.__advance(day.toordinal())
+        return self.__total
+
+
+class TieredFeeModel(FeeModel):
+    '''Fee model shared by all securities of one brokerage account.'''
+
+    def __init__(self, schedule, days=30):
+        self.Schedule = schedule
+        self.Volume = RollingVolume(days)
+        self.__multipliers = {}
+
+    def _today(self):
+        return Singleton.QCAlgorithm.Time.date()
+
+    @classmethod
+    def _unit_price(cls, security, quantity):
+        price = security.AskPrice if quantity > 0 else security.BidPrice
+        # fall back to the last trade when there is no quote data
+        return (price or security.Price) * security.SymbolProperties.ContractMultiplier
 
     def GetOrderFee(self, parameters):
         order = parameters.Order
         security = parameters.Security
 
-        unitPrice = security.AskPrice if order.Direction == OrderDirection.Buy else security.BidPrice
-        unitPrice = unitPrice * security.SymbolProperties.ContractMultiplier
-
-        # currently we do not model 30-day volume, so we use the first tier
-        isMaker = order.Type == OrderType.Limit and not order.IsMarketable
-        feePercentage = 0.0050  # 0.50%
-        fee = unitPrice * order.AbsoluteQuantity * feePercentage
+        unit_price = self._unit_price(security, 1 if order.Direction == OrderDirection.Buy else -1)
+        is_maker = order.Type == OrderType.Limit and not order.IsMarketable
+        fee = self.EstimateFee(order.AbsoluteQuantity, unit_price, is_maker)
 
         return OrderFee(CashAmount(fee, security.QuoteCurrency.Symbol))
+
+    def EstimateFee(self, quantity, unit_price, is_maker=False):
+        rate = self.Schedule.Rate(self.Volume.Value(self._today()), is_maker)
+        return self.Schedule.Fee(quantity, unit_price, rate)
+
+    def EstimateOrderFee(self, symbol, quantity, order_type=OrderType.Market):
+        """Fee of a prospective order, before it is submitted."""
+        security = Singleton.QCAlgorithm.Securities[symbol]
+        unit_price = self._unit_price(security, quantity)
+        return self.EstimateFee(quantity, unit_price, order_type == OrderType.Limit)
+
+    def _multiplier(self, symbol):
+        multiplier = self.__multipliers.get(symbol)
+        if multiplier is None:
+            security = Singleton.QCAlgorithm.Securities[symbol]
+            multiplier = float(security.SymbolProperties.ContractMultiplier)
+            self.__multipliers[symbol] = multiplier
+        return multiplier
+
+    def EstimateOrderFees(self, symbols, sides, quantities, bid_prices, ask_prices, is_maker=None):
+        """Fees of a batch of prospective orders, using the same tiers as GetOrderFee."""
+        sides = np.asarray(sides, dtype=float)
+        quantities = np.asarray(quantities, dtype=float)
+        multipliers = np.fromiter((self._multiplier(symbol) for symbol in symbols),
+                                  dtype=float, count=len(sides))
+        unit_prices = np.where(sides > 0, np.asarray(ask_prices, dtype=float),
+                               np.asarray(bid_prices, dtype=float)) * multipliers
+
+        tier = self.Schedule.Tier(self.Volume.Value(self._today()))
+        if is_maker is None:
+            rates = self.Schedule.TakerRates[tier]
+        else:
+            rates = np.where(np.asarray(is_maker, dtype=bool),
+                             self.Schedule.MakerRates[tier], self.Schedule.TakerRates[tier])
+        return self.Schedule.Fees(quantities, unit_prices, rates)
+
+    def EstimateFeesForOrders(self, orders):
+        """EstimateOrderFees() for a list of InternalOrder."""
+        securities = Singleton.QCAlgorithm.Securities
+        count = len(orders)
+        bid_prices = np.empty(count)
+        ask_prices = np.empty(count)
+        quantities = np.empty(count)
+        quotes = {}
+        for i, order in enumerate(orders):
+            quote = quotes.get(order.Symbol)
+            if quote is None:
+                security = securities[order.Symbol]
+                quote = (security.BidPrice or security.Price, security.AskPrice or security.Price)
+                quotes[order.Symbol] = quote
+            bid_prices[i], ask_prices[i] = quote
+            quantities[i] = order.Quantity
+        is_maker = [order.OrderType == OrderType.Limit for order in orders]
+        symbols = [order.Symbol for order in orders]
+        return self.EstimateOrderFees(symbols, np.sign(quantities), quantities, bid_prices, ask_prices, is_maker)
+
+    def RecordFill(self, quantity, price):
+        if quantity == 0:
+            return
+        self.Volume.Add(self._today(), self.Schedule.Volume(quantity, price))
+
+
+class CoinbaseFeeModel(TieredFeeModel):
+    def __init__(self, algorithm=None, days=30):
+        super().__init__(GDAX_FEE_SCHEDULE, days=days)
+        self.algorithm = algorithm
+
+
+class InteractiveBrokersFeeModel(TieredFeeModel):
+    def __init__(self, algorithm=None, days=30):
+        super().__init__(INTERACTIVE_BROKERS_FEE_SCHEDULE, days=days)
+        self.algorithm = algorithm
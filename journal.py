@@ -0,0 +1,323 @@
+# pylint: disable=C0321,W0401,W0614
+try: QCAlgorithm
+except NameError: from mocked import *
+
+import os
+import sys
+import time as wallclock
+from market import ISymbolDict, InternalOrder
+from singleton import Singleton
+from snapshot import BinaryWriter, BinaryReader, Snapshot
+
+# pylint: disable=C0111,C0103,R0903,R0913,R0914
+
+
+class Journal(object):
+    '''Append-only binary log of what crosses the boundary between LEAN and our accounting.
+
+    Layout: magic, version, then records of (tag, wall-clock seconds, algorithm time, payload).
+    '''
+    MAGIC = b'LAMJ'
+    VERSION = 1
+
+    SNAPSHOT = 1
+    PRICES = 2
+    ORDER = 3
+    ORDER_EVENT = 4
+    INTERNAL_FILL = 5
+    ALLOCATION = 6
+
+    def __init__(self, path=None):
+        """Records are kept in memory until Flush() appends them to path, if any."""
+        self.Path = path
+        self.Count = 0
+        self.__writer = BinaryWriter()
+        if path is None or not os.path.exists(path) or os.path.getsize(path) == 0:
+            self.__writer.Raw(self.MAGIC)
+            self.__writer.Int(self.VERSION)
+
+    def _append(self, tag, section):
+        writer = self.__writer
+        writer.Int(tag)
+        writer.Float(wallclock.time())
+        writer.Time(Singleton.QCAlgorithm.Time)
+        writer.Bytes(section.Value())
+        self.Count += 1
+
+    def RecordSnapshot(self, algorithms, broker):
+        """Starting state for a replay; open orders are recorded as ORDER records."""
+        section = BinaryWriter()
+        section.Bytes(Snapshot.Dump(Singleton.QCAlgorithm.Time, algorithms, broker, {}, submitted=False))
+        self._append(self.SNAPSHOT, section)
+        for order_id, order in broker._submitted.items():
+            self.RecordOrder(order_id, order)
+
+    def RecordPrices(self, bars):
+        section = BinaryWriter()
+        section.Int(len(bars))
+        for symbol, bar in bars.items():
+            section.String(symbol.Value)
+            section.Float(bar.Close)
+        self._append(self.PRICES, section)
+
+    def RecordOrder(self, order_id, order):
+        algorithm = order.Portfolio.Algorithm
+        section = BinaryWriter()
+        section.Int(order_id)
+        section.String(algorithm.Name if algorithm is not None else "")
+        section.String(order.Symbol.Value)
+        section.Float(order.Quantity)
+        section.Int(order.OrderType)
+        section.OptionalFloat(order.LimitPrice)
+        section.OptionalFloat(order.StopPrice)
+        section.String(order.tag)
+        self._append(self.ORDER, section)
+        if order.Allocations is not None:
+            self._record_allocation(order_id, order)
+
+    def _record_allocation(self, order_id, order):
+        section = BinaryWriter()
+        section.Int(order_id)
+        section.Int(len(order.Allocations))
+        for portfolio, share in order.Allocations:
+            section.String(portfolio.Algorithm.Name if portfolio.Algorithm is not None else "")
+            section.Float(share)
+        self._append(self.ALLOCATION, section)
+
+    def RecordOrderEvent(self, order_event):
+        fee = order_event.OrderFee.Value
+        section = BinaryWriter()
+        section.Int(order_event.OrderId)
+        section.String(order_event.Symbol.Value)
+        section.Int(order_event.Status)
+        section.Float(order_event.Quantity)
+        section.Float(order_event.FillQuantity)
+        section.Float(order_event.FillPrice)
+        section.Float(fee.Amount)
+        section.String(getattr(fee, 'Currency', 'USD'))
+        self._append(self.ORDER_EVENT, section)
+
+    def RecordInternalFill(self, seller, buyer, symbol, quantity, price):
+        """Shares moved between two portfolios without an order, e.g. from the unmanaged one."""
+        section = BinaryWriter()
+        for portfolio in (seller, buyer):
+            section.String(portfolio.Algorithm.Name if portfolio.Algorithm is not None else "")
+        section.String(symbol.Value)
+        section.Float(quantity)
+        section.Float(price)
+        self._append(self.INTERNAL_FILL, section)
+
+    def Value(self):
+        """Records not flushed yet."""
+        return self.__writer.Value()
+
+    def Flush(self):
+        if self.Path is None:
+            return
+        data = self.__writer.Value()
+        if not data:
+            return
+        with open(self.Path, 'ab') as f:
+            f.write(data)
+        self.__writer = BinaryWriter()
+
+    @classmethod
+    def Read(cls, data):
+        """Yield (tag, wall-clock seconds, algorithm time, payload reader) for each record."""
+        reader = BinaryReader(bytes(data))
+        if reader.Raw(len(cls.MAGIC)) != cls.MAGIC:
+            raise ValueError("Not a journal")
+        version = reader.Int()
+        if version > cls.VERSION:
+            raise ValueError(f"Unsupported journal version {version}")
+        while not reader.AtEnd:
+            tag = reader.Int()
+            wall_time = reader.Float()
+            time = reader.Time()
+            yield tag, wall_time, time, BinaryReader(reader.Bytes())
+
+
+class Replay(object):
+    '''Pushes a recorded session back through Broker and Portfolio as fast as possible.'''
+
+    def __init__(self, data):
+        self.__data = bytes(data)
+        self.__symbols = {}
+
+    def Tickers(self):
+        """Tickers seen in price, order and order event records."""
+        tickers = set()
+        for tag, _, _, section in Journal.Read(self.__data):
+            if tag == Journal.PRICES:
+                for _ in range(section.Int()):
+                    tickers.add(section.String())
+                    section.Float()
+            elif tag == Journal.ORDER:
+                section.Int()
+                section.String()
+                tickers.add(section.String())
+            elif tag == Journal.ORDER_EVENT:
+                section.Int()
+                tickers.add(section.String())
+            elif tag == Journal.INTERNAL_FILL:
+                section.String()
+                section.String()
+                tickers.add(section.String())
+        return tickers
+
+    def AlgorithmNames(self):
+        """Names of the algorithms in the starting snapshots and orders, in order of appearance."""
+        names = []
+        for tag, _, _, section in Journal.Read(self.__data):
+            if tag == Journal.SNAPSHOT:
+                reader = Snapshot._open(section.Bytes())
+                reader.Time()
+                found = [payload.String() for kind, payload in Snapshot._sections(reader)
+                         if kind == Snapshot.ALGORITHM]
+            elif tag == Journal.ORDER:
+                section.Int()
+                found = [section.String()]
+            elif tag == Journal.INTERNAL_FILL:
+                found = [section.String(), section.String()]
+            elif tag == Journal.ALLOCATION:
+                section.Int()
+                found = []
+                for _ in range(section.Int()):
+                    found.append(section.String())
+                    section.Float()
+            else:
+                continue
+            names.extend(name for name in found if name and name not in names)
+        return names
+
+    def _symbol(self, ticker):
+        symbol = self.__symbols.get(ticker)
+        if symbol is None:
+            symbol = ISymbolDict.CreateSymbol(ticker)
+            self.__symbols[ticker] = symbol
+        return symbol
+
+    def Run(self, algorithms, broker=None):
+        """Replay into algorithms (matched by name) and broker; returns throughput statistics."""
+        qc = Singleton.QCAlgorithm
+        broker = broker or Singleton.Broker
+        by_name = {algorithm.Name: algorithm for algorithm in algorithms}
+        counts = {Journal.SNAPSHOT: 0, Journal.PRICES: 0, Journal.ORDER: 0, Journal.ORDER_EVENT: 0,
+                  Journal.INTERNAL_FILL: 0, Journal.ALLOCATION: 0}
+
+        start = wallclock.perf_counter()
+        for tag, _, time, section in Journal.Read(self.__data):
+            qc.Time = time
+            if tag == Journal.PRICES:
+                securities = qc.Securities
+                for _ in range(section.Int()):
+                    symbol = self._symbol(section.String())
+                    securities[symbol].Price = section.Float()
+            elif tag == Journal.ORDER_EVENT:
+                broker.HandleOrderEvent(self._read_order_event(section))
+            elif tag == Journal.ORDER:
+                self._read_order(section, by_name, broker)
+            elif tag == Journal.INTERNAL_FILL:
+                self._read_internal_fill(section, by_name, broker)
+            elif tag == Journal.ALLOCATION:
+                self._read_allocation(section, by_name, broker)
+            elif tag == Journal.SNAPSHOT:
+                Snapshot.Load(section.Bytes(), algorithms, broker)
+            else:
+                continue
+            counts[tag] += 1
+        seconds = wallclock.perf_counter() - start
+
+        events = sum(counts.values())
+        return {
+            "events": events,
+            "prices": counts[Journal.PRICES],
+            "orders": counts[Journal.ORDER],
+            "order_events": counts[Journal.ORDER_EVENT],
+            "internal_fills": counts[Journal.INTERNAL_FILL],
+            "seconds": seconds,
+            "events_per_second": events / seconds if seconds > 0 else float("inf"),
+        }
+
+    @classmethod
+    def _portfolio(cls, name, by_name, broker):
+        if not name:
+            return broker.Portfolio
+        algorithm = by_name.get(name)
+        return algorithm.Portfolio if algorithm is not None else None
+
+    def _read_order(self, section, by_name, broker):
+        order_id = section.Int()
+        name = section.String()
+        ticker = section.String()
+        quantity = section.Float()
+        order_type = section.Int()
+        limit_price = section.OptionalFloat()
+        stop_price = section.OptionalFloat()
+        tag = section.String()
+
+        portfolio = self._portfolio(name, by_name, broker)
+        if portfolio is None:
+            Singleton.Error(f"Journal has unknown algorithm {name}, dropping order {order_id}")
+            return
+        broker._submitted[order_id] = InternalOrder(portfolio, self._symbol(ticker), quantity, order_type=order_type,
+                                                    limit_price=limit_price, stop_price=stop_price, tag=tag)
+
+    def _read_allocation(self, section, by_name, broker):
+        order_id = section.Int()
+        allocations = []
+        for _ in range(section.Int()):
+            allocations.append((self._portfolio(section.String(), by_name, broker), section.Float()))
+        order = broker._submitted.get(order_id)
+        if order is None or any(portfolio is None for portfolio, _ in allocations):
+            Singleton.Error(f"Journal has unknown order or algorithm, dropping allocations of order {order_id}")
+            return
+        order.Allocations = allocations
+
+    def _read_internal_fill(self, section, by_name, broker):
+        names = [section.String(), section.String()]
+        seller, buyer = [self._portfolio(name, by_name, broker) for name in names]
+        symbol = self._symbol(section.String())
+        quantity = section.Float()
+        price = section.Float()
+        if seller is None or buyer is None:
+            Singleton.Error(f"Journal has unknown algorithm in {names}, dropping internal fill of {symbol}")
+            return
+        broker._cross(seller, buyer, symbol, quantity, price)
+
+    def _read_order_event(self, section):
+        order_id = section.Int()
+        symbol = self._symbol(section.String())
+        status = section.Int()
+        quantity = section.Float()
+        order_event = OrderEvent(order_id, symbol, quantity, status=status)
+        order_event.FillQuantity = section.Float()
+        order_event.FillPrice = section.Float()
+        fee = section.Float()
+        order_event.OrderFee = OrderFee(CashAmount(fee, section.String()))
+        return order_event
+
+
+def main(argv):
+    """python journal.py session.journal: replay a journal into fresh algorithms and print the result."""
+    from algorithm import Algorithm, AlgorithmManager
+    from market import Broker
+
+    with open(argv[1], 'rb') as f:
+        data = f.read()
+    replay = Replay(data)
+
+    qc = AlgorithmManager()
+    qc.Securities = InternalSecurityManager([(Symbol(ticker), 0.0) for ticker in sorted(replay.Tickers())])
+    Singleton.Setup(qc, broker=Broker(), log_level=Singleton.ERROR)
+    algorithms = [Algorithm(name=name) for name in replay.AlgorithmNames()]
+    stats = replay.Run(algorithms)
+
+    for algorithm in algorithms:
+        print(f"{algorithm.Name}: {algorithm.Portfolio}")
+    print(f"unmanaged: {Singleton.Broker.Portfolio}")
+    print(f"{stats['events']} events in {stats['seconds']:.3f} s ({stats['events_per_second']:.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
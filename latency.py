@@ -0,0 +1,124 @@
+# pylint: disable=C0111,C0103,R0903
+import bisect
+import json
+from singleton import Singleton
+
+# 1 ms doubling up to ~2.3 hours; the last bucket holds everything above
+EDGES = [0.001 * 2 ** i for i in range(24)]
+
+WALL_CLOCK = "wall"
+ALGORITHM_TIME = "algorithm"
+
+
+class Histogram(object):
+    '''Latencies in seconds, counted in log-spaced buckets.'''
+
+    def __init__(self):
+        self.Counts = [0] * (len(EDGES) + 1)
+        self.Count = 0
+        self.Total = 0.0
+        self.Max = 0.0
+
+    def Add(self, seconds):
+        self.Counts[bisect.bisect_left(EDGES, seconds)] += 1
+        self.Count += 1
+        self.Total += seconds
+        self.Max = max(self.Max, seconds)
+
+    @property
+    def Mean(self):
+        return self.Total / self.Count if self.Count else 0.0
+
+    def Percentile(self, q):
+        """Upper edge of the bucket holding the q-th percentile (capped at Max)."""
+        if not self.Count:
+            return 0.0
+        rank = q / 100.0 * self.Count
+        seen = 0
+        for index, count in enumerate(self.Counts):
+            seen += count
+            if seen >= rank and count:
+                return min(EDGES[index], self.Max) if index < len(EDGES) else self.Max
+        return self.Max
+
+    def ToDict(self):
+        return {
+            "count": self.Count,
+            "mean": self.Mean,
+            "max": self.Max,
+            "p50": self.Percentile(50),
+            "p90": self.Percentile(90),
+            "p99": self.Percentile(99),
+            "buckets": self.Counts,
+        }
+
+
+class OrderLatency(object):
+    '''Order lifecycle latencies per algorithm and per symbol, in wall-clock and algorithm time.
+
+    Fed by Broker once an order is done; see the *At timestamps on InternalOrder.
+    '''
+    INTERVALS = (
+        ("queued_to_submitted", "QueuedAt", "SubmittedAt"),
+        ("submitted_to_first_fill", "SubmittedAt", "FirstFillAt"),
+        ("submitted_to_done", "SubmittedAt", "DoneAt"),
+        ("queued_to_done", "QueuedAt", "DoneAt"),
+    )
+
+    def __init__(self, key=None):
+        """key: ObjectStore key prefix for the daily export, if any."""
+        self.Key = key
+        self.ByAlgorithm = {}
+        self.BySymbol = {}
+
+    @classmethod
+    def _histograms(cls, groups, name):
+        histograms = groups.get(name)
+        if histograms is None:
+            histograms = {(clock, interval): Histogram()
+                          for clock in (WALL_CLOCK, ALGORITHM_TIME) for interval, _, _ in cls.INTERVALS}
+            groups[name] = histograms
+        return histograms
+
+    def Record(self, order):
+        algorithm = order.Portfolio.Algorithm
+        by_algorithm = self._histograms(self.ByAlgorithm, algorithm.Name if algorithm is not None else "unmanaged")
+        by_symbol = self._histograms(self.BySymbol, order.Symbol.Value)
+        for interval, start, end in self.INTERVALS:
+            start = getattr(order, start)
+            end = getattr(order, end)
+            if start is None or end is None:
+                continue
+            wall = max(end[0] - start[0], 0.0)
+            algorithm_time = max((end[1] - start[1]).total_seconds(), 0.0)
+            for histograms in (by_algorithm, by_symbol):
+                histograms[(WALL_CLOCK, interval)].Add(wall)
+                histograms[(ALGORITHM_TIME, interval)].Add(algorithm_time)
+
+    @classmethod
+    def _to_dict(cls, groups):
+        return {name: {clock: {interval: histograms[(clock, interval)].ToDict() for interval, _, _ in cls.INTERVALS}
+                       for clock in (WALL_CLOCK, ALGORITHM_TIME)}
+                for name, histograms in groups.items()}
+
+    def ToDict(self):
+        return {"algorithms": self._to_dict(self.ByAlgorithm), "symbols": self._to_dict(self.BySymbol)}
+
+    def Reset(self):
+        self.ByAlgorithm = {}
+        self.BySymbol = {}
+
+    def Export(self):
+        """Log the day's summary, save it to the ObjectStore under Key/<date>, and start over."""
+        if not self.ByAlgorithm:
+            return
+        for name, histograms in sorted(self.ByAlgorithm.items()):
+            wall = histograms[(WALL_CLOCK, "submitted_to_done")]
+            algorithm_time = histograms[(ALGORITHM_TIME, "submitted_to_done")]
+            Singleton.Log(f"Latency {name}: {wall.Count} orders, submitted to done "
+                          f"p50 {wall.Percentile(50):.3f}s p90 {wall.Percentile(90):.3f}s max {wall.Max:.3f}s "
+                          f"(algorithm time p50 {algorithm_time.Percentile(50):.0f}s)")
+        if self.Key:
+            Singleton.QCAlgorithm.ObjectStore.Save(f"{self.Key}/{Singleton.QCAlgorithm.Time.date()}",
+                                                   json.dumps(self.ToDict(), sort_keys=True))
+        self.Reset()
@@ -0,0 +1,212 @@
+# pylint: disable=C0111,C0103,R0903
+from datetime import datetime
+import numpy as np
+from market import Position, FIFO
+from singleton import Singleton
+
+CHUNK_SIZE = 4096
+
+# name -> dtype of every ledger column
+COLUMNS = [
+    ("Time", "datetime64[us]"),
+    ("Algorithm", np.int32),
+    ("Symbol", np.int32),
+    ("Quantity", np.float64),
+    ("Price", np.float64),
+    ("Fee", np.float64),
+    ("Internal", np.bool_),
+]
+
+
+class TradeLedger(object):
+    '''Append-only record of every fill, kept as NumPy columns in fixed-size chunks.
+
+    Algorithms and symbols are stored as codes into Algorithms and Symbols. Fills between
+    the broker's portfolio and an algorithm are internal; the broker's own side belongs to "".
+    '''
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.ChunkSize = chunk_size
+        self.Algorithms = []
+        self.Symbols = []
+        self.__codes = ({}, {})
+        self.__chunks = []
+        self.__count = 0
+        self.__columns = None
+
+    def __len__(self):
+        return self.__count
+
+    def __code(self, values, index, value):
+        codes = self.__codes[index]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def Record(self, algorithm, symbol, quantity, price, fee=0.0, internal=False, time=None):
+        if time is None:
+            time = Singleton.QCAlgorithm.Time
+        offset = self.__count % self.ChunkSize
+        if offset == 0:
+            self.__chunks.append({name: np.empty(self.ChunkSize, dtype=dtype) for name, dtype in COLUMNS})
+        chunk = self.__chunks[-1]
+        chunk["Time"][offset] = np.datetime64(time, "us") if isinstance(time, datetime) else np.datetime64("NaT")
+        chunk["Algorithm"][offset] = self.__code(self.Algorithms, 0, algorithm)
+        chunk["Symbol"][offset] = self.__code(self.Symbols, 1, str(symbol))
+        chunk["Quantity"][offset] = quantity
+        chunk["Price"][offset] = price
+        chunk["Fee"][offset] = fee
+        chunk["Internal"][offset] = internal
+        self.__count += 1
+        self.__columns = None
+
+    def Columns(self):
+        """Every column as one read-only array, rebuilt after new fills."""
+        if self.__columns is None:
+            last = self.__count - (len(self.__chunks) - 1) * self.ChunkSize
+            columns = {}
+            for name, dtype in COLUMNS:
+                parts = [chunk[name] for chunk in self.__chunks[:-1]]
+                if self.__chunks:
+                    parts.append(self.__chunks[-1][name][:last])
+                column = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+                column.setflags(write=False)
+                columns[name] = column
+            self.__columns = columns
+        return self.__columns
+
+    def _per_algorithm(self, values):
+        sums = np.bincount(self.Columns()["Algorithm"], weights=values, minlength=len(self.Algorithms))
+        return {name: float(sums[code]) for code, name in enumerate(self.Algorithms)}
+
+    def Turnover(self):
+        """Traded value per algorithm."""
+        columns = self.Columns()
+        return self._per_algorithm(np.abs(columns["Quantity"] * columns["Price"]))
+
+    def Fees(self):
+        return self._per_algorithm(self.Columns()["Fee"])
+
+    def FeeDrag(self):
+        """Fees as a fraction of traded value, per algorithm."""
+        turnover = self.Turnover()
+        return {name: fee / turnover[name] if turnover[name] else 0.0 for name, fee in self.Fees().items()}
+
+    def _sorted(self):
+        """Row order by (algorithm, symbol), then fill order, and where each (algorithm, symbol) starts in it."""
+        columns = self.Columns()
+        algorithm, symbol = columns["Algorithm"], columns["Symbol"]
+        order = np.lexsort((np.arange(len(algorithm)), symbol, algorithm))
+        keys = algorithm[order].astype(np.int64) * len(self.Symbols) + symbol[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1)) if len(order) else np.empty(0, np.intp)
+        return order, starts
+
+    def _groups(self):
+        """Row indices of each (algorithm, symbol), in fill order."""
+        order, starts = self._sorted()
+        return np.split(order, starts[1:]) if len(order) else []
+
+    def RealizedProfit(self, cost_basis=None):
+        """Profit of closed long and short quantities, net of fees, per algorithm.
+
+        cost_basis is AVERAGE_COST or FIFO, Position.DefaultCostBasis by default. Unlike
+        Position.RealizedProfit, which only realizes sales of long positions, covering a short realizes too.
+        """
+        columns = self.Columns()
+        profit = np.bincount(columns["Algorithm"], weights=-columns["Fee"], minlength=len(self.Algorithms))
+        if len(self):
+            order, starts = self._sorted()
+            quantity, price = columns["Quantity"][order], columns["Price"][order]
+            sizes = np.diff(np.append(starts, len(order)))
+            # position of the (algorithm, symbol) before and after every fill
+            after = np.cumsum(quantity)
+            after = np.round(after - np.repeat(after[starts] - quantity[starts], sizes), 9)
+            before = np.round(after - quantity, 9)
+            closed = np.where(before * quantity < 0, np.minimum(np.abs(quantity), np.abs(before)), 0.0)
+            opened = np.abs(quantity) - closed
+            if (cost_basis or Position.DefaultCostBasis) == FIFO:
+                cost = self._fifo_cost(price, opened, closed, np.abs(after[starts + sizes - 1]), sizes)
+            else:
+                cost = self._average_cost(price, before, opened, closed)
+            realized = np.sign(before) * (closed * price - cost)
+            profit += np.bincount(columns["Algorithm"][order], weights=realized, minlength=len(self.Algorithms))
+        return {name: float(profit[code]) for code, name in enumerate(self.Algorithms)}
+
+    @classmethod
+    def _fifo_cost(cls, price, opened, closed, left_open, sizes):
+        """Cost of the closed quantity of every fill, taken from the oldest opened quantity first.
+
+        Opened quantities line up one after the other over all rows; every close takes the next ones of
+        its (algorithm, symbol), after what earlier (algorithm, symbol) pairs left open.
+        """
+        opened_total = np.concatenate(([0.0], np.cumsum(opened)))
+        cost_total = np.concatenate(([0.0], np.cumsum(opened * price)))
+        skipped = np.repeat(np.concatenate(([0.0], np.cumsum(left_open)[:-1])), sizes)
+        first = np.cumsum(closed) - closed + skipped
+        return np.interp(first + closed, opened_total, cost_total) - np.interp(first, opened_total, cost_total)
+
+    @classmethod
+    def _average_cost(cls, price, before, opened, closed):
+        """Cost of the closed quantity of every fill at the average price of the position.
+
+        The cost of the open position follows cost = cost * remaining + opened * price, restarted
+        whenever the position goes flat or flips, and solved with cumulative sums within each run.
+        """
+        held = np.abs(before)
+        remaining = np.where(held > 0, (held - closed) / np.where(held > 0, held, 1.0), 1.0)
+        restart = (held == 0) | (remaining == 0)
+        starts = np.flatnonzero(restart)
+        sizes = np.diff(np.append(starts, len(price)))
+        # share of the run's cost still held, and the cost added by every fill in those terms
+        decay = np.cumsum(np.log(np.where(restart, 1.0, remaining)))
+        decay = np.exp(decay - np.repeat(decay[starts], sizes))
+        added = opened * price / decay
+        total = np.cumsum(added)
+        total -= np.repeat(total[starts] - added[starts], sizes)
+        cost_after = decay * total
+        cost_before = np.concatenate(([0.0], cost_after[:-1]))
+        return np.where(closed > 0, closed * cost_before / np.where(held > 0, held, 1.0), 0.0)
+
+    def HoldingPeriods(self, algorithm):
+        """Durations from opening a position to closing it, for every closed round trip of algorithm."""
+        if algorithm not in self.__codes[0]:
+            return np.empty(0, dtype="timedelta64[us]")
+        code = self.__codes[0][algorithm]
+        columns = self.Columns()
+        periods = []
+        for rows in self._groups():
+            if columns["Algorithm"][rows[0]] != code:
+                continue
+            position = np.round(np.cumsum(columns["Quantity"][rows]), 6)
+            before = np.concatenate(([0.0], position[:-1]))
+            opened = np.flatnonzero((before == 0) & (position != 0))
+            closed = np.flatnonzero((before != 0) & (position == 0))
+            times = columns["Time"][rows]
+            periods.append(times[closed] - times[opened[:len(closed)]])
+        return np.concatenate(periods) if periods else np.empty(0, dtype="timedelta64[us]")
+
+    def Summary(self):
+        """Turnover, fees, fee drag and realized profit per algorithm."""
+        turnover, fees, drag, profit = self.Turnover(), self.Fees(), self.FeeDrag(), self.RealizedProfit()
+        return {name: {"turnover": turnover[name], "fees": fees[name], "fee_drag": drag[name],
+                       "realized_profit": profit[name]}
+                for name in self.Algorithms}
+
+    def ToArrow(self):
+        """A pyarrow.Table with algorithm and symbol names as dictionary columns; needs pyarrow."""
+        import pyarrow as pa  # pylint: disable=import-outside-toplevel
+        columns = self.Columns()
+        arrays = {}
+        for name, _ in COLUMNS:
+            if name in ("Algorithm", "Symbol"):
+                values = self.Algorithms if name == "Algorithm" else self.Symbols
+                arrays[name] = pa.DictionaryArray.from_arrays(pa.array(columns[name]), pa.array(values, pa.string()))
+            else:
+                arrays[name] = pa.array(columns[name])
+        return pa.table(arrays)
+
+    def ToParquet(self, path):
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+        pq.write_table(self.ToArrow(), path)
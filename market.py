@@ -2,9 +2,12 @@
 try: QCAlgorithm
 except NameError: from mocked import *
 
+import time
+from collections import deque
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
 from math import isclose
+import numpy as np
 from decorators import accepts, convert_to_symbol
 from singleton import Singleton
 
@@ -17,6 +20,7 @@ class Helper:
         if event_order_status in (
             OrderStatus.New,
             OrderStatus.Submitted,
+            OrderStatus.PartiallyFilled,
             OrderStatus.CancelPending,
             OrderStatus.UpdateSubmitted
         ):
@@ -24,6 +28,10 @@ class Helper:
         else:
             return True
 
+    @classmethod
+    def timestamp(cls):
+        return (time.time(), Singleton.QCAlgorithm.Time)
+
 class ISymbolDict(dict):
     # def __iter__(self):
     #     return super().items().__iter__()
@@ -61,19 +69,33 @@ class ISymbolDict(dict):
         return self.values()
 
 
+AVERAGE_COST = "average"
+FIFO = "fifo"
+
+
 class Position(object):
-    '''SecurityHolding'''
+    '''SecurityHolding
+
+    Sells realize profit against the average cost, or against the oldest lots first with FIFO.
+    '''
+
+    DefaultCostBasis = AVERAGE_COST
 
-    @accepts(self=object, symbol=Symbol, quantity=(int, float), price_per_share=(int, float), fees=(int, float))
-    def __init__(self, symbol, quantity, price_per_share, fees=0):
+    @accepts(self=object, symbol=Symbol, quantity=(int, float), price_per_share=(int, float), fees=(int, float),
+             cost_basis=(str, type(None)))
+    def __init__(self, symbol, quantity, price_per_share, fees=0, cost_basis=None):
         self.Symbol = symbol
         self.Quantity = float(quantity)
         self.AveragePrice = float(price_per_share)
         self.TotalFees = float(fees)
-        self.Security = None
-        if symbol in Singleton.QCAlgorithm.Securities:
-            self.Security = Singleton.QCAlgorithm.Securities[symbol]
-
+        self.RealizedProfit = 0.0
+        self.CostBasis = cost_basis or Position.DefaultCostBasis
+        # [quantity, price] of every open lot, oldest first; only kept for FIFO
+        self.__lots = None
+        if self.CostBasis == FIFO:
+            self.__lots = deque()
+            if self.Quantity > 0:
+                self.__lots.append([self.Quantity, self.AveragePrice])
 
     def __str__(self):
         return "(%.1f %s @ %.2f USD + $%.2f)" % (self.Quantity, self.Symbol, self.HoldingsCost(), self.TotalFees)
@@ -105,9 +127,40 @@ class Position(object):
     def IsShort(self):
         return self.Quantity < 0.0
 
-    # @property
-    # def NetProfit(self):
-    #     return self.Profit - self.TotalFees
+    @property
+    def Profit(self):
+        return self.RealizedProfit
+
+    @property
+    def UnrealizedProfit(self):
+        return self.Quantity * (self.Price - self.AveragePrice)
+
+    @property
+    def NetProfit(self):
+        return self.RealizedProfit - self.TotalFees
+
+    @property
+    def Lots(self):
+        """(quantity, price) of the open lots, oldest first."""
+        if self.__lots is None:
+            return [(self.Quantity, self.AveragePrice)] if self.Quantity > 0 else []
+        return [tuple(lot) for lot in self.__lots]
+
+    @property
+    def Security(self):
+        cache = Singleton.SecurityCache
+        security = cache.get(self.Symbol)
+        if security is None:
+            securities = Singleton.Securities
+            if self.Symbol not in securities:
+                # not cached, the security may still be added
+                return None
+            security = cache[self.Symbol] = securities[self.Symbol]
+        return security
+
+    @Security.setter
+    def Security(self, security):
+        Singleton.SecurityCache[self.Symbol] = security
 
     @property
     def Price(self):
@@ -123,12 +176,44 @@ class Position(object):
             new_sum = quantity * price_per_share
             self.Quantity += quantity
             self.AveragePrice = (old_sum + new_sum) / self.Quantity
+            if self.__lots is not None:
+                self.__lots.append([quantity, price_per_share])
 
         elif quantity < 0:
+            closed = min(-quantity, max(self.Quantity, 0.0))
+            if self.__lots is None:
+                self.RealizedProfit += closed * (price_per_share - self.AveragePrice)
+            elif closed > 0:
+                self._close_lots(closed, price_per_share)
             self.Quantity += quantity
 
         self.TotalFees += fees
 
+    def _restore(self, realized_profit, lots):
+        """Used by Snapshot; lots of another cost basis are ignored."""
+        self.RealizedProfit = realized_profit
+        if self.__lots is not None and lots:
+            self.__lots = deque([quantity, price] for quantity, price in lots)
+
+    def _close_lots(self, closed, price_per_share):
+        lots = self.__lots
+        cost = 0.0
+        remaining = closed
+        while remaining > 0 and lots:
+            lot = lots[0]
+            if lot[0] <= remaining:
+                cost += lot[0] * lot[1]
+                remaining -= lot[0]
+                lots.popleft()
+            else:
+                cost += remaining * lot[1]
+                lot[0] -= remaining
+                remaining = 0.0
+        self.RealizedProfit += closed * price_per_share - cost
+        quantity = self.Quantity - closed
+        if quantity > 0:
+            self.AveragePrice = (self.Quantity * self.AveragePrice - cost) / quantity
+
 
 class CashAmount(float):
     @property
@@ -146,24 +231,111 @@ class Cash(CashAmount):
         self.ConversionRate = price
 
 
+class ConversionRates(object):
+    '''Price of every known currency in the account currency, refreshed from LEAN once per bar.
+
+    Rates live in one array so that cash books and holdings convert with a single dot product.
+    '''
+
+    def __init__(self, account_currency='USD'):
+        self.AccountCurrency = account_currency
+        self.Currencies = [account_currency]
+        self.Rates = np.ones(1)
+        self.__index = {account_currency: 0}
+
+    @classmethod
+    def Instance(cls):
+        """Rates of the current QCAlgorithm, created on first use."""
+        if Singleton.ConversionRates is None:
+            Singleton.ConversionRates = cls()
+        return Singleton.ConversionRates
+
+    def __len__(self):
+        return len(self.Currencies)
+
+    def Index(self, currency):
+        """Position of currency in Rates; an unknown currency starts at its rate in LEAN's cash book."""
+        index = self.__index.get(currency)
+        if index is None:
+            cashbook = Singleton.QCAlgorithm.Portfolio.CashBook
+            if currency not in cashbook:
+                raise KeyError(f"No conversion rate for {currency}")
+            index = self._add(currency, cashbook[currency].ConversionRate)
+        return index
+
+    def _add(self, currency, rate):
+        index = self.__index[currency] = len(self.Currencies)
+        self.Currencies.append(currency)
+        self.Rates = np.append(self.Rates, rate)
+        return index
+
+    def Indices(self, currencies):
+        return np.fromiter((self.Index(c) for c in currencies), dtype=np.intp)
+
+    def Rate(self, currency):
+        index = self.Index(currency)
+        return float(self.Rates[index])
+
+    def SetRate(self, currency, rate):
+        index = self.__index.get(currency)
+        if index is None:
+            self._add(currency, rate)
+        else:
+            self.Rates[index] = rate
+
+    def Update(self, cashbook=None):
+        """Read the conversion rate of every known currency from LEAN's cash book."""
+        cashbook = Singleton.QCAlgorithm.Portfolio.CashBook if cashbook is None else cashbook
+        for index, currency in enumerate(self.Currencies):
+            if index and currency in cashbook:
+                self.Rates[index] = cashbook[currency].ConversionRate
+
+    def Convert(self, amounts, currencies):
+        """Sum of amounts, each in its own currency, in the account currency."""
+        indices = self.Indices(currencies)
+        return float(np.dot(np.asarray(amounts, dtype=float), self.Rates[indices]))
+
+    def HoldingsValue(self, positions):
+        values, currencies = [], []
+        for pos in positions:
+            security = pos.Security
+            values.append(pos.Quantity * security.Price)
+            currencies.append(security.QuoteCurrency.Symbol)
+        return self.Convert(values, currencies)
+
+
 class CashBook(dict):
+    def __init__(self, account_currency='USD'):
+        super().__init__()
+        self.AccountCurrency = account_currency
+
     @property
     def Keys(self):
         return self.keys()
 
+    @property
+    def TotalValueInAccountCurrency(self):
+        if len(self) == 1 and self.AccountCurrency in self:
+            return float(self[self.AccountCurrency])
+        return ConversionRates.Instance().Convert(list(self.values()), list(self.keys()))
+
 
 
 class Portfolio(ISymbolDict):
     '''SecurityPortfolioManager'''
-    def __init__(self, algorithm=None, cash=0.0):
+    def __init__(self, algorithm=None, cash=0.0, currency='USD'):
         super().__init__()
         self.Algorithm = algorithm
         self.__orders = []
         self.__cost = cash
-        self.Cash = Cash('USD', cash)
-        self.CashBook = CashBook()
-        self.CashBook['USD'] = Cash('USD', cash)
+        self.Cash = Cash(currency, cash)
+        self.CashBook = CashBook(currency)
+        self.CashBook[currency] = self.Cash
         self.UnsettledCash = 0.0
+        # AVERAGE_COST or FIFO for new positions; None uses Position.DefaultCostBasis
+        self.CostBasis = None
+        # skip orders whose estimated fee exceeds this fraction of their value
+        self.MaxFeeRatio = None
 
     def __bool__(self):
         return True
@@ -171,14 +343,35 @@ class Portfolio(ISymbolDict):
     def NoValue(self, key):
         return Position(key, 0, 0)
 
+    @property
+    def Cost(self):
+        return self.__cost
+
     def SetCost(self, cost):
         self.__cost = cost
 
+    @property
+    def AccountCurrency(self):
+        return self.CashBook.AccountCurrency
+
     def SetCash(self, cash):
-        self.Cash = Cash('USD', cash)
-        self.CashBook['USD'] = Cash('USD', cash)
+        currency = self.CashBook.AccountCurrency
+        self.Cash = Cash(currency, cash)
+        self.CashBook[currency] = self.Cash
         self.SetCost(cash)
 
+    def SetAccountCurrency(self, currency):
+        """Keep the cash in currency from now on; cash in other currencies stays in the cash book."""
+        if currency == self.CashBook.AccountCurrency:
+            return
+        cashbook = CashBook(currency)
+        for code, amount in self.CashBook.items():
+            if code != self.CashBook.AccountCurrency or amount != 0:
+                cashbook[code] = amount
+        self.CashBook = cashbook
+        self.Cash = Cash(currency, cashbook.get(currency, 0.0))
+        cashbook[currency] = self.Cash
+
     @property
     def HoldStock(self):
         return self.TotalHoldingsValue > 0
@@ -192,12 +385,15 @@ class Portfolio(ISymbolDict):
 
     @property
     def TotalPortfolioValue(self):
-        return self.TotalHoldingsValue + self.Cash + self.UnsettledCash
+        cash = self.Cash if len(self.CashBook) <= 1 else self.CashBook.TotalValueInAccountCurrency
+        return self.TotalHoldingsValue + cash + self.UnsettledCash
 
     @property
     def TotalHoldingsValue(self):
-        retval = sum([(pos.Quantity) * Singleton.QCAlgorithm.Securities[symb].Price
-                      for symb, pos in iter(self.items())])
+        rates = Singleton.ConversionRates
+        if rates is not None and len(rates) > 1:
+            return rates.HoldingsValue(self.values())
+        retval = sum([pos.Quantity * pos.Security.Price for pos in self.values()])
         return float(retval)
 
     @property
@@ -208,16 +404,24 @@ class Portfolio(ISymbolDict):
     def UnrealizedProfit(self):
         return self.TotalHoldingsValue - self.TotalHoldingsCost
 
+    @property
+    def RealizedProfit(self):
+        return sum([pos.RealizedProfit for pos in self.values()])
+
+    @property
+    def TotalProfit(self):
+        return self.RealizedProfit
+
+    @property
+    def NetProfit(self):
+        return self.RealizedProfit - self.TotalFees
+
     @property
     def Performance(self):
         if self.__cost == 0:
             return 0.0
         return round(100.0 * ((self.TotalPortfolioValue / self.__cost) - 1.0), 2)
 
-    # @property
-    # def TotalProfit(self):
-    #     return sum([pos.Profit for pos in self.values()])
-
     @property
     def TotalFees(self):
         retval = sum([pos.TotalFees for pos in self.values()])
@@ -245,16 +449,28 @@ class Portfolio(ISymbolDict):
         Singleton.Debug("> ProcessFill: %s" % order_event)
         self._fill_order(order.Symbol, order_event.FillQuantity, order_event.FillPrice, order_event.OrderFee.Value.Amount)
 
-    @accepts(self=object, symbol=Symbol, quantity=float, price_per_share=float, fees=float)
-    def _fill_order(self, symbol, quantity, price_per_share, fees=0.0):
-        """Used by Broker."""
+    @accepts(self=object, symbol=Symbol, quantity=float, price_per_share=float, fees=float, internal=bool)
+    def _fill_order(self, symbol, quantity, price_per_share, fees=0.0, internal=False):
+        """Used by Broker; internal fills move shares between the broker's portfolio and an algorithm."""
+        if Singleton.Ledger is not None:
+            name = self.Algorithm.Name if self.Algorithm is not None else ""
+            Singleton.Ledger.Record(name, symbol, quantity, price_per_share, fees, internal)
         if symbol not in self:
-            self[symbol] = Position(symbol, quantity, price_per_share, fees)
+            self[symbol] = Position(symbol, quantity, price_per_share, fees, cost_basis=self.CostBasis)
         else:
             self[symbol]._fill(quantity, price_per_share, fees)
-        self.Cash -= quantity * price_per_share
-        self.Cash -= fees
-        self.CashBook['USD'] = self.Cash
+
+        # the cash moves in the currency the symbol is quoted in
+        cash = -quantity * price_per_share - fees
+        security = self[symbol].Security
+        currency = security.QuoteCurrency.Symbol if security is not None else self.CashBook.AccountCurrency
+        if currency == self.CashBook.AccountCurrency:
+            self.Cash = Cash(currency, self.Cash + cash)
+            self.CashBook[currency] = self.Cash
+        else:
+            self.CashBook[currency] = Cash(currency, self.CashBook.get(currency, 0.0) + cash)
+        if Singleton.Reconciler is not None:
+            Singleton.Reconciler.RecordFill(symbol, quantity, cash, currency=currency)
 
         # We round the float to prevent negative near-zero
         remaining_quantity = round(self[symbol].Quantity, 6)
@@ -270,14 +486,32 @@ class Portfolio(ISymbolDict):
         if isclose(order.Quantity, 0, abs_tol=Singleton.Securities[order.Symbol].SymbolProperties.LotSize):
             Singleton.Log("Warning: Avoiding submitting order that has zero quantity.")
             return
+        if not self._is_worth_fees(order):
+            Singleton.Log(f"Warning: Avoiding submitting order whose fees exceed its value: {order}")
+            return
         Singleton.Debug(f"AddOrder: {order}")
+        order.QueuedAt = Helper.timestamp()
         self.__orders.append(order)
+        if Singleton.Broker is not None:
+            Singleton.Broker.Pending[id(self)] = self
 
-    def ExecuteOrders(self):
-        sorted_orders = sorted(self.__orders, key=lambda x: x.Quantity)
-        for order in sorted_orders:
-            Singleton.Broker.ExecuteOrder(order)
+    def _is_worth_fees(self, order):
+        if self.MaxFeeRatio is None or Singleton.FeeModel is None:
+            return True
+        # never hold back an order that closes the position
+        if isclose(self[order.Symbol].Quantity + order.Quantity, 0, abs_tol=1e-9):
+            return True
+        value = abs(order.Quantity) * Singleton.QCAlgorithm.Securities[order.Symbol].Price
+        return order.EstimatedFee <= self.MaxFeeRatio * value
+
+    def TakeOrders(self):
+        """Pending orders, which are no longer pending afterwards."""
+        orders = self.__orders
         self.__orders = []
+        return orders
+
+    def ExecuteOrders(self):
+        Singleton.Broker.ExecuteOrders(self.TakeOrders())
 
     @convert_to_symbol('symbol', Singleton.CreateSymbol)
     def createOrder(self, symbol, quantity, order_type, **kwargs):
@@ -324,7 +558,7 @@ class BenchmarkSymbol(object):
 
 class InternalOrder(object):
     @accepts(self=object, portfolio=Portfolio, symbol=Symbol, quantity=(int, float), order_type=int,
-             limit_price=(int, float, None), stop_price=(int, float, None), tag=str)
+             limit_price=(int, float, type(None)), stop_price=(int, float, type(None)), tag=str)
     def __init__(self, portfolio, symbol, quantity, order_type=OrderType.Market,
                  limit_price=None, stop_price=None, tag=""):
         self.Portfolio = portfolio
@@ -335,6 +569,17 @@ class InternalOrder(object):
         self.StopPrice = float(stop_price) if stop_price else None
         self.tag = tag
         self.Ticket = None
+        # quantity filled so far, while the order is still open
+        self.Filled = 0.0
+        # execution.SlicedOrder this is a child order of
+        self.Parent = None
+        # (portfolio, share of every fill) when the order trades for several portfolios
+        self.Allocations = None
+        # (wall-clock seconds, algorithm time) of each lifecycle stage
+        self.QueuedAt = None
+        self.SubmittedAt = None
+        self.FirstFillAt = None
+        self.DoneAt = None
 
     def __hash__(self):
         return hash((self.Portfolio, self.Symbol, self.Quantity, self.OrderType, self.LimitPrice,
@@ -350,6 +595,20 @@ class InternalOrder(object):
     def __ne__(self, other):
         return not self == other
 
+    @property
+    def Shares(self):
+        """(portfolio, share) of everyone this order trades for."""
+        return [(self.Portfolio, 1.0)] if self.Allocations is None else self.Allocations
+
+    def Share(self, portfolio):
+        return sum([share for owner, share in self.Shares if owner is portfolio])
+
+    @property
+    def EstimatedFee(self):
+        if Singleton.FeeModel is None:
+            return 0.0
+        return Singleton.FeeModel.EstimateOrderFee(self.Symbol, self.Quantity, self.OrderType)
+
     def ToString(self):
         return f"{InternalOrder.TypeToString(self.OrderType)}Order({self.Symbol}, {self.Quantity})"
 
@@ -371,8 +630,17 @@ class InternalOrder(object):
 
 
 class Broker(object):
+    # how long a buy waits for the sells of its batch
+    HoldTimeout = timedelta(hours=1)
+
     def __init__(self, portfolio=None):
         self._submitted = {}
+        # buys waiting for open sells to free cash
+        self.Held = []
+        # id(portfolio) -> portfolio with queued orders, drained once per step
+        self.Pending = {}
+        # id(buy) -> (ids of the open sells it waits for, when it is dropped)
+        self.__holds = {}
         # unmanaged cash and positions
         self.Portfolio = Portfolio() if portfolio is None else portfolio
 
@@ -383,43 +651,182 @@ class Broker(object):
         return self.__str__()
 
     def ImportFromBroker(self, currency='USD'):
+        """Import the brokerage's cash and holdings as unmanaged.
+
+        A currency with a "<currency><account currency>" security, such as BTCUSD, is a holding;
+        any other currency, such as EUR, stays cash.
+        """
         qc = Singleton.QCAlgorithm
         qc.Log("sync started")
 
-        crypto_codes = ['BTC', 'ETH', 'LTC']
-        qc.Log(f"Portfolio.CashBook.Keys: {qc.Portfolio.CashBook.Keys} ")
-
-        cash_amount = qc.Portfolio.CashBook[currency].Amount
-        self.Portfolio.SetCash(cash_amount)
-        qc.Log(f"Portfolio.CashBook[{currency}].Amount: {cash_amount} ")
+        cashbook = qc.Portfolio.CashBook
+        rates = Singleton.ConversionRates = ConversionRates(currency)
+        self.Portfolio.SetAccountCurrency(currency)
+        self.Portfolio.SetCash(cashbook[currency].Amount)
 
-        for crypto_code in qc.Portfolio.CashBook.Keys:
-            currency_pair = f"{crypto_code}{currency}"  # eg, BTCUSD
-            qc.Log(f"Found {currency_pair} ({crypto_code})")
-            if crypto_code not in crypto_codes:
-                qc.Log(f"Ignoring {currency_pair} ({crypto_code})")
+        tickers = {symbol.Value: symbol for symbol in qc.Securities.Keys}
+        holdings, currencies = [], []
+        for code in cashbook.Keys:
+            if code == currency:
                 continue
-            cash = qc.Portfolio.CashBook[crypto_code]
-            symbol = ISymbolDict.CreateSymbol(currency_pair)
-            qty = cash.Amount
-            qc.Log(f"Found {cash.Amount} positions")
-            if qty == 0:
-                qc.Log(f"Found zero positions for {symbol.Value}")
-            price = cash.ConversionRate
-            self.Portfolio[symbol] = Position(symbol, qty, price, fees=0.0)
-            qc.Log(f"Imported from Singleton.Portfolio.CashBook: {cash} ")
+            cash = cashbook[code]
+            rates.SetRate(code, cash.ConversionRate)
+            symbol = tickers.get(f"{code}{currency}")
+            if symbol is None:
+                self.Portfolio.CashBook[code] = Cash(code, cash.Amount, cash.ConversionRate)
+                currencies.append(code)
+            elif cash.Amount != 0:
+                self.Portfolio[symbol] = Position(symbol, cash.Amount, cash.ConversionRate, fees=0.0)
+                holdings.append(symbol.Value)
 
         for symbol, position in qc.Portfolio.items():
-            qty = position.Quantity
-            if qty == 0:
-                qc.Log(f"Found zero positions for {symbol.Value}")
-                continue
-            price = position.AveragePrice
-            position = Position(symbol, qty, price, fees=0.0)
-            self.Portfolio[symbol] = position
-            qc.Log(f"Imported from Singleton.Portfolio {position} ")
+            if position.Quantity != 0:
+                self.Portfolio[symbol] = Position(symbol, position.Quantity, position.AveragePrice, fees=0.0)
+                holdings.append(symbol.Value)
+
+        qc.Log(f"sync done: {self.Portfolio.Cash} {currency}, cash in {currencies}, holdings in {holdings}")
+
+    def TakePendingOrders(self):
+        """Orders queued by every portfolio since the last call."""
+        orders = []
+        for portfolio in self.Pending.values():
+            orders.extend(portfolio.TakeOrders())
+        self.Pending = {}
+        return orders
+
+    def ExecuteOrders(self, orders):
+        """Net the orders of one or more portfolios per symbol and execute them, sells first by notional.
+
+        Orders with the same symbol, type and prices are netted per portfolio first. Market orders
+        of different portfolios that offset each other are crossed internally at the current price,
+        and what is left goes out as one order for all of them. While sells are still open, a buy
+        that needs more cash than the brokerage holds waits in Held until their fills free it up.
+        """
+        net = {}
+        for order in orders:
+            key = (id(order.Portfolio), order.Symbol, order.OrderType, order.LimitPrice, order.StopPrice)
+            if key in net:
+                net[key].Quantity += order.Quantity
+            else:
+                net[key] = order
+
+        securities = Singleton.Securities
+        orders = sorted([order for order in net.values() if order.Quantity != 0],
+                        key=lambda x: x.Quantity * securities[x.Symbol].Price)
+        groups = {}
+        for order in orders:
+            if self._accept(order):
+                key = (order.Symbol, order.OrderType, order.LimitPrice, order.StopPrice)
+                groups.setdefault(key, []).append(order)
+
+        sells, buys = [], []
+        for (symbol, order_type, _, _), group in groups.items():
+            if order_type == OrderType.Market:
+                self._cross_orders(group, securities[symbol].Price)
+            for side, quantities in ((sells, [i for i in group if i.Quantity < 0]),
+                                     (buys, [i for i in group if i.Quantity > 0])):
+                if quantities:
+                    side.append(self._merge(quantities))
+
+        notional = lambda x: x.Quantity * securities[x.Symbol].Price
+        sold = []
+        for order in sorted(sells, key=notional):
+            self.ExecuteOrder(order)
+            if order.Ticket is not None:
+                sold.append(order.Ticket.OrderId)
+        for order in sorted(buys, key=notional):
+            # buys only wait for the sells of their own batch
+            self.Held.append(order)
+            self.__holds[id(order)] = (set(sold), None)
+        self._release_held()
+
+    def _cross_orders(self, orders, price_per_share):
+        """Fill offsetting orders of different portfolios against each other."""
+        buys = [order for order in orders if order.Quantity > 0]
+        sells = [order for order in orders if order.Quantity < 0]
+        while buys and sells:
+            buy, sell = buys[-1], sells[-1]
+            quantity = min(buy.Quantity, -sell.Quantity)
+            self._cross(sell.Portfolio, buy.Portfolio, buy.Symbol, quantity, price_per_share)
+            buy.Quantity -= quantity
+            sell.Quantity += quantity
+            if isclose(buy.Quantity, 0.0, abs_tol=1e-9):
+                buy.Quantity = 0.0
+                buys.pop()
+            if isclose(sell.Quantity, 0.0, abs_tol=1e-9):
+                sell.Quantity = 0.0
+                sells.pop()
+
+    @classmethod
+    def _merge(cls, orders):
+        """One order for the same-side orders of several portfolios; fills are shared pro rata."""
+        if len(orders) == 1:
+            return orders[0]
+        first = orders[0]
+        total = sum([order.Quantity for order in orders])
+        tags = []
+        for order in orders:
+            if order.tag and order.tag not in tags:
+                tags.append(order.tag)
+        merged = InternalOrder(first.Portfolio, first.Symbol, total, order_type=first.OrderType,
+                               limit_price=first.LimitPrice, stop_price=first.StopPrice, tag=", ".join(tags))
+        merged.Allocations = [(order.Portfolio, order.Quantity / total) for order in orders]
+        queued = [order.QueuedAt for order in orders if order.QueuedAt is not None]
+        merged.QueuedAt = min(queued) if queued else None
+        return merged
+
+    def OpenQuantity(self, portfolio, symbol):
+        """Portfolio's share of the unfilled quantity of the open market orders in symbol."""
+        return sum([(order.Quantity - order.Filled) * order.Share(portfolio) for order in self._submitted.values()
+                    if order.Symbol == symbol and order.OrderType in (OrderType.Market, OrderType.MarketOnOpen)])
+
+    def HeldQuantity(self, portfolio, symbol):
+        """Quantity of portfolio's buys in symbol that wait for cash."""
+        return sum([i.Quantity * i.Share(portfolio) for i in self.Held if i.Symbol == symbol])
 
-        qc.Log("sync done")
+    @classmethod
+    def _accept(cls, order):
+        risk = Singleton.Risk
+        if risk is not None:
+            reason = risk.Check(order)
+            if reason is not None:
+                Singleton.Log(f"Warning: Rejecting {order} of {order.Portfolio.Algorithm.Name}: {reason}")
+                return False
+        return True
+
+    def _cash_needed(self, order):
+        quantity = order.Quantity
+        if order.Symbol in self.Portfolio:
+            # filled from the unmanaged portfolio first
+            quantity -= max(self.Portfolio[order.Symbol].Quantity, 0.0)
+        return max(quantity, 0.0) * Singleton.Securities[order.Symbol].Price + order.EstimatedFee
+
+    def _release_held(self):
+        """Send the held buys that the cash allows; once their sells are done or HoldTimeout has passed,
+        drop those that still lack it."""
+        if not self.Held:
+            return
+        now = Singleton.QCAlgorithm.Time
+        cash = float(Singleton.QCAlgorithm.Portfolio.Cash)
+        held = []
+        for order in self.Held:
+            sells, expires = self.__holds[id(order)]
+            sells.intersection_update(self._submitted)
+            needed = self._cash_needed(order)
+            if needed <= cash or not sells and expires is None:
+                cash -= needed
+                del self.__holds[id(order)]
+                self.ExecuteOrder(order)
+            elif expires is None:
+                Singleton.Log(f"Holding {order} until {len(sells)} sells free {needed - cash:.2f}")
+                self.__holds[id(order)] = (sells, now + self.HoldTimeout)
+                held.append(order)
+            elif not sells or now >= expires:
+                Singleton.Log(f"Warning: Dropping held {order}, {needed:.2f} needed but {cash:.2f} available")
+                del self.__holds[id(order)]
+            else:
+                held.append(order)
+        self.Held = held
 
     # @accepts(self=object, order=InternalOrder)
     def ExecuteOrder(self, order):
@@ -435,7 +842,8 @@ class Broker(object):
 
         qc.Log(f"Executing order for {order.Quantity} from external brokerage")
         if not qc.LiveMode:
-            self._execute_order(order)
+            if Singleton.Execution is None or not Singleton.Execution.Accept(order):
+                self._execute_order(order)
 
     def _fill_order_from_portfolio(self, order):
         symbol = order.Symbol
@@ -443,10 +851,19 @@ class Broker(object):
         ask = order.Quantity
         existing = self.Portfolio[symbol].Quantity
         fill_qty = min(ask, existing)
-        self.Portfolio._fill_order(symbol, -fill_qty, price_per_share)
-        order.Portfolio._fill_order(symbol, fill_qty, price_per_share)
+        if fill_qty <= 0:
+            return
+        for portfolio, share in order.Shares:
+            self._cross(self.Portfolio, portfolio, symbol, fill_qty * share, price_per_share)
         order.Quantity -= fill_qty
 
+    def _cross(self, seller, buyer, symbol, quantity, price_per_share):
+        """Move quantity of symbol from seller to buyer at price_per_share without going to the market."""
+        seller._fill_order(symbol, -quantity, price_per_share, internal=True)
+        buyer._fill_order(symbol, quantity, price_per_share, internal=True)
+        if Singleton.Journal is not None:
+            Singleton.Journal.RecordInternalFill(seller, buyer, symbol, quantity, price_per_share)
+
     def _execute_order_from_portfolio_if_needed(self, order):
         if order.Symbol in self.Portfolio:
             self._fill_order_from_portfolio(order)
@@ -465,7 +882,8 @@ class Broker(object):
 
         market_is_open = Singleton.QCAlgorithm.Securities[symb.Value].Exchange.ExchangeOpen
 
-        # Submit order.
+        # Submit order; LEAN may block until a synchronous order is done.
+        order.SubmittedAt = Helper.timestamp()
         if order.OrderType == OrderType.Market:
             if market_is_open:
                 ticket = Singleton.QCAlgorithm.MarketOrder(symb, float(qty), False, order.tag)
@@ -484,35 +902,88 @@ class Broker(object):
         elif order.OrderType == OrderType.OptionExercise:
             ticket = Singleton.QCAlgorithm.OptionExerciseOrder(symb, float(qty), order.tag)
 
+        journal = Singleton.Journal
+        if journal is not None:
+            journal.RecordOrder(ticket.OrderId, order)
+
         # Handle synchronous orders
         order_is_done = Helper.is_order_done(ticket.Status)
         for order_event in ticket.OrderEvents:
-            if order_is_done:
-                order.Portfolio.ProcessFill(order_event, order)
-                order.Portfolio.Algorithm.OnOrderEvent(order_event)
-                order.Portfolio.Algorithm.TotalOrders += 1
-
-        if not order_is_done:
+            if journal is not None:
+                journal.RecordOrderEvent(order_event)
+            self._stamp_first_fill(order_event, order)
+            if order_is_done or order_event.Status == OrderStatus.PartiallyFilled:
+                self._fill_part(order_event, order)
+
+        if order_is_done:
+            self._done(order)
+        else:
             order.Ticket = ticket
             self._submitted[ticket.OrderId] = order
 
     @accepts(self=object, order_event=OrderEvent)
     def HandleOrderEvent(self, order_event):
         Singleton.Debug(f"> HandleOrderEvent (1): OrderEvent: {order_event}")
+        if Singleton.Journal is not None:
+            Singleton.Journal.RecordOrderEvent(order_event)
+        if Singleton.Reconciler is not None:
+            Singleton.Reconciler.MarkDirty(order_event.Symbol)
         order = self._submitted.pop(order_event.OrderId, None)
         if not order:
             Singleton.Debug(f"Could not find order id {order_event.OrderId} in queue: {self._submitted}")
             return
 
         Singleton.Debug(f"> HandleOrderEvent (2): Order: {order}")
+        self._stamp_first_fill(order_event, order)
         if Helper.is_order_done(order_event.Status):
-            order.Portfolio.ProcessFill(order_event, order)
-            order.Portfolio.Algorithm.OnOrderEvent(order_event)
-            order.Portfolio.Algorithm.TotalOrders += 1
+            self._process_fill(order_event, order)
 
         else:
+            if order_event.Status == OrderStatus.PartiallyFilled:
+                self._fill_part(order_event, order)
             # Re-add orders that are still open.
             self._submitted[order_event.OrderId] = order
 
+        if order.Quantity < 0:
+            self._release_held()
+
+    @classmethod
+    def _stamp_first_fill(cls, order_event, order):
+        if order.FirstFillAt is None and order_event.FillQuantity != 0:
+            order.FirstFillAt = Helper.timestamp()
+
+    def _process_fill(self, order_event, order):
+        self._fill_part(order_event, order)
+        self._done(order)
+
+    def _done(self, order):
+        """Account for an order once, when it is done."""
+        order.DoneAt = Helper.timestamp()
+        if order.Parent is not None:
+            order.Parent._child_done(order)
+        if Singleton.Latency is not None:
+            Singleton.Latency.Record(order)
+        for portfolio, _ in order.Shares:
+            if portfolio.Algorithm is not None:
+                portfolio.Algorithm.TotalOrders += 1
+
+    def _fill_part(self, order_event, order):
+        """Apply one fill of an order that may still be open."""
+        order.Filled += order_event.FillQuantity
+        if order.Parent is not None:
+            order.Parent.Filled += order_event.FillQuantity
+        if order.Allocations is None:
+            order.Portfolio.ProcessFill(order_event, order)
+        else:
+            fee = order_event.OrderFee.Value.Amount
+            for portfolio, share in order.Allocations:
+                portfolio._fill_order(order.Symbol, order_event.FillQuantity * share, order_event.FillPrice,
+                                      fee * share)
+        if Singleton.FeeModel is not None:
+            Singleton.FeeModel.RecordFill(order_event.FillQuantity, order_event.FillPrice)
+        for portfolio, _ in order.Shares:
+            if portfolio.Algorithm is not None:
+                portfolio.Algorithm.OnOrderEvent(order_event)
+
     def GetOrderIdsForPortfolio(self, matching_portfolio):
-        return [order_id for order_id, order in self._submitted.items() if order.Portfolio == matching_portfolio]
+        return [order_id for order_id, order in self._submitted.items() if order.Share(matching_portfolio) > 0]
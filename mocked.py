@@ -1,19 +1,125 @@
-from datetime import date
+import heapq
+from collections import deque
+from datetime import date, datetime, timedelta
 from decorators import accepts
 
 
 # pylint: disable=C0103,C0325,C0321,R0903,R0201,W0102,R0902,R0913,R0904,R0911
 
-TradeBar = 0
-RollingWindow = []
+class TradeBar(object):
+    def __init__(self, time=None, symbol=None, open=0.0, high=0.0, low=0.0, close=0.0, volume=0.0,
+                 period=timedelta(1)):
+        # pylint: disable=W0622
+        self.Time = time
+        self.Symbol = symbol
+        self.Open = open
+        self.High = high
+        self.Low = low
+        self.Close = close
+        self.Volume = volume
+        self.Period = period
+
+    @property
+    def EndTime(self):
+        return self.Time + self.Period
+
+    @property
+    def Value(self):
+        return self.Close
+
+class Generic(type):
+    """Allows RollingWindow[TradeBar](size) like the .NET generics."""
+    def __getitem__(cls, _item):
+        return cls
+
+class RollingWindow(metaclass=Generic):
+    def __init__(self, size):
+        self.Size = size
+        self.__items = deque(maxlen=size)
+
+    def Add(self, item):
+        self.__items.appendleft(item)
+
+    def __getitem__(self, i):
+        return self.__items[i]
+
+    def __iter__(self):
+        return iter(self.__items)
+
+    @property
+    def Count(self):
+        return len(self.__items)
+
+    @property
+    def IsReady(self):
+        return self.Count >= self.Size
+
+class Event(list):
+    def __iadd__(self, handler):
+        self.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self.remove(handler)
+        return self
+
+    def Fire(self, *args):
+        for handler in list(self):
+            handler(*args)
 
 class TradeBarConsolidator(object):
-    def __init__(self, _time_delta):
-        self.DataConsolidated = []
+    def __init__(self, time_delta):
+        self.Period = time_delta
+        self.DataConsolidated = Event()
+
+    def Update(self, bar):
+        self.DataConsolidated.Fire(self, bar)
 
 class SubscriptionManager(object):
-    def AddConsolidator(self, _symbol, _consolidator):
-        pass
+    def __init__(self):
+        self.Consolidators = {}
+
+    def AddConsolidator(self, symbol, consolidator):
+        self.Consolidators.setdefault(symbol, []).append(consolidator)
+
+    def RemoveConsolidator(self, symbol, consolidator):
+        self.Consolidators.get(symbol, []).remove(consolidator)
+
+class ScheduleRule(object):
+    def __init__(self, name):
+        self.Name = name
+
+class DateRules(object):
+    def EveryDay(self, symbol=None):
+        return ScheduleRule(f"EveryDay({symbol})" if symbol else "EveryDay")
+
+    def WeekStart(self, symbol=None):
+        return ScheduleRule(f"WeekStart({symbol})" if symbol else "WeekStart")
+
+    def MonthStart(self, symbol=None):
+        return ScheduleRule(f"MonthStart({symbol})" if symbol else "MonthStart")
+
+class TimeRules(object):
+    def At(self, hour, minute=0):
+        return ScheduleRule(f"At({hour:02d}:{minute:02d})")
+
+    def AfterMarketOpen(self, symbol, minutes=0):
+        return ScheduleRule(f"AfterMarketOpen({symbol},{minutes})")
+
+    def BeforeMarketClose(self, symbol, minutes=0):
+        return ScheduleRule(f"BeforeMarketClose({symbol},{minutes})")
+
+class ScheduleManager(object):
+    def __init__(self):
+        self.Events = []
+
+    def On(self, date_rule, time_rule, callback):
+        self.Events.append((date_rule, time_rule, callback))
+
+class SecurityChanges(object):
+    def __init__(self, added=None, removed=None):
+        self.AddedSecurities = added or []
+        self.RemovedSecurities = removed or []
 
 class Market(object):
     USA = 1
@@ -29,8 +135,9 @@ class Resolution(object):
     Second = 3
 
 class SymbolProperties(object):
-    @property
-    def LotSize(self): return 1.0
+    def __init__(self, lot_size=1.0, contract_multiplier=1.0):
+        self.LotSize = lot_size
+        self.ContractMultiplier = contract_multiplier
 
 class Settings(object):
     # @property
@@ -52,6 +159,10 @@ class Exchange(object):
     @property
     def ExchangeOpen(self): return True
 
+class Currency(object):
+    def __init__(self, symbol):
+        self.Symbol = symbol
+
 
 class Symbol(object):
     @classmethod
@@ -91,6 +202,15 @@ class Security(object):
         self.Open = self.Price
         self.Volume = 0.0
         self.SymbolProperties = SymbolProperties()
+        self.QuoteCurrency = Currency('USD')
+
+    @property
+    def BidPrice(self):
+        return self.Price
+
+    @property
+    def AskPrice(self):
+        return self.Price
 
     @property
     def Exchange(self):
@@ -103,10 +223,18 @@ class InternalSecurityManager(dict):
         for ticker, price in securities:
             self[ticker] = Security(ticker, price)
 
+    @property
+    def Keys(self):
+        return self.keys()
+
     @accepts(self=object, key=(Symbol, str), value=Security)
     def __setitem__(self, key, value):
         if isinstance(key, str):
             key = self.CreateSymbol(key)
+        if key in self:
+            # LEAN keeps one Security per symbol and updates it in place
+            super().__getitem__(key).__dict__.update(value.__dict__)
+            return None
         return super().__setitem__(key, value)
 
     @accepts(self=object, key=(Symbol, str))
@@ -183,6 +311,17 @@ class Order(object):
         self.AverageFillPrice = None
         self.QuantityFilled = None
         self.Value = 0
+        self.IsMarketable = False
+
+    @property
+    def Direction(self):
+        if self.Quantity > 0: return OrderDirection.Buy
+        elif self.Quantity < 0: return OrderDirection.Sell
+        return OrderDirection.Hold
+
+    @property
+    def AbsoluteQuantity(self):
+        return abs(self.Quantity)
 
     def ToString(self):
         return f"Order({self.Id}, {self.Status}, {OrderType.TypeToString(self.Type)}, {self.Symbol}, {self.Quantity})"
@@ -227,6 +366,10 @@ class OrderTicket(object):
     def OrderType(self):
         return self.Order.Type
 
+    @property
+    def Tag(self):
+        return self.Order.Tag
+
     @property
     def AverageFillPrice(self):
         return sum([event.FillPrice for event in self.OrderEvents]) / self.QuantityFilled
@@ -245,7 +388,7 @@ class OrderTicket(object):
         return self.__str__()
 
     def Cancel(self, tag=""):
-        pass
+        self.Status = OrderStatus.Canceled
 
 
 # class Amount(float):
@@ -271,14 +414,9 @@ class OrderTicket(object):
 #         return self.value
 
 
-class CashAmount(float):
-    @property
-    def Amount(self):
-        return self
-
 class OrderFee(object):
     def __init__(self, value):
-        self.Value = CashAmount(value)
+        self.Value = CashAmount(value, getattr(value, 'Currency', 'USD'))
 
 class OrderEvent(object):
     def __init__(self, order_id, symbol, quantity, price=None, status=OrderStatus.New):
@@ -311,8 +449,8 @@ class SecurityTransactionManager(dict):
         return self[order_id]
 
     # @accepts(self=object, order=InternalOrder)
-    def AddOrder(self, symbol, quantity, order_type=OrderType.Market, status=OrderStatus.New):
-        return OrderTicket(self.GetIncrementOrderId, symbol, quantity, order_type=order_type, status=status)
+    def AddOrder(self, symbol, quantity, order_type=OrderType.Market, status=OrderStatus.New, tag=""):
+        return OrderTicket(self.GetIncrementOrderId, symbol, quantity, order_type=order_type, status=status, tag=tag)
 
     @property
     def GetIncrementOrderId(self):
@@ -338,11 +476,36 @@ class SecurityTransactionManager(dict):
 
 
 class CashAmount(float):
+    def __new__(cls, amount, currency='USD'):
+        cash_amount = super().__new__(cls, amount)
+        cash_amount.Currency = currency
+        return cash_amount
+
     @property
     def Amount(self):
         return self
 
 
+class CoarseFundamental(object):
+    def __init__(self, symbol, price, volume, has_fundamental_data=True):
+        self.Symbol = symbol
+        self.Price = price
+        self.Volume = volume
+        self.DollarVolume = price * volume
+        self.HasFundamentalData = has_fundamental_data
+
+
+class OrderFeeParameters(object):
+    def __init__(self, security, order):
+        self.Security = security
+        self.Order = order
+
+
+class FeeModel(object):
+    def GetOrderFee(self, parameters):
+        return OrderFee(CashAmount(0.0, parameters.Security.QuoteCurrency.Symbol))
+
+
 class Cash(CashAmount):
     def __new__(cls, currency_symbol, amount, price=1.0):
         return super().__new__(cls, amount)
@@ -368,12 +531,139 @@ class SecurityPortfolioManager(dict):
         self.CashBook = CashBook()
         self.CashBook['USD'] = Cash('USD', 0.0, 1.0)
 
+class ObjectStore(dict):
+    def ContainsKey(self, key):
+        return key in self
+
+    def SaveBytes(self, key, contents):
+        self[key] = bytes(contents)
+        return True
+
+    def ReadBytes(self, key):
+        return self[key]
+
+    def Save(self, key, text):
+        self[key] = text
+        return True
+
+    def Read(self, key):
+        return self[key]
+
+    def Delete(self, key):
+        return self.pop(key, None) is not None
+
 class Time:
     TODAY = date(1, 1, 1)
     @classmethod
     def date(cls):
         return Time.TODAY
 
+class OrderBookSimulator(object):
+    '''Resting market, limit and stop orders per symbol, matched against every bar.
+
+    Buy limits sit in a heap by highest price and sell limits by lowest, stops by nearest trigger,
+    so each bar only touches the orders it crosses: O(log n) per fill. A bar fills at most
+    participation x its volume; the rest of a crossed order waits for the next bar. Fills are sent
+    to the algorithm's OnOrderEvent; canceled tickets are dropped when they reach the top.
+    '''
+
+    def __init__(self, algorithm, participation=0.1):
+        self.Algorithm = algorithm
+        self.Participation = participation
+        self.Books = {}
+        self.__sequence = 0
+
+    def __len__(self):
+        return sum([len(book[side]) for book in self.Books.values() for side in book])
+
+    def Submit(self, ticket, limit_price=None, stop_price=None):
+        book = self.Books.get(ticket.Symbol)
+        if book is None:
+            book = self.Books[ticket.Symbol] = {
+                "market": [], "buy_limit": [], "sell_limit": [], "buy_stop": [], "sell_stop": []}
+        buy = ticket.Quantity > 0
+        self.__sequence += 1
+        # [heap key, arrival, ticket, unfilled quantity, limit price]
+        entry = [0.0, self.__sequence, ticket, ticket.Quantity, limit_price]
+        if stop_price is not None:
+            entry[0] = stop_price if buy else -stop_price
+            heapq.heappush(book["buy_stop" if buy else "sell_stop"], entry)
+        elif limit_price is not None:
+            self._push_limit(book, entry)
+        else:
+            heapq.heappush(book["market"], entry)
+
+    @classmethod
+    def _push_limit(cls, book, entry):
+        buy = entry[3] > 0
+        entry[0] = -entry[4] if buy else entry[4]
+        heapq.heappush(book["buy_limit" if buy else "sell_limit"], entry)
+
+    def OnBar(self, symbol, bar):
+        book = self.Books.get(symbol)
+        if book is None:
+            return
+        capacity = bar.Volume * self.Participation if bar.Volume else float('inf')
+
+        # triggered stops become market or limit orders
+        for side, triggered in (("buy_stop", lambda stop: stop <= bar.High),
+                                ("sell_stop", lambda stop: -stop >= bar.Low)):
+            heap = book[side]
+            while heap and triggered(heap[0][0]):
+                entry = heapq.heappop(heap)
+                if entry[2].Status == OrderStatus.Canceled:
+                    continue
+                stop = abs(entry[0])
+                trigger = max(stop, bar.Open) if entry[3] > 0 else min(stop, bar.Open)
+                limit = entry[4]
+                if limit is None or (limit >= trigger if entry[3] > 0 else limit <= trigger):
+                    heapq.heappush(book["market"], [0.0, entry[1], entry[2], entry[3], trigger])
+                else:
+                    self._push_limit(book, entry)
+
+        market = book["market"]
+        while market and capacity > 0:
+            price = market[0][4] if market[0][4] is not None else bar.Open
+            capacity = self._fill(market, symbol, price, capacity)
+
+        buy_limit, sell_limit = book["buy_limit"], book["sell_limit"]
+        while buy_limit and -buy_limit[0][0] >= bar.Low and capacity > 0:
+            capacity = self._fill(buy_limit, symbol, min(-buy_limit[0][0], bar.Open), capacity)
+        while sell_limit and sell_limit[0][0] <= bar.High and capacity > 0:
+            capacity = self._fill(sell_limit, symbol, max(sell_limit[0][0], bar.Open), capacity)
+
+    def _fill(self, heap, symbol, price, capacity):
+        """Fill the top of heap as far as capacity allows; returns the capacity left."""
+        entry = heap[0]
+        ticket = entry[2]
+        if ticket.Status == OrderStatus.Canceled:
+            heapq.heappop(heap)
+            return capacity
+        quantity = entry[3] if abs(entry[3]) <= capacity else (capacity if entry[3] > 0 else -capacity)
+        entry[3] -= quantity
+        status = OrderStatus.PartiallyFilled if entry[3] else OrderStatus.Filled
+        if not entry[3]:
+            heapq.heappop(heap)
+
+        order_event = OrderEvent(ticket.OrderId, symbol, quantity, float(price), status=status)
+        order_event.FillQuantity = quantity
+        ticket.OrderEvents.append(order_event)
+        ticket.Status = status
+        self.Algorithm.OnOrderEvent(order_event)
+        return capacity - abs(quantity)
+
+
+class MarketImpactModel(object):
+    '''Fill price moved against the order in proportion to the share of volume it takes.'''
+
+    def __init__(self, coefficient=0.1, volume=1e6):
+        self.Coefficient = coefficient
+        self.Volume = volume
+
+    def FillPrice(self, security, quantity):
+        volume = security.Volume or self.Volume
+        return security.Price * (1.0 + self.Coefficient * quantity / volume)
+
 # Dummy interface.
 class QCAlgorithm(object):
     def __init__(self, default_order_status=OrderStatus.Submitted):
@@ -384,7 +674,17 @@ class QCAlgorithm(object):
         self.IsWarmingUp = False
         self.SetBrokerageModel = BrokerageName.Default
         self.Time = Time
+        self.ObjectStore = ObjectStore()
+        self.SubscriptionManager = SubscriptionManager()
+        self.Schedule = ScheduleManager()
+        self.DateRules = DateRules()
+        self.TimeRules = TimeRules()
+        self.StartDate = datetime(1, 1, 1)
         self._default_order_status = default_order_status
+        # fills market and marketable limit orders at once when set, e.g. to a MarketImpactModel
+        self.FillModel = None
+        # otherwise an OrderBookSimulator fills orders against the bars of LocalEngine
+        self.OrderBook = None
         self._algorithms = []
         self._benchmarks = []
         self._warm_up = None
@@ -393,8 +693,11 @@ class QCAlgorithm(object):
 
     def Initialize(self): pass
     def OnWarmupFinished(self): pass
+    def OnData(self, data): pass
+    def OnEndOfDay(self): pass
+    def OnEndOfAlgorithm(self): pass
     def SetCash(self, cash): pass
-    def SetStartDate(self, year, month, day): pass
+    def SetStartDate(self, year, month, day): self.StartDate = datetime(year, month, day)
     def SetEndDate(self, year, month, day): pass
     def SetWarmUp(self, period): pass
     def OnOrderEvent(self, order_event): pass
@@ -413,33 +716,41 @@ class QCAlgorithm(object):
     def AddCrypto(self, ticker, resolution):
         return self.AddSecurity(None, ticker, None)
 
-    def _mockOrder(self, symbol, quantity, order_type):
+    def _mockOrder(self, symbol, quantity, order_type, limit_price=None, stop_price=None, tag=""):
         ticket = self.Transactions.AddOrder(symbol, quantity, order_type=order_type,
-                                            status=self._default_order_status)
+                                            status=self._default_order_status, tag=tag)
         ticket.Status = OrderStatus.Submitted
         self.Transactions[ticket.OrderId] = ticket
+        if self.FillModel is not None and order_type in (OrderType.Market, OrderType.Limit):
+            price = self.FillModel.FillPrice(self.Securities[symbol], quantity)
+            if limit_price is None or (price <= limit_price if quantity > 0 else price >= limit_price):
+                ticket.OrderEvents.append(OrderEvent(ticket.OrderId, symbol, quantity, price, status=OrderStatus.Filled))
+                ticket.Status = OrderStatus.Filled
+        elif self.OrderBook is not None and order_type in (OrderType.Market, OrderType.Limit,
+                                                           OrderType.StopMarket, OrderType.StopLimit):
+            self.OrderBook.Submit(ticket, limit_price=limit_price, stop_price=stop_price)
         return ticket
 
-    def MarketOrder(self, symbol, quantity, _asynchronous, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.Market)
+    def MarketOrder(self, symbol, quantity, _asynchronous, tag):
+        return self._mockOrder(symbol, quantity, OrderType.Market, tag=tag)
 
-    def LimitOrder(self, symbol, quantity, _limit_price, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.Limit)
+    def LimitOrder(self, symbol, quantity, limit_price, tag):
+        return self._mockOrder(symbol, quantity, OrderType.Limit, limit_price=limit_price, tag=tag)
 
-    def StopMarketOrder(self, symbol, quantity, _stop_price, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.StopMarket)
+    def StopMarketOrder(self, symbol, quantity, stop_price, tag):
+        return self._mockOrder(symbol, quantity, OrderType.StopMarket, stop_price=stop_price, tag=tag)
 
-    def StopLimitOrder(self, symbol, quantity, _stop_price, _limit_price, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.StopLimit)
+    def StopLimitOrder(self, symbol, quantity, stop_price, limit_price, tag):
+        return self._mockOrder(symbol, quantity, OrderType.StopLimit, limit_price=limit_price, stop_price=stop_price, tag=tag)
 
-    def MarketOnOpenOrder(self, symbol, quantity, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.MarketOnOpen)
+    def MarketOnOpenOrder(self, symbol, quantity, tag):
+        return self._mockOrder(symbol, quantity, OrderType.MarketOnOpen, tag=tag)
 
-    def MarketOnCloseOrder(self, symbol, quantity, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.MarketOnClose)
+    def MarketOnCloseOrder(self, symbol, quantity, tag):
+        return self._mockOrder(symbol, quantity, OrderType.MarketOnClose, tag=tag)
 
-    def OptionExerciseOrder(self, symbol, quantity, _tag):
-        return self._mockOrder(symbol, quantity, OrderType.OptionExercise)
+    def OptionExerciseOrder(self, symbol, quantity, tag):
+        return self._mockOrder(symbol, quantity, OrderType.OptionExercise, tag=tag)
 
     def SetHoldings(self, symbol, percentage, liquidateExistingHoldings=False, tag=""):
         pass
@@ -458,8 +769,56 @@ class SeriesType(object):
     Flag = 5
 
 class Series(object):
-    def __init__(self, chart, series, seriesType, unit): pass
+    def __init__(self, name, seriesType=SeriesType.Line, unit=''): pass
 
 class Chart(object):
     def __init__(self, name): pass
     def AddSeries(self, series): pass
+
+class Slice(dict):
+    @property
+    def Bars(self):
+        return self
+
+    def ContainsKey(self, symbol):
+        return symbol in self
+
+# Minimal stand-in for LEAN's backtesting loop.
+class LocalEngine(object):
+    def __init__(self, algorithm):
+        self.Algorithm = algorithm
+
+    def _update_security(self, symbol, bar):
+        security = self.Algorithm.Securities[symbol]
+        security.Open = bar.Open
+        security.High = bar.High
+        security.Low = bar.Low
+        security.Close = bar.Close
+        security.Price = bar.Close
+        security.Volume = bar.Volume
+
+    def Step(self, time, bars):
+        """Advance to time and deliver {symbol: TradeBar}."""
+        algorithm = self.Algorithm
+        algorithm.Time = time
+        for symbol, bar in bars.items():
+            self._update_security(symbol, bar)
+            for consolidator in algorithm.SubscriptionManager.Consolidators.get(symbol, []):
+                consolidator.Update(bar)
+        if algorithm.OrderBook is not None:
+            for symbol, bar in bars.items():
+                algorithm.OrderBook.OnBar(symbol, bar)
+        algorithm.OnData(Slice(bars))
+
+    def Run(self, steps):
+        """Run (time, {symbol: TradeBar}) steps, calling OnEndOfDay whenever the date changes."""
+        algorithm = self.Algorithm
+        today = None
+        for time, bars in steps:
+            if today is not None and time.date() != today:
+                algorithm.OnEndOfDay()
+            today = time.date()
+            self.Step(time, bars)
+        if today is not None:
+            algorithm.OnEndOfDay()
+        algorithm.OnEndOfAlgorithm()
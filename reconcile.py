@@ -0,0 +1,111 @@
+# pylint: disable=C0111,C0103,R0903
+from math import isclose
+from market import Position, Cash, ConversionRates
+from singleton import Singleton
+
+
+class Reconciler(object):
+    '''Running totals of all algorithm portfolios plus the broker's unmanaged one.
+
+    Every fill updates the totals and marks its symbol dirty, as does every order event the
+    brokerage reports, so Reconcile only compares the symbols that changed since the last call.
+    Cash is kept per currency, and CashDrift is the drift of all of them in the account currency.
+    With adjust=True, drift is absorbed by the broker's unmanaged portfolio.
+    '''
+
+    def __init__(self, adjust=False, tolerance=1e-6, currency='USD'):
+        self.Adjust = adjust
+        self.Tolerance = tolerance
+        self.Currency = currency
+        self.Quantities = {}
+        self.CashBook = {}
+        self.CashDrift = 0.0
+        self.CashDrifts = {}
+        self.__dirty = set()
+
+    @property
+    def Cash(self):
+        """Total managed cash in the account currency."""
+        if not self.CashBook:
+            return 0.0
+        return ConversionRates.Instance().Convert(list(self.CashBook.values()), list(self.CashBook.keys()))
+
+    @property
+    def Dirty(self):
+        return set(self.__dirty)
+
+    def Rebuild(self, portfolios):
+        """Recompute the totals from scratch, e.g. after the warm-up moved cash and positions around."""
+        self.Quantities = {}
+        self.CashBook = {}
+        for portfolio in portfolios:
+            for currency, amount in portfolio.CashBook.items():
+                self.CashBook[currency] = self.CashBook.get(currency, 0.0) + amount
+            for symbol, position in portfolio.items():
+                self.Quantities[symbol] = self.Quantities.get(symbol, 0.0) + position.Quantity
+        self.__dirty = set(self.Quantities)
+
+    def RecordFill(self, symbol, quantity, cash, currency=None):
+        currency = currency or self.Currency
+        self.Quantities[symbol] = self.Quantities.get(symbol, 0.0) + quantity
+        self.CashBook[currency] = self.CashBook.get(currency, 0.0) + cash
+        self.__dirty.add(symbol)
+
+    def MarkDirty(self, symbol):
+        self.__dirty.add(symbol)
+
+    def Reconcile(self, broker=None, full=False):
+        """Brokerage minus managed quantity of every dirty symbol (all of them with full=True) that drifted."""
+        qc = Singleton.QCAlgorithm
+        holdings = qc.Portfolio
+        symbols = set(self.Quantities).union(holdings.keys()) if full else self.__dirty
+        self.__dirty = set()
+
+        drift = {}
+        for symbol in symbols:
+            actual = holdings[symbol].Quantity if symbol in holdings else 0.0
+            expected = self.Quantities.get(symbol, 0.0)
+            if not isclose(actual, expected, abs_tol=self.Tolerance):
+                drift[symbol] = actual - expected
+        # only currencies held as cash; the brokerage also lists e.g. BTC, which is a BTCUSD holding here
+        cashbook = qc.Portfolio.CashBook
+        self.CashDrifts = {}
+        for currency, expected in self.CashBook.items():
+            actual = cashbook[currency].Amount if currency in cashbook else 0.0
+            if not isclose(actual, expected, abs_tol=self.Tolerance):
+                self.CashDrifts[currency] = actual - expected
+        self.CashDrift = ConversionRates.Instance().Convert(list(self.CashDrifts.values()),
+                                                            list(self.CashDrifts.keys()))
+
+        for symbol, quantity in drift.items():
+            qc.Log(f"Reconcile: {symbol} drifted by {quantity}")
+        for currency, amount in self.CashDrifts.items():
+            qc.Log(f"Reconcile: {currency} drifted by {amount}")
+
+        if self.Adjust:
+            self._absorb(broker or Singleton.Broker, drift)
+        return drift
+
+    def _absorb(self, broker, drift):
+        portfolio = broker.Portfolio
+        for symbol, quantity in drift.items():
+            position = portfolio.get(symbol)
+            if position is None:
+                if quantity < 0:
+                    Singleton.Error(f"Reconcile: cannot absorb {quantity} {symbol}, no unmanaged position")
+                    continue
+                price = Singleton.QCAlgorithm.Securities[symbol].Price
+                portfolio[symbol] = Position(symbol, quantity, price)
+            elif position.Quantity + quantity < -self.Tolerance:
+                Singleton.Error(f"Reconcile: cannot absorb {quantity} {symbol}, unmanaged position is {position.Quantity}")
+                continue
+            else:
+                position.Quantity += quantity
+            self.Quantities[symbol] = self.Quantities.get(symbol, 0.0) + quantity
+
+        for currency, amount in self.CashDrifts.items():
+            cash = Cash(currency, portfolio.CashBook.get(currency, 0.0) + amount)
+            portfolio.CashBook[currency] = cash
+            if currency == portfolio.CashBook.AccountCurrency:
+                portfolio.Cash = cash
+            self.CashBook[currency] += amount
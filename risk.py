@@ -0,0 +1,102 @@
+# pylint: disable=C0111,C0103,R0903
+from singleton import Singleton
+
+# scope of the limits and aggregates over all algorithms
+GLOBAL = None
+
+
+class RiskLimits(object):
+    '''Pre-trade limits; None disables a limit.
+
+    Weights, gross exposure and daily turnover are fractions of equity; order notional is in
+    the account currency.
+    '''
+
+    def __init__(self, max_position_weight=None, max_gross_exposure=None, max_daily_turnover=None,
+                 max_order_notional=None):
+        self.MaxPositionWeight = max_position_weight
+        self.MaxGrossExposure = max_gross_exposure
+        self.MaxDailyTurnover = max_daily_turnover
+        self.MaxOrderNotional = max_order_notional
+
+
+class RiskEngine(object):
+    '''Checks every order against per-algorithm and global limits in O(1).
+
+    Exposures are rebuilt from the portfolios once a day and then moved by every accepted order,
+    at the price it was checked at, so a burst of orders sees the ones before it. Orders that
+    reduce exposure always pass.
+    '''
+
+    def __init__(self, limits=None):
+        self.Limits = limits
+        self.AlgorithmLimits = {}
+        self.Exposure = {}
+        self.Gross = {}
+        self.Equity = {}
+        self.Turnover = {}
+        self.Rejected = 0
+
+    def SetLimits(self, name, limits):
+        self.AlgorithmLimits[name] = limits
+
+    def Rebuild(self, portfolios):
+        """Aggregate the exposures of the algorithm portfolios at current prices and start a new day of turnover."""
+        self.Exposure = {}
+        self.Gross = {GLOBAL: 0.0}
+        self.Equity = {GLOBAL: 0.0}
+        self.Turnover = {GLOBAL: 0.0}
+        for portfolio in portfolios:
+            name = portfolio.Algorithm.Name
+            self.Gross[name] = 0.0
+            self.Equity[name] = portfolio.CashBook.TotalValueInAccountCurrency
+            self.Turnover[name] = 0.0
+            for symbol, position in portfolio.items():
+                notional = position.Quantity * position.Security.Price
+                for scope in (name, GLOBAL):
+                    self.Exposure[(scope, symbol)] = self.Exposure.get((scope, symbol), 0.0) + notional
+                    self.Gross[scope] += abs(notional)
+                self.Equity[name] += notional
+            self.Equity[GLOBAL] += self.Equity[name]
+
+    def Check(self, order):
+        """None if order is within limits, otherwise the reason; accepted orders update the exposures."""
+        algorithm = order.Portfolio.Algorithm
+        if algorithm is None:
+            return None
+        name = algorithm.Name
+        symbol = order.Symbol
+        notional = order.Quantity * Singleton.QCAlgorithm.Securities[symbol].Price
+
+        for scope, limits in ((name, self.AlgorithmLimits.get(name)), (GLOBAL, self.Limits)):
+            if limits is not None:
+                reason = self._check(scope, limits, symbol, notional)
+                if reason is not None:
+                    self.Rejected += 1
+                    return f"global {reason}" if scope is GLOBAL else reason
+
+        for scope in (name, GLOBAL):
+            old = self.Exposure.get((scope, symbol), 0.0)
+            self.Exposure[(scope, symbol)] = old + notional
+            self.Gross[scope] = self.Gross.get(scope, 0.0) - abs(old) + abs(old + notional)
+            self.Turnover[scope] = self.Turnover.get(scope, 0.0) + abs(notional)
+        return None
+
+    def _check(self, scope, limits, symbol, notional):
+        old = self.Exposure.get((scope, symbol), 0.0)
+        new = old + notional
+        if abs(new) <= abs(old):
+            return None
+
+        equity = self.Equity.get(scope, 0.0)
+        if limits.MaxOrderNotional is not None and abs(notional) > limits.MaxOrderNotional:
+            return f"order notional {abs(notional):.2f} exceeds {limits.MaxOrderNotional:.2f}"
+        if limits.MaxPositionWeight is not None and abs(new) > limits.MaxPositionWeight * equity:
+            return f"{symbol} exposure {abs(new):.2f} exceeds {limits.MaxPositionWeight:.2%} of equity {equity:.2f}"
+        gross = self.Gross.get(scope, 0.0) - abs(old) + abs(new)
+        if limits.MaxGrossExposure is not None and gross > limits.MaxGrossExposure * equity:
+            return f"gross exposure {gross:.2f} exceeds {limits.MaxGrossExposure:.2f} x equity"
+        turnover = self.Turnover.get(scope, 0.0) + abs(notional)
+        if limits.MaxDailyTurnover is not None and turnover > limits.MaxDailyTurnover * equity:
+            return f"daily turnover {turnover:.2f} exceeds {limits.MaxDailyTurnover:.2f} x equity"
+        return None
@@ -1,13 +1,31 @@
 from datetime import timedelta, date
+from types import MethodType
 import bisect
 
 class SingletonMeta(type):
     def __getattr__(cls, attr):
-        """Delegate to parent."""
-        if hasattr(cls.QCAlgorithm, attr):
-            return getattr(cls.QCAlgorithm, attr)
+        """Delegate to parent, and keep the result until it is invalidated.
+
+        Bound methods stay valid until the next Setup. Values are kept only while parent's Time stays the
+        same, so that callbacks LEAN makes outside the manager, such as consolidator handlers, see fresh values.
+        """
+        parent = cls.QCAlgorithm
+        if attr.startswith('_') or attr == 'Time':
+            return getattr(parent, attr)
+        values = cls._delegated_values
+        time = parent.Time
+        if time != cls._delegated_time:
+            values.clear()
+            cls._delegated_time = time
+        elif attr in values:
+            return values[attr]
+        value = getattr(parent, attr)
+        if isinstance(value, MethodType):
+            type.__setattr__(cls, attr, value)
+            cls._delegated_methods.append(attr)
         else:
-            raise AttributeError(attr)
+            values[attr] = value
+        return value
 
 
 class Singleton(metaclass=SingletonMeta):
@@ -17,21 +35,70 @@ class Singleton(metaclass=SingletonMeta):
 
     Today = date(1, 1, 1)
     QCAlgorithm = None
+    FeeModel = None
+    Journal = None
+    Latency = None
+    Ledger = None
+    Reconciler = None
+    ConversionRates = None
+    Risk = None
+    Execution = None
+    Consolidators = None
+    # Security of every symbol a Position resolved, until the universe changes
+    SecurityCache = {}
+    Email = None
+    EmailTransport = None
     LogLevel = LOG
     _log_level_dates = []
     _warm_up = None
     _warm_up_from_algorithm = False
+    _delegated_methods = []
+    _delegated_values = {}
+    _delegated_time = None
+    _schedules = {}
 
     @classmethod
-    def Setup(cls, parent, broker=None, email_addr=None, log_level=LOG):
+    def Setup(cls, parent, broker=None, email_addr=None, log_level=LOG, fee_model=None, latency=None,
+              email_transport=None, ledger=None):
+        cls.Invalidate()
         cls.Today = date(1, 1, 1)
         cls.QCAlgorithm = parent
         cls.Broker = broker
+        cls.FeeModel = fee_model
+        cls.Journal = None
+        cls.Latency = latency
+        cls.Ledger = ledger
+        cls.Reconciler = None
+        cls.ConversionRates = None
+        cls.Risk = None
+        cls.Execution = None
+        cls.Consolidators = None
+        cls.SecurityCache = {}
+        cls._schedules = {}
         cls.LogLevel = log_level
         cls._warm_up = None
         cls._warm_up_from_algorithm = False
         cls._lot_size_decimal_places = None
-        cls.Email = Email(email_addr) if email_addr else None
+        cls.EmailTransport = email_transport
+        cls.Email = Digest(email_addr, transport=email_transport) if email_addr else None
+
+    @classmethod
+    def InvalidateStep(cls):
+        """Forget delegated values; called whenever LEAN enters the manager."""
+        cls._delegated_values.clear()
+        cls._delegated_time = None
+
+    @classmethod
+    def Invalidate(cls, attr=None):
+        """Forget one delegated attribute, or all of them."""
+        names = list(cls._delegated_methods) if attr is None else [attr] if attr in cls._delegated_methods else []
+        for name in names:
+            type.__delattr__(cls, name)
+            cls._delegated_methods.remove(name)
+        if attr is None:
+            cls.InvalidateStep()
+        else:
+            cls._delegated_values.pop(attr, None)
 
     @classmethod
     def _update_time(cls):
@@ -100,11 +167,38 @@ class Singleton(metaclass=SingletonMeta):
         if not cls._warm_up or period > cls._warm_up:
             cls._set_warm_up(period)
 
+    @classmethod
+    def ShortenWarmUp(cls, period):
+        """Lower the warm-up, e.g. once indicator state was restored."""
+        period = cls._convert_period_to_int(period)
+        if cls._warm_up is None or period < cls._warm_up:
+            cls._set_warm_up(period)
+
+
+class NotifyTransport(object):
+    def Send(self, address, subject, body):
+        Singleton.QCAlgorithm.Notify.Email(address, subject, body)
+
+
+class FileTransport(object):
+    '''Local stand-in for Notify.Email that appends every message to a file.'''
+
+    def __init__(self, path):
+        self.Path = path
+        self.Sent = 0
+
+    def Send(self, address, subject, body):
+        with open(self.Path, 'a') as f:
+            f.write(f"To: {address}\nSubject: {subject}\n\n{body}\n\n")
+        self.Sent += 1
+
 
 class Email(object):
     def __init__(self):
         self.__address = None
-        self.Content = ""
+        self.__rows = []
+        # row index of each key, so that later values replace earlier ones
+        self.__keys = {}
 
     def SetEmailAddress(self, email_addr):
         self.__address = email_addr
@@ -112,21 +206,68 @@ class Email(object):
     def AppendText(self, text):
         if not self.__address:
             return
-        self.Content += f"<tr><td colspan=\"2\">{text}</td></tr>\n"
+        self.__rows.append((None, text))
 
     def AppendKeyValue(self, key, value):
         if not self.__address:
             return
-        self.Content += f"<tr><td>{key}</td><td>{value}</td></tr>\n"
+        key = str(key)
+        index = self.__keys.get(key)
+        if index is None:
+            self.__keys[key] = len(self.__rows)
+            self.__rows.append((key, value))
+        else:
+            self.__rows[index] = (key, value)
 
     @property
     def HasContent(self):
-        return bool(self.Content)
+        return bool(self.__rows)
+
+    @property
+    def Content(self):
+        return "".join(f"<tr><td colspan=\"2\">{value}</td></tr>\n" if key is None else
+                       f"<tr><td>{key}</td><td>{value}</td></tr>\n"
+                       for key, value in self.__rows)
+
+    def Clear(self):
+        self.__rows = []
+        self.__keys = {}
 
-    def Send(self, subject):
+    def Send(self, subject, transport=None):
         Singleton.Debug(f"> Sending email \"{subject}\"")
         if not self.__address:
             return
         body = "<html><body><table>" + self.Content + "</table></body></html>"
-        self.Content = ""
-        Singleton.QCAlgorithm.Notify.Email(self.__address, subject, body)
+        self.Clear()
+        (transport or NotifyTransport()).Send(self.__address, subject, body)
+
+
+class Digest(object):
+    '''Sends the Email content of all algorithms as one notification.'''
+
+    def __init__(self, address, transport=None, interval=timedelta(days=1)):
+        self.Address = address
+        self.Transport = transport or NotifyTransport()
+        self.Interval = interval
+        self.LastSent = None
+
+    def Send(self, subject, sections, force=False):
+        """sections: [(title, Email)]; returns whether a notification went out.
+
+        Unless forced, at most one is sent per interval and the rest stays queued for the next one.
+        """
+        sections = [(title, email) for title, email in sections if email.HasContent]
+        if not sections:
+            return False
+        now = Singleton.QCAlgorithm.Time
+        if not force and self.LastSent is not None and now - self.LastSent < self.Interval:
+            return False
+
+        Singleton.Debug(f"> Sending digest \"{subject}\"")
+        body = "".join(f"<h3>{title}</h3><table>{email.Content}</table>\n" for title, email in sections)
+        for _, email in sections:
+            email.Clear()
+        self.Transport.Send(self.Address, subject, "<html><body>" + body + "</body></html>")
+        if not force:
+            self.LastSent = now
+        return True
@@ -0,0 +1,461 @@
+# pylint: disable=C0321,W0401,W0614
+try: QCAlgorithm
+except NameError: from mocked import *
+
+import struct
+from datetime import datetime, timedelta
+from math import isclose
+from market import ISymbolDict, Position, InternalOrder, Cash, FIFO
+from singleton import Singleton
+
+# pylint: disable=C0111,C0103,R0903,R0913
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class BinaryWriter(object):
+    def __init__(self):
+        self.__chunks = []
+
+    def Int(self, value):
+        self.__chunks.append(struct.pack('<q', value))
+
+    def Float(self, value):
+        self.__chunks.append(struct.pack('<d', value))
+
+    def OptionalFloat(self, value):
+        self.Bool(value is not None)
+        if value is not None:
+            self.Float(value)
+
+    def Bool(self, value):
+        self.__chunks.append(struct.pack('<?', value))
+
+    def Time(self, value):
+        self.Float((value - EPOCH).total_seconds())
+
+    def String(self, value):
+        self.Bytes(value.encode('utf-8'))
+
+    def Bytes(self, value):
+        self.__chunks.append(struct.pack('<I', len(value)))
+        self.__chunks.append(bytes(value))
+
+    def Raw(self, value):
+        self.__chunks.append(value)
+
+    def Value(self):
+        return b''.join(self.__chunks)
+
+
+class BinaryReader(object):
+    def __init__(self, data, offset=0, version=None):
+        self.__data = data
+        self.Offset = offset
+        # format version of the snapshot or journal being read, for fields added later
+        self.Version = version
+
+    def __unpack(self, fmt):
+        value, = struct.unpack_from(fmt, self.__data, self.Offset)
+        self.Offset += struct.calcsize(fmt)
+        return value
+
+    def Int(self):
+        return self.__unpack('<q')
+
+    def Float(self):
+        return self.__unpack('<d')
+
+    def OptionalFloat(self):
+        return self.Float() if self.Bool() else None
+
+    def Bool(self):
+        return self.__unpack('<?')
+
+    def Time(self):
+        return EPOCH + timedelta(seconds=self.Float())
+
+    def String(self):
+        return self.Bytes().decode('utf-8')
+
+    def Bytes(self):
+        size = self.__unpack('<I')
+        value = self.__data[self.Offset:self.Offset + size]
+        self.Offset += size
+        return value
+
+    def Raw(self, size):
+        value = self.__data[self.Offset:self.Offset + size]
+        self.Offset += size
+        return value
+
+    @property
+    def AtEnd(self):
+        return self.Offset >= len(self.__data)
+
+
+class Snapshot(object):
+    '''Versioned binary image of the manager's accounting state.
+
+    Layout: magic, version, algorithm time, then tagged sections
+    (tag, length, payload) so that readers can skip unknown sections.
+    '''
+    MAGIC = b'LAMS'
+    VERSION = 3
+
+    METRICS = 1
+    ALGORITHM = 2
+    UNMANAGED = 3
+    SUBMITTED = 4
+    ROLLING_WINDOWS = 5
+    ALLOCATIONS = 6
+    FILLED = 7
+
+    def __init__(self, time=None):
+        self.Time = time
+        self.Metrics = {}
+        self.Sections = []
+
+    @classmethod
+    def Dump(cls, time, algorithms, broker, metrics, submitted=True):
+        writer = BinaryWriter()
+        writer.Raw(cls.MAGIC)
+        writer.Int(cls.VERSION)
+        writer.Time(time)
+
+        section = BinaryWriter()
+        for key, value in metrics.items():
+            if value is not None:
+                section.String(key)
+                section.Float(value)
+        cls._write_section(writer, cls.METRICS, section)
+
+        owners = {}
+        for index, algorithm in enumerate(algorithms):
+            owners[id(algorithm.Portfolio)] = index
+            section = BinaryWriter()
+            section.String(algorithm.Name)
+            section.OptionalFloat(algorithm.Allocation)
+            section.Int(algorithm.TotalOrders)
+            cls._write_portfolio(section, algorithm.Portfolio)
+            cls._write_section(writer, cls.ALGORITHM, section)
+
+        section = BinaryWriter()
+        cls._write_portfolio(section, broker.Portfolio)
+        cls._write_section(writer, cls.UNMANAGED, section)
+
+        section = BinaryWriter()
+        for order_id, order in (broker._submitted.items() if submitted else ()):
+            section.Int(order_id)
+            section.Int(owners.get(id(order.Portfolio), -1))
+            section.String(order.Symbol.Value)
+            section.Float(order.Quantity)
+            section.Int(order.OrderType)
+            section.OptionalFloat(order.LimitPrice)
+            section.OptionalFloat(order.StopPrice)
+            section.String(order.tag)
+        cls._write_section(writer, cls.SUBMITTED, section)
+
+        section = BinaryWriter()
+        for order_id, order in (broker._submitted.items() if submitted else ()):
+            if order.Allocations is None:
+                continue
+            section.Int(order_id)
+            section.Int(len(order.Allocations))
+            for portfolio, share in order.Allocations:
+                section.Int(owners.get(id(portfolio), -1))
+                section.Float(share)
+        cls._write_section(writer, cls.ALLOCATIONS, section)
+
+        section = BinaryWriter()
+        for order_id, order in (broker._submitted.items() if submitted else ()):
+            if order.Filled != 0:
+                section.Int(order_id)
+                section.Float(order.Filled)
+        cls._write_section(writer, cls.FILLED, section)
+
+        for algorithm in algorithms:
+            rolling_windows = getattr(algorithm, "RollingWindows", [])
+            if not rolling_windows:
+                continue
+            section = BinaryWriter()
+            section.String(algorithm.Name)
+            section.Int(len(rolling_windows))
+            for symbol, rolling_window in rolling_windows:
+                cls._write_rolling_window(section, symbol, rolling_window)
+            cls._write_section(writer, cls.ROLLING_WINDOWS, section)
+
+        return writer.Value()
+
+    @classmethod
+    def _write_rolling_window(cls, writer, symbol, rolling_window):
+        writer.String(getattr(symbol, "Value", symbol))
+        writer.Int(rolling_window.Size)
+        writer.Int(rolling_window.Count)
+        # oldest first, in the order they have to be added back
+        for i in reversed(range(rolling_window.Count)):
+            bar = rolling_window[i]
+            writer.Time(bar.Time)
+            writer.Float(bar.Period.total_seconds())
+            writer.Float(bar.Open)
+            writer.Float(bar.High)
+            writer.Float(bar.Low)
+            writer.Float(bar.Close)
+            writer.Float(bar.Volume)
+
+    @classmethod
+    def _write_section(cls, writer, tag, section):
+        writer.Int(tag)
+        writer.Bytes(section.Value())
+
+    @classmethod
+    def _write_portfolio(cls, writer, portfolio):
+        writer.Float(portfolio.Cash)
+        writer.Float(portfolio.UnsettledCash)
+        writer.Float(portfolio.Cost)
+        positions = [pos for pos in portfolio.values()
+                     if pos.Quantity != 0 or pos.TotalFees != 0 or pos.RealizedProfit != 0]
+        writer.Int(len(positions))
+        for pos in positions:
+            writer.String(pos.Symbol.Value)
+            writer.Float(pos.Quantity)
+            writer.Float(pos.AveragePrice)
+            writer.Float(pos.TotalFees)
+            # since version 2
+            writer.Float(pos.RealizedProfit)
+            lots = pos.Lots if pos.CostBasis == FIFO else []
+            writer.Int(len(lots))
+            for quantity, price in lots:
+                writer.Float(quantity)
+                writer.Float(price)
+        # since version 3, Cash above is the account currency's entry
+        cashbook = portfolio.CashBook
+        writer.String(cashbook.AccountCurrency)
+        other = [(currency, amount) for currency, amount in cashbook.items() if currency != cashbook.AccountCurrency]
+        writer.Int(len(other))
+        for currency, amount in other:
+            writer.String(currency)
+            writer.Float(amount)
+
+    @classmethod
+    def Load(cls, data, algorithms, broker, unmanaged=True):
+        """Restore state in place; returns the Snapshot header and metrics.
+
+        Pass unmanaged=False to keep the broker's current unmanaged portfolio,
+        e.g. when it was just imported from the brokerage.
+        """
+        reader = cls._open(data)
+        snapshot = cls(reader.Time())
+        by_name = {algorithm.Name: algorithm for algorithm in algorithms}
+        owners = []
+        for tag, section in cls._sections(reader):
+            if tag == cls.METRICS:
+                while not section.AtEnd:
+                    key = section.String()
+                    snapshot.Metrics[key] = section.Float()
+            elif tag == cls.ALGORITHM:
+                owners.append(cls._read_algorithm(section, by_name))
+            elif tag == cls.UNMANAGED:
+                cls._read_portfolio(section, broker.Portfolio if unmanaged else None)
+            elif tag == cls.SUBMITTED:
+                cls._read_submitted(section, owners, broker)
+            elif tag == cls.ALLOCATIONS:
+                cls._read_allocations(section, owners, broker)
+            elif tag == cls.FILLED:
+                cls._read_filled(section, broker)
+            elif tag != cls.ROLLING_WINDOWS:
+                snapshot.Sections.append((tag, section))
+        return snapshot
+
+    @classmethod
+    def LoadRollingWindows(cls, data, algorithms):
+        """Refill the algorithms' rolling windows; returns the snapshot time and the restored algorithms."""
+        reader = cls._open(data)
+        time = reader.Time()
+        by_name = {algorithm.Name: algorithm for algorithm in algorithms}
+        restored = []
+        for tag, section in cls._sections(reader):
+            if tag != cls.ROLLING_WINDOWS:
+                continue
+            algorithm = by_name.get(section.String())
+            if algorithm is None:
+                continue
+            saved = {}
+            for _ in range(section.Int()):
+                ticker, size, bars = cls._read_rolling_window(section)
+                saved.setdefault((ticker, size), []).append(bars)
+            # removing the windows of a symbol reorders and shortens the list, so windows are matched by
+            # symbol and size; a symbol without saved windows was removed before the snapshot and starts empty
+            matched, empty = [], []
+            for symbol, rolling_window in getattr(algorithm, "RollingWindows", []):
+                ticker = getattr(symbol, "Value", symbol)
+                windows = saved.get((ticker, rolling_window.Size))
+                if windows:
+                    matched.append((symbol, rolling_window, windows.pop(0)))
+                else:
+                    empty.append(ticker)
+            # other sizes for a saved symbol, or nothing to restore at all, mean the windows changed
+            saved_tickers = {ticker for ticker, _ in saved}
+            if any(ticker in saved_tickers for ticker in empty) or (empty and not matched):
+                Singleton.Error(f"Snapshot rolling windows of {algorithm.Name} do not match, warming up")
+                continue
+            if empty:
+                Singleton.Debug(f"Snapshot has no rolling windows of {algorithm.Name} for {empty}")
+            for symbol, rolling_window, bars in matched:
+                for time_, period, open_, high, low, close, volume in bars:
+                    rolling_window.Add(TradeBar(time_, symbol, open_, high, low, close, volume,
+                                                timedelta(seconds=period)))
+            restored.append(algorithm)
+        return time, restored
+
+    @classmethod
+    def _read_rolling_window(cls, reader):
+        ticker = reader.String()
+        size = reader.Int()
+        bars = []
+        for _ in range(reader.Int()):
+            bars.append((reader.Time(), reader.Float(), reader.Float(), reader.Float(),
+                         reader.Float(), reader.Float(), reader.Float()))
+        return ticker, size, bars
+
+    @classmethod
+    def _open(cls, data):
+        reader = BinaryReader(bytes(data))
+        if reader.Raw(len(cls.MAGIC)) != cls.MAGIC:
+            raise ValueError("Not a snapshot")
+        version = reader.Int()
+        if version > cls.VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        reader.Version = version
+        return reader
+
+    @classmethod
+    def _sections(cls, reader):
+        while not reader.AtEnd:
+            tag = reader.Int()
+            yield tag, BinaryReader(reader.Bytes(), version=reader.Version)
+
+    @classmethod
+    def _read_algorithm(cls, reader, by_name):
+        name = reader.String()
+        allocation = reader.OptionalFloat()
+        total_orders = reader.Int()
+        algorithm = by_name.get(name)
+        if algorithm is None:
+            Singleton.Error(f"Snapshot has unknown algorithm {name}, ignoring it")
+            cls._read_portfolio(reader, None)
+            return None
+        algorithm.Allocation = allocation
+        algorithm.TotalOrders = total_orders
+        cls._read_portfolio(reader, algorithm.Portfolio)
+        return algorithm.Portfolio
+
+    @classmethod
+    def _read_portfolio(cls, reader, portfolio):
+        cash = reader.Float()
+        unsettled_cash = reader.Float()
+        cost = reader.Float()
+        positions = []
+        for _ in range(reader.Int()):
+            ticker = reader.String()
+            quantity = reader.Float()
+            average_price = reader.Float()
+            fees = reader.Float()
+            realized_profit, lots = 0.0, []
+            if reader.Version >= 2:
+                realized_profit = reader.Float()
+                lots = [(reader.Float(), reader.Float()) for _ in range(reader.Int())]
+            positions.append((ticker, quantity, average_price, fees, realized_profit, lots))
+        currency, other = None, []
+        if reader.Version >= 3:
+            currency = reader.String()
+            other = [(reader.String(), reader.Float()) for _ in range(reader.Int())]
+
+        if portfolio is None:
+            return
+        portfolio.clear()
+        if currency is not None:
+            portfolio.SetAccountCurrency(currency)
+            for code in [code for code in portfolio.CashBook if code != currency]:
+                del portfolio.CashBook[code]
+            for code, amount in other:
+                portfolio.CashBook[code] = Cash(code, amount)
+        portfolio.SetCash(cash)
+        portfolio.SetCost(cost)
+        portfolio.UnsettledCash = unsettled_cash
+        for ticker, quantity, average_price, fees, realized_profit, lots in positions:
+            symbol = cls._symbol(ticker)
+            if symbol is not None:
+                portfolio[symbol] = Position(symbol, quantity, average_price, fees, cost_basis=portfolio.CostBasis)
+                portfolio[symbol]._restore(realized_profit, lots)
+
+    @classmethod
+    def _read_submitted(cls, reader, owners, broker):
+        while not reader.AtEnd:
+            order_id = reader.Int()
+            owner = reader.Int()
+            ticker = reader.String()
+            quantity = reader.Float()
+            order_type = reader.Int()
+            limit_price = reader.OptionalFloat()
+            stop_price = reader.OptionalFloat()
+            tag = reader.String()
+
+            portfolio = broker.Portfolio if owner < 0 else owners[owner]
+            symbol = cls._symbol(ticker)
+            ticket = cls._ticket(order_id)
+            if portfolio is None or symbol is None or ticket is None:
+                Singleton.Error(f"Dropping submitted order {order_id} ({ticker}, {quantity}) from snapshot")
+                continue
+            # order ids restart with a new deployment, so the ticket may belong to another order
+            if not cls._ticket_matches(ticket, ticker, quantity, tag):
+                Singleton.Error(f"Dropping submitted order {order_id} ({ticker}, {quantity}) from snapshot, "
+                                f"its ticket is {ticket}")
+                continue
+            order = InternalOrder(portfolio=portfolio, symbol=symbol, quantity=quantity, order_type=order_type,
+                                  limit_price=limit_price, stop_price=stop_price, tag=tag)
+            order.Ticket = ticket
+            broker._submitted[order_id] = order
+
+    @classmethod
+    def _read_allocations(cls, reader, owners, broker):
+        while not reader.AtEnd:
+            order_id = reader.Int()
+            allocations = []
+            for _ in range(reader.Int()):
+                owner = reader.Int()
+                allocations.append((broker.Portfolio if owner < 0 else owners[owner], reader.Float()))
+            order = broker._submitted.get(order_id)
+            if order is None or any(portfolio is None for portfolio, _ in allocations):
+                Singleton.Error(f"Dropping allocations of submitted order {order_id} from snapshot")
+                continue
+            order.Allocations = allocations
+
+    @classmethod
+    def _read_filled(cls, reader, broker):
+        while not reader.AtEnd:
+            order_id = reader.Int()
+            filled = reader.Float()
+            order = broker._submitted.get(order_id)
+            if order is not None:
+                order.Filled = filled
+
+    @classmethod
+    def _symbol(cls, ticker):
+        try:
+            return ISymbolDict.CreateSymbol(ticker)
+        except KeyError:
+            Singleton.Error(f"Snapshot references {ticker}, which is not subscribed")
+            return None
+
+    @classmethod
+    def _ticket_matches(cls, ticket, ticker, quantity, tag):
+        return (getattr(ticket.Symbol, "Value", ticket.Symbol) == ticker
+                and isclose(float(ticket.Quantity), quantity, abs_tol=1e-9) and ticket.Tag == tag)
+
+    @classmethod
+    def _ticket(cls, order_id):
+        try:
+            return Singleton.QCAlgorithm.Transactions.GetOrderTicket(order_id)
+        except KeyError:
+            return None
@@ -0,0 +1,169 @@
+# pylint: disable=C0111,C0103,R0902,R0903,R0913,R0914
+from datetime import datetime, timedelta
+import numpy as np
+
+from mocked import Symbol, Security, SymbolProperties, InternalSecurityManager, TradeBar
+
+TRADING_DAYS = 252
+
+
+class UniverseRamp(object):
+    '''Lists symbols progressively, from `start` to `end` fraction of the universe.'''
+
+    def __init__(self, start=0.1, end=1.0):
+        self.Start = start
+        self.End = end
+
+    def Apply(self, data, rng):
+        steps, symbols = data.Close.shape
+        first = max(int(self.Start * symbols), 1)
+        last = max(int(self.End * symbols), first)
+        listed = np.linspace(first, last, steps).astype(int)
+        # symbol i is active once `listed` reaches i + 1
+        data.Active &= np.arange(symbols)[None, :] < listed[:, None]
+
+
+class FlashCrash(object):
+    '''Drops prices by `depth` at `step` and recovers linearly over `recovery` steps.'''
+
+    def __init__(self, step, depth=0.3, recovery=10, fraction=1.0):
+        self.Step = step
+        self.Depth = depth
+        self.Recovery = recovery
+        self.Fraction = fraction
+
+    def ApplyReturns(self, log_returns, rng):
+        steps, symbols = log_returns.shape
+        hit = rng.random_sample(symbols) < self.Fraction
+        drop = np.log(1.0 - self.Depth)
+        log_returns[self.Step, hit] += drop
+        end = min(self.Step + 1 + self.Recovery, steps)
+        if end > self.Step + 1:
+            log_returns[self.Step + 1:end, hit] -= drop / self.Recovery
+
+
+class IlliquidLots(object):
+    '''Gives a fraction of the symbols fractional lot sizes, like Coinbase's 0.001.'''
+
+    def __init__(self, fraction=0.5, lot_size=0.001):
+        self.Fraction = fraction
+        self.LotSize = lot_size
+
+    def Apply(self, data, rng):
+        illiquid = rng.random_sample(len(data.Symbols)) < self.Fraction
+        data.LotSizes[illiquid] = self.LotSize
+        data.Volume[:, illiquid] *= self.LotSize
+
+
+class SyntheticData(object):
+    def __init__(self, symbols, times, period):
+        steps = len(times)
+        self.Symbols = symbols
+        self.Times = times
+        self.Period = period
+        self.Open = np.empty((steps, len(symbols)))
+        self.High = np.empty((steps, len(symbols)))
+        self.Low = np.empty((steps, len(symbols)))
+        self.Close = np.empty((steps, len(symbols)))
+        self.Volume = np.empty((steps, len(symbols)))
+        self.Active = np.ones((steps, len(symbols)), dtype=bool)
+        self.LotSizes = np.ones(len(symbols))
+
+    def SecurityManager(self):
+        """InternalSecurityManager priced at the first bar, with the generated lot sizes."""
+        securities = InternalSecurityManager()
+        for i, symbol in enumerate(self.Symbols):
+            security = Security(symbol, float(self.Open[0, i]))
+            security.SymbolProperties = SymbolProperties(lot_size=float(self.LotSizes[i]))
+            securities[symbol] = security
+        return securities
+
+    def Bars(self, step):
+        """{symbol: TradeBar} for the symbols active at step."""
+        time = self.Times[step]
+        bars = {}
+        for i in np.flatnonzero(self.Active[step]):
+            bars[self.Symbols[i]] = TradeBar(time, self.Symbols[i], float(self.Open[step, i]),
+                                             float(self.High[step, i]), float(self.Low[step, i]),
+                                             float(self.Close[step, i]), float(self.Volume[step, i]),
+                                             self.Period)
+        return bars
+
+    def Steps(self):
+        """(time, bars) pairs for mocked.LocalEngine.Run."""
+        for step, time in enumerate(self.Times):
+            yield time, self.Bars(step)
+
+
+class SyntheticMarket(object):
+    '''Correlated GBM or jump-diffusion OHLCV series for many symbols.
+
+    Returns share one market factor with pairwise correlation `correlation`;
+    jumps arrive as a Poisson process with `jump_intensity` per year.
+    '''
+
+    def __init__(self, symbols=100, days=TRADING_DAYS, steps_per_day=1, seed=42,
+                 start=datetime(2019, 1, 1), price=100.0, drift=0.05, volatility=0.3,
+                 correlation=0.3, jump_intensity=0.0, jump_mean=-0.05, jump_volatility=0.1,
+                 volume=1e6, scenarios=None, ticker_format="SYN{:05d}"):
+        self.SymbolCount = symbols
+        self.Days = days
+        self.StepsPerDay = steps_per_day
+        self.Seed = seed
+        self.Start = start
+        self.Price = price
+        self.Drift = drift
+        self.Volatility = volatility
+        self.Correlation = correlation
+        self.JumpIntensity = jump_intensity
+        self.JumpMean = jump_mean
+        self.JumpVolatility = jump_volatility
+        self.BaseVolume = volume
+        self.Scenarios = scenarios or []
+        self.TickerFormat = ticker_format
+
+    def Generate(self):
+        rng = np.random.RandomState(self.Seed)
+        # scenarios draw from their own stream so that they don't change the base paths
+        scenario_rng = np.random.RandomState(self.Seed + 1)
+        steps = self.Days * self.StepsPerDay
+        count = self.SymbolCount
+        dt = 1.0 / (TRADING_DAYS * self.StepsPerDay)
+        period = timedelta(days=1) / self.StepsPerDay
+
+        symbols = [Symbol(self.TickerFormat.format(i)) for i in range(count)]
+        times = [self.Start + timedelta(days=step // self.StepsPerDay) + period * (step % self.StepsPerDay)
+                 for step in range(steps)]
+        data = SyntheticData(symbols, times, period)
+
+        # one-factor model keeps memory at O(steps * symbols) for any universe size
+        sigma = self.Volatility * rng.lognormal(0.0, 0.25, count)
+        market = rng.standard_normal((steps, 1))
+        shocks = np.sqrt(self.Correlation) * market + \
+            np.sqrt(1.0 - self.Correlation) * rng.standard_normal((steps, count))
+        log_returns = (self.Drift - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * shocks
+
+        if self.JumpIntensity > 0:
+            jumps = rng.poisson(self.JumpIntensity * dt, (steps, count))
+            log_returns += jumps * self.JumpMean + \
+                np.sqrt(jumps) * self.JumpVolatility * rng.standard_normal((steps, count))
+
+        for scenario in self.Scenarios:
+            if hasattr(scenario, "ApplyReturns"):
+                scenario.ApplyReturns(log_returns, scenario_rng)
+
+        initial = self.Price * rng.lognormal(0.0, 0.5, count)
+        data.Close[:] = initial * np.exp(np.cumsum(log_returns, axis=0))
+        data.Open[0] = initial
+        data.Open[1:] = data.Close[:-1]
+
+        wick = np.abs(rng.standard_normal((2, steps, count))) * 0.5 * sigma * np.sqrt(dt)
+        data.High[:] = np.maximum(data.Open, data.Close) * np.exp(wick[0])
+        data.Low[:] = np.minimum(data.Open, data.Close) * np.exp(-wick[1])
+        data.Volume[:] = self.BaseVolume / self.StepsPerDay * rng.lognormal(0.0, 0.5, (steps, count)) * \
+            (1.0 + 10.0 * np.abs(log_returns))
+
+        for scenario in self.Scenarios:
+            if hasattr(scenario, "Apply"):
+                scenario.Apply(data, scenario_rng)
+        return data
@@ -1,7 +1,9 @@
 # pylint: disable=C0111,C0103,C0112,W0201,W0212
 import unittest
+from datetime import datetime, timedelta
 
-from mocked import Resolution, Symbol, InternalSecurityManager
+from mocked import Resolution, Symbol, InternalSecurityManager, OrderEvent, OrderFee, OrderStatus, CashAmount, \
+    Security, SecurityChanges
 from market import Position
 from singleton import Singleton
 from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
@@ -33,6 +35,13 @@ class TestSimpleAlgorithm(unittest.TestCase):
         self.assertEqual(self.algorithm1.Portfolio.TotalHoldingsValue, foo_value + bar_value)
         self.assertEqual(self.algorithm1.Portfolio.TotalPortfolioValue, total_value)
 
+    def test_securities_changed_drops_resolved_securities(self):
+        self.qc.registerAlgorithms([self.algorithm1], plot_orders=False, plot_value=False, plot_allocation=False)
+        self.assertIs(self.algorithm1.Portfolio[FOO].Security, self.qc.Securities[FOO])
+        self.qc.Securities[FOO] = Security(FOO, price=6)
+        self.qc.OnSecuritiesChanged(SecurityChanges(added=[self.qc.Securities[FOO]]))
+        self.assertEqual(self.algorithm1.Portfolio[FOO].Price, 6)
+
 class TestMultipleAlgorithms(unittest.TestCase):
     def setUp(self):
         self.qc = QCAlgorithm()
@@ -77,6 +86,220 @@ class TestMultipleAlgorithms(unittest.TestCase):
         self.assertEqual(Singleton._warm_up, 444)
 
 
+class CountingAlgorithm(Algorithm):
+    def Initialize(self):
+        self.Bars = 0
+
+    def OnData(self, args):
+        self.Bars += 1
+
+
+class TestPerAlgorithmWarmUp(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        Singleton.Setup(self.qc)
+        self.qc.SetStartDate(2019, 6, 1)
+        self.short = CountingAlgorithm(name="short")
+        self.short.SetWarmUp(20)
+        self.long = CountingAlgorithm(name="long")
+        self.long.SetWarmUp(timedelta(200))
+        self.default = CountingAlgorithm(name="default")
+        self.qc.registerAlgorithms([self.short, self.long, self.default],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+        self.qc.IsWarmingUp = True
+
+    def run_days(self, days_before_start):
+        for days in days_before_start:
+            self.qc.Time = self.qc.StartDate - timedelta(days)
+            self.qc.OnData({})
+
+    def test_global_warm_up_is_longest(self):
+        self.assertEqual(Singleton._warm_up, 200)
+
+    def test_skips_algorithms_outside_their_window(self):
+        self.run_days([200, 100, 20, 5])
+        self.assertEqual(self.long.Bars, 4)
+        self.assertEqual(self.default.Bars, 4)
+        self.assertEqual(self.short.Bars, 2)
+
+    def test_all_algorithms_run_after_warm_up(self):
+        self.qc.IsWarmingUp = False
+        self.qc.Time = datetime(2019, 6, 2)
+        self.qc.OnData({})
+        self.assertEqual([self.short.Bars, self.long.Bars, self.default.Bars], [1, 1, 1])
+
+
+class TestOnDataDispatch(unittest.TestCase):
+    def test_only_dispatches_to_algorithms_with_on_data(self):
+        qc = QCAlgorithm()
+        Singleton.Setup(qc)
+        counting = CountingAlgorithm(name="counting")
+        silent = Algorithm(name="silent")
+        qc.registerAlgorithms([counting, silent], plot_orders=False, plot_value=False, plot_allocation=False)
+        self.assertEqual(qc._AlgorithmManager__on_data_algorithms, [counting])
+
+        qc.OnData({})
+        self.assertEqual(counting.Bars, 1)
+
+        # the table is rebuilt when algorithms are registered again
+        other = CountingAlgorithm(name="other")
+        qc.registerAlgorithms([other], plot_orders=False, plot_value=False, plot_allocation=False)
+        qc.OnData({})
+        self.assertEqual([counting.Bars, other.Bars], [1, 1])
+
+
+class ScheduledAlgorithm(Algorithm):
+    def Initialize(self):
+        self.Calls = []
+        self.Schedule.On(self.DateRules.EveryDay(), self.TimeRules.At(10, 0), self.Rebalance)
+        self.Schedule.On(self.DateRules.EveryDay(), self.TimeRules.At(15, 30), self.Close)
+
+    def Rebalance(self):
+        self.Calls.append("rebalance")
+        self.Buy(FOO, 2)
+
+    def Close(self):
+        self.Calls.append("close")
+
+
+class BuyingAlgorithm(Algorithm):
+    def OnData(self, args):
+        self.Buy(FOO, 2)
+        self.Sell(BAR, 2)
+
+
+class TestOnDataBatching(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        Singleton.Setup(self.qc)
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        self.algorithm1 = BuyingAlgorithm(name="alg1", allocation=0.5)
+        self.algorithm2 = BuyingAlgorithm(name="alg2", allocation=0.5)
+        self.qc.registerAlgorithms([self.algorithm1, self.algorithm2],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm1.Portfolio[BAR] = Position(BAR, 2, 50)
+        self.executed = []
+        Singleton.Broker.ExecuteOrders = self.executed.append
+
+    def test_executes_all_algorithms_once_per_step(self):
+        self.qc.OnData({})
+        self.assertEqual(len(self.executed), 1)
+        self.assertEqual([(o.Portfolio.Algorithm.Name, o.Symbol, o.Quantity) for o in self.executed[0]],
+                         [("alg1", FOO, 2), ("alg1", BAR, -2), ("alg2", FOO, 2), ("alg2", BAR, -2)])
+        self.assertEqual(self.algorithm2.Portfolio.TakeOrders(), [])
+
+    def test_idle_steps_take_no_orders(self):
+        self.qc.OnData({})
+        self.assertEqual(Singleton.Broker.Pending, {})
+
+        qc = QCAlgorithm()
+        Singleton.Setup(qc)
+        algorithm = Algorithm(name="idle")
+        qc.registerAlgorithms([algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+        algorithm.Portfolio.TakeOrders = None
+        qc.OnData({})
+
+    def test_drops_orders_while_warming_up(self):
+        self.qc.SetStartDate(2019, 6, 1)
+        self.algorithm1.SetWarmUp(10)
+        self.algorithm2.SetWarmUp(10)
+        self.qc.IsWarmingUp = True
+        for day in range(4, 0, -1):
+            self.qc.Time = datetime(2019, 6, 1) - timedelta(day)
+            self.qc.OnData({})
+        self.assertEqual(self.executed, [])
+        self.assertEqual(self.algorithm1.Portfolio.TakeOrders(), [])
+
+        self.qc.IsWarmingUp = False
+        self.qc.Time = datetime(2019, 6, 1)
+        self.qc.OnData({})
+        self.assertEqual(len(self.executed), 1)
+        self.assertEqual([(o.Symbol, o.Quantity) for o in self.executed[0] if o.Symbol == FOO], [(FOO, 2), (FOO, 2)])
+
+
+class TestCrossPortfolioNetting(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        Singleton.Setup(self.qc)
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        self.algorithm1 = Algorithm(name="alg1", allocation=0.5)
+        self.algorithm2 = Algorithm(name="alg2", allocation=0.5)
+        self.qc.registerAlgorithms([self.algorithm1, self.algorithm2],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm1.Portfolio.SetCash(1000.0)
+        self.algorithm2.Portfolio.SetCash(1000.0)
+        self.algorithm1.Portfolio[BAR] = Position(BAR, 2, 50)
+
+    def test_sends_only_the_residual(self):
+        self.algorithm1.Buy(FOO, 2)
+        self.algorithm1.Sell(BAR, 2)
+        self.algorithm2.Buy(FOO, 2)
+        self.algorithm2.Buy(BAR, 2)
+        self.qc.OnData({})
+
+        # BAR is crossed between the algorithms, FOO goes out once
+        self.assertEqual([(i.Symbol, i.Quantity) for i in self.qc.Transactions.values()], [(FOO, 4.0)])
+        self.assertEqual(self.algorithm1.Portfolio[BAR].Quantity, 0)
+        self.assertEqual(self.algorithm2.Portfolio[BAR].Quantity, 2)
+        self.assertEqual(self.algorithm1.Portfolio.Cash, 1100.0)
+        self.assertEqual(self.algorithm2.Portfolio.Cash, 900.0)
+        self.assertEqual(Singleton.Broker.OpenQuantity(self.algorithm2.Portfolio, FOO), 2.0)
+
+        order = next(iter(Singleton.Broker._submitted.values()))
+        order_event = OrderEvent(order.Ticket.OrderId, FOO, 4.0, 5.0, status=OrderStatus.Filled)
+        order_event.OrderFee = OrderFee(CashAmount(1.0, 'USD'))
+        Singleton.Broker.HandleOrderEvent(order_event)
+        for algorithm, cash in ((self.algorithm1, 1089.5), (self.algorithm2, 889.5)):
+            self.assertEqual(algorithm.Portfolio[FOO].Quantity, 2)
+            self.assertEqual(algorithm.Portfolio.Cash, cash)
+            self.assertEqual(algorithm.TotalOrders, 1)
+
+
+class TestCoalescedSchedule(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        Singleton.Setup(self.qc)
+        self.qc.Initialize()
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        self.algorithm1 = ScheduledAlgorithm(name="alg1", allocation=0.5)
+        self.algorithm2 = ScheduledAlgorithm(name="alg2", allocation=0.5)
+        self.qc.registerAlgorithms([self.algorithm1, self.algorithm2],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+
+    def test_one_event_per_rule(self):
+        events = self.qc.Schedule.Events
+        self.assertEqual(len(events), 2)
+        self.assertEqual([(d.Name, t.Name) for d, t, _ in events],
+                         [("EveryDay", "At(10:00)"), ("EveryDay", "At(15:30)")])
+        self.assertEqual(len(self.algorithm1.Schedule._funcs), 2)
+
+    def test_runs_every_callback_and_executes_once(self):
+        executed = []
+        execute_orders = Singleton.Broker.ExecuteOrders
+        Singleton.Broker.ExecuteOrders = lambda orders: executed.append(orders) or execute_orders(orders)
+
+        self.qc.Schedule.Events[0][2]()
+        self.assertEqual(self.algorithm1.Calls, ["rebalance"])
+        self.assertEqual(self.algorithm2.Calls, ["rebalance"])
+        self.assertEqual(len(executed), 1)
+        self.assertEqual([(o.Portfolio, o.Quantity) for o in executed[0]],
+                         [(self.algorithm1.Portfolio, 2), (self.algorithm2.Portfolio, 2)])
+        self.assertEqual(self.algorithm1.Portfolio.TakeOrders(), [])
+
+    def test_drops_orders_while_warming_up(self):
+        executed = []
+        Singleton.Broker.ExecuteOrders = executed.append
+        self.qc.IsWarmingUp = True
+        self.qc.Schedule.Events[0][2]()
+        self.assertEqual(self.algorithm1.Calls, ["rebalance"])
+        self.assertEqual(executed, [])
+        self.assertEqual(self.algorithm1.Portfolio.TakeOrders(), [])
+
+    def test_new_events_after_setup(self):
+        Singleton.Setup(self.qc)
+        ScheduledAlgorithm(name="alg3")
+        self.assertEqual(len(self.qc.Schedule.Events), 4)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+# pylint: disable=C0111,C0103,W0212
+import copy
+import unittest
+from datetime import datetime, timedelta
+
+from mocked import Symbol, InternalSecurityManager, Security, SecurityChanges, TradeBar
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from consolidators import ConsolidatorRegistry
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+class WindowAlgorithm(Algorithm):
+    def Initialize(self):
+        self.Daily = self.CreateRollingWindow(FOO, 3)
+        self.Other = self.CreateRollingWindow(BAR, 2)
+
+
+class WeeklyAlgorithm(Algorithm):
+    def Initialize(self):
+        self.Daily = self.CreateRollingWindow(FOO, 5)
+        self.Weekly = self.CreateRollingWindow(FOO, 5, period=timedelta(7))
+
+
+class TestConsolidatorRegistry(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 10)])
+        Singleton.Setup(self.qc)
+        self.algorithm1 = WindowAlgorithm(name="alg1")
+        self.algorithm2 = WeeklyAlgorithm(name="alg2")
+        self.qc.registerAlgorithms([self.algorithm1, self.algorithm2],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+
+    def update(self, symbol, day, period=timedelta(1)):
+        bar = TradeBar(datetime(2019, 1, day), symbol, 1, 1, 1, float(day), 100)
+        for consolidator in self.qc.SubscriptionManager.Consolidators[symbol]:
+            if consolidator.Period == period:
+                consolidator.Update(bar)
+
+    def test_one_consolidator_per_symbol_and_period(self):
+        consolidators = self.qc.SubscriptionManager.Consolidators
+        self.assertEqual(len(consolidators[FOO]), 2)
+        self.assertEqual(len(consolidators[BAR]), 1)
+        self.assertEqual(len(ConsolidatorRegistry.Instance()), 3)
+
+    def test_fans_out_bars(self):
+        for day in range(1, 5):
+            self.update(FOO, day)
+        self.assertEqual([self.algorithm1.Daily[i].Close for i in range(3)], [4.0, 3.0, 2.0])
+        self.assertEqual(self.algorithm2.Daily.Count, 4)
+        self.assertEqual(self.algorithm2.Weekly.Count, 0)
+
+        self.update(FOO, 7, period=timedelta(7))
+        self.assertEqual(self.algorithm2.Weekly.Count, 1)
+        self.assertEqual(self.algorithm1.Daily[0].Close, 4.0)
+
+    def test_restored_windows_skip_replayed_bars(self):
+        self.update(FOO, 3)
+        self.algorithm1.Daily.Add(TradeBar(datetime(2019, 1, 4), FOO, 1, 1, 1, 4.0, 100))
+        self.update(FOO, 4)
+        self.assertEqual(self.algorithm1.Daily.Count, 2)
+        self.assertEqual(self.algorithm2.Daily.Count, 2)
+
+    def test_removed_with_last_subscriber(self):
+        self.qc.OnSecuritiesChanged(SecurityChanges(removed=[Security(FOO, 5)]))
+        self.assertEqual(self.qc.SubscriptionManager.Consolidators[FOO], [])
+        self.assertEqual(len(ConsolidatorRegistry.Instance()), 1)
+        self.assertEqual(self.algorithm1.RollingWindows, [(BAR, self.algorithm1.Other)])
+        self.assertEqual(self.algorithm2.RollingWindows, [])
+
+    def test_reference_counted(self):
+        self.algorithm2.RemoveRollingWindows(FOO)
+        self.assertEqual(len(self.qc.SubscriptionManager.Consolidators[FOO]), 1)
+        self.update(FOO, 1)
+        self.assertEqual(self.algorithm1.Daily.Count, 1)
+        self.algorithm1.RemoveRollingWindows(FOO)
+        self.assertEqual(self.qc.SubscriptionManager.Consolidators[FOO], [])
+
+    def test_new_registry_after_setup(self):
+        registry = ConsolidatorRegistry.Instance()
+        Singleton.Setup(QCAlgorithm())
+        self.assertIsNot(ConsolidatorRegistry.Instance(), registry)
+
+    def test_registry_survives_new_wrappers(self):
+        registry = ConsolidatorRegistry.Instance()
+        # pythonnet hands out a new wrapper of the same SubscriptionManager on every access
+        object.__setattr__(self.qc, 'SubscriptionManager', copy.copy(self.qc.SubscriptionManager))
+        self.assertIs(ConsolidatorRegistry.Instance(), registry)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from datetime import datetime, timedelta
+
+from mocked import Symbol, InternalSecurityManager, MarketImpactModel, OrderEvent, OrderStatus, OrderType
+from market import Broker, InternalOrder
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from execution import ExecutionEngine, VWAP
+
+FOO = Symbol('foo')
+
+
+class TestExecutionEngine(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 10)])
+        self.qc.Securities[FOO].Volume = 10_000
+        self.qc.Time = datetime(2019, 3, 4, 10, 0)
+        Singleton.Setup(self.qc, broker=Broker())
+        self.algorithm = Algorithm(name="alg1", allocation=1.0)
+        self.qc.registerAlgorithms([self.algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm.Portfolio.SetCash(100_000.0)
+
+    def buy(self, quantity):
+        self.algorithm.Portfolio.AddOrder(InternalOrder(self.algorithm.Portfolio, FOO, quantity))
+        self.algorithm.Portfolio.ExecuteOrders()
+
+    def run_steps(self, steps):
+        for _ in range(steps):
+            self.qc.Time += timedelta(minutes=1)
+            self.qc.OnData({})
+
+    def test_twap_reduces_impact(self):
+        self.qc.FillModel = MarketImpactModel(coefficient=0.1)
+        self.buy(1000)
+        unsliced = self.algorithm.Portfolio[FOO].AveragePrice
+        self.assertAlmostEqual(unsliced, 10.1)
+
+        self.algorithm.Portfolio.clear()
+        engine = ExecutionEngine(min_notional=5000, slices=4)
+        self.qc.SetExecutionEngine(engine)
+        self.buy(1000)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 250)
+        self.run_steps(3)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 1000)
+        self.assertAlmostEqual(self.algorithm.Portfolio[FOO].AveragePrice, 10.025)
+        self.assertEqual(engine.Active, [])
+
+    def test_small_orders_are_not_sliced(self):
+        engine = ExecutionEngine(min_notional=5000, slices=4)
+        self.qc.SetExecutionEngine(engine)
+        self.buy(100)
+        self.assertEqual(engine.Active, [])
+        self.assertEqual([o.Quantity for o in Singleton.Broker._submitted.values()], [100.0])
+
+    def test_open_children_are_replaced(self):
+        engine = ExecutionEngine(min_notional=5000, slices=4, interval=timedelta(minutes=5))
+        self.qc.SetExecutionEngine(engine)
+        self.buy(1000)
+        sliced = engine.Active[0]
+        child = sliced.Child
+        self.assertIn(child.Ticket.OrderId, Singleton.Broker._submitted)
+        self.assertEqual(engine.Unsent(self.algorithm.Portfolio, FOO), 750)
+
+        # not due yet
+        self.run_steps(1)
+        self.assertIs(sliced.Child, child)
+
+        # half of the child fills; a market child is not canceled, the next slice waits for the rest
+        self.qc.OnOrderEvent(OrderEvent(child.Ticket.OrderId, FOO, 250, 10.0, status=OrderStatus.PartiallyFilled))
+        self.assertEqual(sliced.Filled, 125)
+        self.run_steps(4)
+        self.assertIs(sliced.Child, child)
+        self.assertEqual(child.Ticket.Status, OrderStatus.Submitted)
+        self.assertEqual(engine.Outstanding(self.algorithm.Portfolio, FOO), 750)
+
+        self.qc.OnOrderEvent(OrderEvent(child.Ticket.OrderId, FOO, 125.0, 10.0, status=OrderStatus.Filled))
+        self.assertIsNone(sliced.Child)
+        self.run_steps(1)
+        self.assertEqual(sliced.Unsent, 500)
+        self.assertEqual(len(Singleton.Broker._submitted), 1)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 250)
+
+    def test_replaced_limit_child_keeps_late_fills(self):
+        engine = ExecutionEngine(min_notional=5000, slices=4, limit_offset=0.001)
+        self.qc.SetExecutionEngine(engine)
+        self.buy(1000)
+        sliced = engine.Active[0]
+        child = sliced.Child
+        order_id = child.Ticket.OrderId
+
+        self.run_steps(1)
+        self.assertEqual(child.Ticket.Status, OrderStatus.Canceled)
+        self.assertIn(order_id, Singleton.Broker._submitted)
+        self.assertEqual(sliced.Unsent, 750)
+
+        # a fill racing the cancel is still booked, and only the rest goes back to the parent
+        late_fill = OrderEvent(order_id, FOO, 250.0, 10.0, status=OrderStatus.PartiallyFilled)
+        late_fill.FillQuantity = 100.0
+        self.qc.OnOrderEvent(late_fill)
+        self.qc.OnOrderEvent(OrderEvent(order_id, FOO, 250.0, status=OrderStatus.Canceled))
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 100)
+        self.assertEqual(sliced.Unsent, 900)
+        self.assertNotIn(order_id, Singleton.Broker._submitted)
+
+        self.run_steps(1)
+        self.assertEqual(sliced.Child.Quantity, 250)
+        self.assertEqual(engine.Outstanding(self.algorithm.Portfolio, FOO), 900)
+
+    def test_limit_children_fall_back_to_market(self):
+        self.qc.FillModel = MarketImpactModel(coefficient=0.1)
+        engine = ExecutionEngine(min_notional=5000, slices=2, limit_offset=0.001)
+        self.qc.SetExecutionEngine(engine)
+        self.buy(1000)
+        child = engine.Active[0].Child
+        self.assertEqual(child.OrderType, OrderType.Limit)
+        self.assertAlmostEqual(child.LimitPrice, 10.01)
+
+        self.run_steps(1)
+        self.qc.OnOrderEvent(OrderEvent(child.Ticket.OrderId, FOO, 500.0, status=OrderStatus.Canceled))
+        self.assertNotIn(child.Ticket.OrderId, Singleton.Broker._submitted)
+        self.run_steps(1)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 1000)
+        self.assertEqual(engine.Active, [])
+
+    def test_open_limit_child_is_outstanding(self):
+        engine = ExecutionEngine(min_notional=5000, slices=4, interval=timedelta(minutes=5), limit_offset=0.001)
+        self.qc.SetExecutionEngine(engine)
+        self.buy(1000)
+        child = engine.Active[0].Child
+        self.assertEqual(engine.Unsent(self.algorithm.Portfolio, FOO), 750)
+        self.assertEqual(engine.Outstanding(self.algorithm.Portfolio, FOO), 1000)
+
+        self.qc.OnOrderEvent(OrderEvent(child.Ticket.OrderId, FOO, 200, 10.0, status=OrderStatus.PartiallyFilled))
+        self.assertEqual(engine.Outstanding(self.algorithm.Portfolio, FOO), 900)
+        # a target of 1000 shares needs no new order
+        portfolio = self.algorithm.Portfolio
+        self.algorithm.CalculateOrderQuantity = lambda symbol, target: 1000.0 - portfolio[symbol].Quantity
+        self.assertEqual(self.algorithm._set_holdings_impl(FOO, 1.0).Quantity, 0)
+
+    def test_vwap(self):
+        self.qc.FillModel = MarketImpactModel(coefficient=0.0)
+        engine = ExecutionEngine(min_notional=5000, style=VWAP, volume_profile=[3, 1, 1])
+        self.qc.SetExecutionEngine(engine)
+        self.buy(1000)
+        quantities = [self.algorithm.Portfolio[FOO].Quantity]
+        for _ in range(2):
+            self.run_steps(1)
+            quantities.append(self.algorithm.Portfolio[FOO].Quantity)
+        self.assertEqual(quantities, [600, 800, 1000])
+        with self.assertRaises(ValueError):
+            ExecutionEngine(min_notional=0, style=VWAP)
+
+
+if __name__ == '__main__':
+    unittest.main()
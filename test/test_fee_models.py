@@ -0,0 +1,145 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from datetime import date, datetime
+
+from mocked import QCAlgorithm, Symbol, InternalSecurityManager, OrderType, OrderStatus, Order, OrderFeeParameters, OrderEvent
+from market import Portfolio, Broker, InternalOrder, Cash
+from fee_models import RollingVolume, CoinbaseFeeModel, InteractiveBrokersFeeModel
+from singleton import Singleton
+
+BTCUSD = Symbol('BTCUSD')
+FOO = Symbol('foo')
+
+
+def SetupSingleton(fee_model, securities):
+    qc = QCAlgorithm()
+    qc.Securities = InternalSecurityManager(securities)
+    qc.Time = datetime(2019, 1, 10)
+    Singleton.Setup(qc, broker=Broker(), fee_model=fee_model)
+    return qc
+
+
+class TestRollingVolume(unittest.TestCase):
+    def test_accumulates_within_window(self):
+        volume = RollingVolume(days=3)
+        volume.Add(date(2019, 1, 1), 10)
+        volume.Add(date(2019, 1, 2), 20)
+        self.assertEqual(volume.Value(date(2019, 1, 3)), 30)
+
+    def test_expires_old_days(self):
+        volume = RollingVolume(days=3)
+        volume.Add(date(2019, 1, 1), 10)
+        volume.Add(date(2019, 1, 2), 20)
+        self.assertEqual(volume.Value(date(2019, 1, 4)), 20)
+        self.assertEqual(volume.Value(date(2019, 1, 5)), 0)
+
+    def test_long_gap_clears_everything(self):
+        volume = RollingVolume(days=3)
+        volume.Add(date(2019, 1, 1), 10)
+        volume.Add(date(2019, 3, 1), 5)
+        self.assertEqual(volume.Value(date(2019, 3, 1)), 5)
+
+
+class TestCoinbaseFeeModel(unittest.TestCase):
+    def setUp(self):
+        self.model = CoinbaseFeeModel()
+        self.qc = SetupSingleton(self.model, [(BTCUSD, 1000)])
+
+    def test_first_tier(self):
+        self.assertAlmostEqual(self.model.EstimateOrderFee(BTCUSD, 2.0), 10.0)
+
+    def test_get_order_fee(self):
+        order = Order(1, BTCUSD, 2.0, order_type=OrderType.Limit)
+        parameters = OrderFeeParameters(self.qc.Securities[BTCUSD], order)
+        fee = self.model.GetOrderFee(parameters)
+        self.assertAlmostEqual(fee.Value.Amount, 10.0)
+        self.assertEqual(fee.Value.Currency, 'USD')
+
+    def test_maker_and_taker_split_with_volume(self):
+        self.model.RecordFill(60.0, 1000.0)
+        self.assertAlmostEqual(self.model.EstimateOrderFee(BTCUSD, 1.0, OrderType.Limit), 1.5)
+        self.assertAlmostEqual(self.model.EstimateOrderFee(BTCUSD, 1.0, OrderType.Market), 2.5)
+
+    def test_volume_expires(self):
+        self.model.RecordFill(60.0, 1000.0)
+        self.qc.Time = datetime(2019, 2, 15)
+        self.assertAlmostEqual(self.model.EstimateOrderFee(BTCUSD, 1.0), 5.0)
+
+
+class TestInteractiveBrokersFeeModel(unittest.TestCase):
+    def setUp(self):
+        self.model = InteractiveBrokersFeeModel()
+        SetupSingleton(self.model, [(FOO, 100)])
+
+    def test_minimum_fee(self):
+        self.assertAlmostEqual(self.model.EstimateOrderFee(FOO, 10.0), 0.35)
+
+    def test_per_share(self):
+        self.assertAlmostEqual(self.model.EstimateOrderFee(FOO, 1000.0), 3.5)
+
+    def test_maximum_fee(self):
+        self.assertAlmostEqual(self.model.EstimateFee(100.0, 0.1, False), 0.1)
+
+    def test_share_volume_tier(self):
+        self.model.RecordFill(-400_000.0, 1.0)
+        self.assertAlmostEqual(self.model.EstimateOrderFee(FOO, 1000.0), 2.0)
+
+
+class TestBatchFeeEstimation(unittest.TestCase):
+    def setUp(self):
+        self.model = CoinbaseFeeModel()
+        SetupSingleton(self.model, [(BTCUSD, 1000), (FOO, 10)])
+        self.model.RecordFill(60.0, 1000.0)
+
+    def test_matches_scalar_estimates(self):
+        fees = self.model.EstimateOrderFees([BTCUSD, FOO, BTCUSD], [1, -1, 1], [2.0, -30.0, 0.5],
+                                            [999.0, 9.0, 999.0], [1001.0, 11.0, 1001.0],
+                                            is_maker=[False, False, True])
+        expected = [self.model.EstimateFee(2.0, 1001.0, False),
+                    self.model.EstimateFee(30.0, 9.0, False),
+                    self.model.EstimateFee(0.5, 1001.0, True)]
+        self.assertEqual(len(fees), 3)
+        for fee, expected_fee in zip(fees, expected):
+            self.assertAlmostEqual(fee, expected_fee)
+
+    def test_internal_orders(self):
+        portfolio = Portfolio(cash=Cash('USD', 1000.0, 1.0))
+        orders = [InternalOrder(portfolio, BTCUSD, 1), InternalOrder(portfolio, FOO, -10)]
+        fees = self.model.EstimateFeesForOrders(orders)
+        self.assertAlmostEqual(fees[0], orders[0].EstimatedFee)
+        self.assertAlmostEqual(fees[1], orders[1].EstimatedFee)
+
+    def test_per_share_minimum(self):
+        model = InteractiveBrokersFeeModel()
+        SetupSingleton(model, [(FOO, 100)])
+        fees = model.EstimateOrderFees([FOO, FOO], [1, 1], [10.0, 0.0], [100.0, 100.0], [100.0, 100.0])
+        self.assertAlmostEqual(fees[0], 0.35)
+        self.assertAlmostEqual(fees[1], 0.0)
+
+
+class TestFeeAwareOrders(unittest.TestCase):
+    def setUp(self):
+        self.model = InteractiveBrokersFeeModel()
+        SetupSingleton(self.model, [(FOO, 1)])
+        self.portfolio = Portfolio(cash=Cash('USD', 1000.0, 1.0))
+        self.portfolio.MaxFeeRatio = 0.005
+
+    def test_skips_orders_not_worth_fees(self):
+        self.portfolio.AddOrder(InternalOrder(self.portfolio, FOO, 10))
+        self.portfolio.ExecuteOrders()
+        self.assertEqual(len(Singleton.QCAlgorithm.Transactions), 0)
+
+    def test_keeps_orders_worth_fees(self):
+        self.portfolio.AddOrder(InternalOrder(self.portfolio, FOO, 100))
+        self.portfolio.ExecuteOrders()
+        self.assertEqual(len(Singleton.QCAlgorithm.Transactions), 1)
+
+    def test_fills_feed_rolling_volume(self):
+        order = InternalOrder(self.portfolio, FOO, 500_000)
+        event = OrderEvent(1, FOO, 500_000.0, 1.0, status=OrderStatus.Filled)
+        Singleton.Broker._process_fill(event, order)
+        self.assertEqual(self.model.Volume.Value(date(2019, 1, 10)), 500_000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# pylint: disable=C0111,C0103,W0212
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from mocked import Symbol, InternalSecurityManager, OrderType, OrderStatus, OrderEvent, OrderFee, CashAmount, \
+    Slice, TradeBar
+from market import Broker, InternalOrder, Position
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from journal import Journal, Replay
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+def SetupManager():
+    qc = QCAlgorithm()
+    qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+    qc.Time = datetime(2019, 3, 4, 10, 0)
+    Singleton.Setup(qc, broker=Broker())
+    algorithm1 = Algorithm(name="alg1", allocation=0.5)
+    algorithm2 = Algorithm(name="alg2", allocation=0.5)
+    qc.SetCash(1000.0)
+    qc.registerAlgorithms([algorithm1, algorithm2], plot_orders=False, plot_value=False, plot_allocation=False)
+    return qc, algorithm1, algorithm2
+
+
+def Fill(qc, order, price, fee=0.0, status=OrderStatus.Filled):
+    order_event = OrderEvent(order.Ticket.OrderId, order.Symbol, order.Quantity, price, status=status)
+    order_event.OrderFee = OrderFee(CashAmount(fee, 'USD'))
+    qc.OnOrderEvent(order_event)
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.qc, self.algorithm1, self.algorithm2 = SetupManager()
+        self.journal = Journal()
+        self.qc.SetJournal(self.journal)
+
+    def record_session(self):
+        qc = self.qc
+        qc.OnData(Slice({FOO: TradeBar(qc.Time, FOO, 5, 5, 5, 5.5, 100)}))
+        buy = InternalOrder(self.algorithm1.Portfolio, FOO, 20, order_type=OrderType.Limit, limit_price=5.5, tag="a")
+        Singleton.Broker._execute_order(buy)
+        other = InternalOrder(self.algorithm2.Portfolio, BAR, 4)
+        Singleton.Broker._execute_order(other)
+
+        qc.Time += timedelta(minutes=5)
+        Fill(qc, buy, 5.5, fee=0.25, status=OrderStatus.Submitted)
+        Fill(qc, buy, 5.4, fee=0.25)
+        qc.Time += timedelta(days=1)
+        Fill(qc, other, 49.0, fee=1.0)
+
+        sell = InternalOrder(self.algorithm1.Portfolio, FOO, -5)
+        Singleton.Broker._execute_order(sell)
+        Fill(qc, sell, 6.0)
+        return sell
+
+    def test_records(self):
+        self.record_session()
+        tags = [tag for tag, _, _, _ in Journal.Read(self.journal.Value())]
+        self.assertEqual(tags, [Journal.SNAPSHOT, Journal.PRICES, Journal.ORDER, Journal.ORDER,
+                                Journal.ORDER_EVENT, Journal.ORDER_EVENT, Journal.ORDER_EVENT,
+                                Journal.ORDER, Journal.ORDER_EVENT])
+        self.assertEqual(self.journal.Count, len(tags))
+
+        times = [time for _, _, time, _ in Journal.Read(self.journal.Value())]
+        self.assertEqual(times[0], datetime(2019, 3, 4, 10, 0))
+        self.assertEqual(times[-1], datetime(2019, 3, 5, 10, 5))
+
+    def test_replay_reproduces_accounting(self):
+        self.record_session()
+        data = self.journal.Value()
+
+        qc, algorithm1, algorithm2 = SetupManager()
+        replay = Replay(data)
+        self.assertEqual(replay.Tickers(), {'foo', 'bar'})
+        self.assertEqual(replay.AlgorithmNames(), ["alg1", "alg2"])
+        stats = replay.Run([algorithm1, algorithm2])
+
+        self.assertEqual(stats["events"], 9)
+        self.assertEqual(stats["order_events"], 4)
+        self.assertEqual(qc.Securities[FOO].Price, 5.5)
+        self.assertEqual(qc.Time, datetime(2019, 3, 5, 10, 5))
+        for original, replayed in ((self.algorithm1, algorithm1), (self.algorithm2, algorithm2)):
+            self.assertEqual(replayed.Portfolio.Cash, original.Portfolio.Cash)
+            self.assertEqual(replayed.Portfolio.TotalFees, original.Portfolio.TotalFees)
+            self.assertEqual(replayed.TotalOrders, original.TotalOrders)
+            for symbol, position in original.Portfolio.items():
+                self.assertEqual(replayed.Portfolio[symbol].Quantity, position.Quantity)
+                self.assertEqual(replayed.Portfolio[symbol].AveragePrice, position.AveragePrice)
+        self.assertEqual(algorithm1.Portfolio[FOO].Quantity, 15)
+        self.assertFalse(Singleton.Broker._submitted)
+
+    def test_replay_starts_from_snapshot(self):
+        open_order = InternalOrder(self.algorithm2.Portfolio, FOO, 10)
+        Singleton.Broker._execute_order(open_order)
+        self.algorithm1.Portfolio.SetCash(123.0)
+        journal = Journal()
+        self.qc.SetJournal(journal)
+        Fill(self.qc, open_order, 5.0)
+
+        qc, algorithm1, algorithm2 = SetupManager()
+        Replay(journal.Value()).Run([algorithm1, algorithm2])
+        self.assertEqual(algorithm1.Portfolio.Cash, 123.0)
+        self.assertEqual(algorithm2.Portfolio[FOO].Quantity, 10)
+        self.assertEqual(algorithm2.Portfolio.Cash, self.algorithm2.Portfolio.Cash)
+        self.assertIs(qc, Singleton.QCAlgorithm)
+
+    def test_replay_internal_fills(self):
+        broker = Singleton.Broker
+        broker.Portfolio[FOO] = Position(FOO, 50, 5)
+        journal = Journal()
+        self.qc.SetJournal(journal)
+        broker.ExecuteOrder(InternalOrder(self.algorithm1.Portfolio, FOO, 20))
+        self.assertEqual(self.algorithm1.Portfolio[FOO].Quantity, 20)
+
+        qc, algorithm1, algorithm2 = SetupManager()
+        stats = Replay(journal.Value()).Run([algorithm1, algorithm2])
+        self.assertEqual(stats["internal_fills"], 1)
+        for original, replayed in ((self.algorithm1.Portfolio, algorithm1.Portfolio),
+                                   (self.algorithm2.Portfolio, algorithm2.Portfolio),
+                                   (broker.Portfolio, Singleton.Broker.Portfolio)):
+            self.assertEqual(replayed.Cash, original.Cash)
+            self.assertEqual({s: p.Quantity for s, p in replayed.items()},
+                             {s: p.Quantity for s, p in original.items()})
+
+    def test_replay_shared_orders(self):
+        Singleton.Broker.ExecuteOrders([InternalOrder(self.algorithm1.Portfolio, FOO, 2),
+                                        InternalOrder(self.algorithm2.Portfolio, FOO, 4)])
+        order = next(iter(Singleton.Broker._submitted.values()))
+        Fill(self.qc, order, 5.0, fee=0.6)
+        self.assertEqual(self.algorithm2.Portfolio[FOO].Quantity, 4)
+
+        qc, algorithm1, algorithm2 = SetupManager()
+        Replay(self.journal.Value()).Run([algorithm1, algorithm2])
+        for original, replayed in ((self.algorithm1, algorithm1), (self.algorithm2, algorithm2)):
+            self.assertEqual(replayed.Portfolio.Cash, original.Portfolio.Cash)
+            self.assertEqual(replayed.Portfolio[FOO].Quantity, original.Portfolio[FOO].Quantity)
+
+    def test_flush_appends_to_file(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            journal = Journal(path)
+            self.qc.SetJournal(journal)
+            self.qc.OnEndOfDay()
+            self.record_session()
+            self.qc.OnEndOfAlgorithm()
+            self.assertEqual(journal.Value(), b'')
+
+            reopened = Journal(path)
+            self.qc.SetJournal(reopened)
+            reopened.Flush()
+            with open(path, 'rb') as f:
+                tags = [tag for tag, _, _, _ in Journal.Read(f.read())]
+            self.assertEqual(tags.count(Journal.SNAPSHOT), 2)
+            self.assertEqual(len(tags), 10)
+        finally:
+            os.remove(path)
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            list(Journal.Read(b'LAMS' + bytes(8)))
+
+
+if __name__ == '__main__':
+    unittest.main()
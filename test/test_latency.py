@@ -0,0 +1,140 @@
+# pylint: disable=C0111,C0103,W0212
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from mocked import Symbol, InternalSecurityManager, OrderStatus, OrderEvent, MarketImpactModel
+from market import Broker, InternalOrder
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from latency import Histogram, OrderLatency, WALL_CLOCK, ALGORITHM_TIME
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for seconds in [0.0005] * 90 + [0.1] * 9 + [30.0]:
+            histogram.Add(seconds)
+        self.assertEqual(histogram.Count, 100)
+        self.assertEqual(histogram.Percentile(50), 0.001)
+        self.assertEqual(histogram.Percentile(90), 0.001)
+        self.assertEqual(histogram.Percentile(99), 0.128)
+        self.assertEqual(histogram.Percentile(100), 30.0)
+        self.assertEqual(histogram.Max, 30.0)
+        self.assertAlmostEqual(histogram.Mean, (0.045 + 0.9 + 30.0) / 100)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().Percentile(50), 0.0)
+        self.assertEqual(Histogram().Mean, 0.0)
+
+    def test_overflow(self):
+        histogram = Histogram()
+        histogram.Add(1e6)
+        self.assertEqual(histogram.Counts[-1], 1)
+        self.assertEqual(histogram.Percentile(50), 1e6)
+
+
+class TestOrderLatency(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        self.qc.Time = datetime(2019, 3, 4, 10, 0)
+        self.latency = OrderLatency(key="latency")
+        Singleton.Setup(self.qc, broker=Broker(), latency=self.latency)
+        self.algorithm = Algorithm(name="alg1", allocation=1.0)
+        self.qc.SetCash(1000.0)
+        self.qc.registerAlgorithms([self.algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm.Portfolio.SetCash(1000.0)
+
+    def fill(self, order, status=OrderStatus.Filled, fill_quantity=None):
+        order_event = OrderEvent(order.Ticket.OrderId, order.Symbol, order.Quantity, 5.0, status=status)
+        if fill_quantity is not None:
+            order_event.FillQuantity = fill_quantity
+        self.qc.OnOrderEvent(order_event)
+
+    def test_lifecycle_timestamps(self):
+        portfolio = self.algorithm.Portfolio
+        portfolio.AddOrder(InternalOrder(portfolio, FOO, 10))
+        self.qc.Time += timedelta(minutes=1)
+        portfolio.ExecuteOrders()
+        order, = Singleton.Broker._submitted.values()
+        self.assertEqual(order.QueuedAt[1], datetime(2019, 3, 4, 10, 0))
+        self.assertEqual(order.SubmittedAt[1], datetime(2019, 3, 4, 10, 1))
+        self.assertIsNone(order.FirstFillAt)
+
+        self.qc.Time += timedelta(minutes=1)
+        # an order that is still open but already has fills
+        self.fill(order, status=OrderStatus.Submitted, fill_quantity=4.0)
+        self.assertEqual(order.FirstFillAt[1], datetime(2019, 3, 4, 10, 2))
+        self.assertIsNone(order.DoneAt)
+
+        self.qc.Time += timedelta(minutes=3)
+        self.fill(order)
+        self.assertEqual(order.FirstFillAt[1], datetime(2019, 3, 4, 10, 2))
+        self.assertEqual(order.DoneAt[1], datetime(2019, 3, 4, 10, 5))
+        self.assertLessEqual(order.QueuedAt[0], order.DoneAt[0])
+
+        histograms = self.latency.ByAlgorithm["alg1"]
+        self.assertEqual(histograms[(ALGORITHM_TIME, "queued_to_submitted")].Total, 60.0)
+        self.assertEqual(histograms[(ALGORITHM_TIME, "submitted_to_first_fill")].Total, 60.0)
+        self.assertEqual(histograms[(ALGORITHM_TIME, "submitted_to_done")].Total, 240.0)
+        self.assertEqual(histograms[(ALGORITHM_TIME, "queued_to_done")].Total, 300.0)
+        self.assertEqual(histograms[(WALL_CLOCK, "queued_to_done")].Count, 1)
+        self.assertEqual(self.latency.BySymbol["foo"][(WALL_CLOCK, "queued_to_done")].Count, 1)
+
+    def test_synchronous_orders(self):
+        self.qc.FillModel = MarketImpactModel(coefficient=0.0)
+        market_order = self.qc.MarketOrder
+
+        def blocking_market_order(symbol, quantity, asynchronous, tag):
+            # LEAN returns a synchronous order once it is done, with all of its events
+            self.qc.Time += timedelta(minutes=1)
+            ticket = market_order(symbol, quantity, asynchronous, tag)
+            ticket.OrderEvents.insert(0, OrderEvent(ticket.OrderId, symbol, quantity, status=OrderStatus.Submitted))
+            return ticket
+        self.qc.MarketOrder = blocking_market_order
+
+        order = InternalOrder(self.algorithm.Portfolio, FOO, 10)
+        Singleton.Broker._execute_order(order)
+        self.assertEqual(order.SubmittedAt[1], datetime(2019, 3, 4, 10, 0))
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 10)
+        self.assertEqual(self.algorithm.TotalOrders, 1)
+        histograms = self.latency.BySymbol["foo"]
+        self.assertEqual(histograms[(ALGORITHM_TIME, "submitted_to_done")].Count, 1)
+        self.assertEqual(histograms[(ALGORITHM_TIME, "submitted_to_done")].Total, 60.0)
+
+    def test_orders_that_skip_the_queue(self):
+        order = InternalOrder(self.algorithm.Portfolio, BAR, 2)
+        Singleton.Broker._execute_order(order)
+        self.fill(order)
+        histograms = self.latency.BySymbol["bar"]
+        self.assertEqual(histograms[(ALGORITHM_TIME, "submitted_to_done")].Count, 1)
+        self.assertEqual(histograms[(ALGORITHM_TIME, "queued_to_done")].Count, 0)
+
+    def test_unmanaged_orders(self):
+        order = InternalOrder(Singleton.Broker.Portfolio, BAR, 2)
+        Singleton.Broker._execute_order(order)
+        self.fill(order)
+        self.assertIn("unmanaged", self.latency.ByAlgorithm)
+
+    def test_export_at_end_of_day(self):
+        order = InternalOrder(self.algorithm.Portfolio, FOO, 10)
+        Singleton.Broker._execute_order(order)
+        self.fill(order)
+        self.qc.OnEndOfDay()
+
+        exported = json.loads(self.qc.ObjectStore.Read("latency/2019-03-04"))
+        self.assertEqual(exported["algorithms"]["alg1"]["algorithm"]["submitted_to_done"]["count"], 1)
+        self.assertEqual(exported["symbols"]["foo"]["wall"]["submitted_to_done"]["count"], 1)
+        self.assertEqual(self.latency.ByAlgorithm, {})
+
+        self.qc.Time += timedelta(days=1)
+        self.qc.OnEndOfDay()
+        self.assertFalse(self.qc.ObjectStore.ContainsKey("latency/2019-03-05"))
+
+
+if __name__ == '__main__':
+    unittest.main()
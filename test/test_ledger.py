@@ -0,0 +1,106 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from mocked import Symbol, InternalSecurityManager
+from market import Broker, Portfolio, Position, AVERAGE_COST, FIFO
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from ledger import TradeLedger
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+class TestTradeLedger(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        Singleton.Setup(self.qc)
+        self.ledger = TradeLedger(chunk_size=2)
+
+    def record(self, algorithm, symbol, quantity, price, fee=0.0, day=1):
+        self.ledger.Record(algorithm, symbol, quantity, price, fee, time=datetime(2019, 1, day))
+
+    def test_chunks(self):
+        for day in range(1, 6):
+            self.record("alg1", FOO, day, 10.0, day=day)
+        columns = self.ledger.Columns()
+        self.assertEqual(len(self.ledger), 5)
+        np.testing.assert_array_equal(columns["Quantity"], [1, 2, 3, 4, 5])
+        self.assertEqual(columns["Time"][4], np.datetime64("2019-01-05"))
+        self.assertIs(self.ledger.Columns(), columns)
+        self.record("alg1", FOO, 6, 10.0)
+        self.assertEqual(len(self.ledger.Columns()["Quantity"]), 6)
+
+    def test_empty(self):
+        self.assertEqual(len(self.ledger.Columns()["Price"]), 0)
+        self.assertEqual(self.ledger.Summary(), {})
+        self.assertEqual(len(self.ledger.HoldingPeriods("alg1")), 0)
+
+    def test_queries(self):
+        self.record("alg1", FOO, 10, 10.0, fee=1.0, day=1)
+        self.record("alg2", BAR, 5, 20.0, day=1)
+        self.record("alg1", FOO, 10, 20.0, fee=1.0, day=2)
+        self.record("alg1", FOO, -5, 30.0, fee=1.0, day=3)
+        self.record("alg1", FOO, -15, 10.0, fee=1.0, day=5)
+        self.record("alg1", BAR, 2, 20.0, day=6)
+
+        turnover = self.ledger.Turnover()
+        self.assertEqual(turnover, {"alg1": 100.0 + 200.0 + 150.0 + 150.0 + 40.0, "alg2": 100.0})
+        self.assertEqual(self.ledger.Fees(), {"alg1": 4.0, "alg2": 0.0})
+        self.assertAlmostEqual(self.ledger.FeeDrag()["alg1"], 4.0 / 640.0)
+
+        # average cost 15: +75 on the first sale, -75 on the second
+        self.assertEqual(self.ledger.RealizedProfit(), {"alg1": -4.0, "alg2": 0.0})
+        periods = self.ledger.HoldingPeriods("alg1")
+        self.assertEqual(list(periods), [np.timedelta64(4, "D")])
+        self.assertEqual(len(self.ledger.HoldingPeriods("alg2")), 0)
+        self.assertEqual(len(self.ledger.HoldingPeriods("other")), 0)
+
+    def test_shorts_and_cost_basis(self):
+        self.record("alg1", FOO, -10, 20.0)
+        self.record("alg1", FOO, 4, 10.0)
+        self.record("alg1", FOO, -10, 30.0)
+        self.record("alg1", FOO, 6, 25.0)
+        # 40 on the first cover; the second covers 6 of 6 @ 20 and 10 @ 30
+        self.assertEqual(self.ledger.RealizedProfit(AVERAGE_COST), {"alg1": 40.0 + 6 * (26.25 - 25.0)})
+        self.assertEqual(self.ledger.RealizedProfit(FIFO), {"alg1": 40.0 + 6 * (20.0 - 25.0)})
+
+
+class TestLedgerFills(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        self.qc.Time = datetime(2019, 3, 4, 10, 0)
+        self.ledger = TradeLedger()
+        Singleton.Setup(self.qc, broker=Broker(), ledger=self.ledger)
+        self.algorithm = Algorithm(name="alg1", allocation=1.0)
+        self.qc.registerAlgorithms([self.algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm.Portfolio.SetCash(1000.0)
+
+    def test_external_fill(self):
+        self.algorithm.Portfolio._fill_order(FOO, 10.0, 5.0, 1.0)
+        columns = self.ledger.Columns()
+        self.assertEqual(self.ledger.Algorithms, ["alg1"])
+        self.assertEqual(self.ledger.Symbols, [str(FOO)])
+        self.assertEqual(columns["Time"][0], np.datetime64(datetime(2019, 3, 4, 10, 0)))
+        self.assertEqual((columns["Quantity"][0], columns["Price"][0], columns["Fee"][0]), (10.0, 5.0, 1.0))
+        self.assertFalse(columns["Internal"][0])
+
+    def test_internal_fill(self):
+        broker = Singleton.Broker
+        broker.Portfolio = Portfolio()
+        broker.Portfolio[FOO] = Position(FOO, 20, 5)
+        self.algorithm.Buy(FOO, 4)
+        self.algorithm.Portfolio.ExecuteOrders()
+        columns = self.ledger.Columns()
+        self.assertEqual([self.ledger.Algorithms[i] for i in columns["Algorithm"]], ["", "alg1"])
+        np.testing.assert_array_equal(columns["Quantity"], [-4.0, 4.0])
+        np.testing.assert_array_equal(columns["Internal"], [True, True])
+        self.assertEqual(self.ledger.Turnover()["alg1"], 20.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,13 @@
 # pylint: disable=C0111,C0103,C0413
 import unittest
 import math
+from datetime import datetime, timedelta
 from unittest.mock import Mock
 
 # from math import isclose
 
-from mocked import QCAlgorithm, Resolution, Security, Symbol, OrderStatus, InternalSecurityManager, OrderEvent
-from market import Portfolio, Position, Broker, InternalOrder, OrderType, CashBook, Cash
+from mocked import QCAlgorithm, Resolution, Security, Symbol, OrderStatus, InternalSecurityManager, OrderEvent, Currency
+from market import Portfolio, Position, Broker, InternalOrder, OrderType, CashBook, Cash, FIFO
 from algorithm import Algorithm
 from singleton import Singleton
 
@@ -15,6 +16,8 @@ BAR = Symbol('bar')
 XYZ = Symbol('xyz')
 USD = Symbol('USD')
 BTCUSD = Symbol('BTCUSD')
+USDTUSD = Symbol('USDTUSD')
+BTCEUR = Symbol('BTCEUR')
 
 
 def SetupSingleton(securities=None, brokerage_portfolio=None, default_order_status=OrderStatus.Submitted):
@@ -61,6 +64,22 @@ class TestPortfolioWithSinglePosition(unittest.TestCase):
         Singleton.QCAlgorithm.Securities['foo'] = Security(FOO, price=3)
         self.assertEqual(self.portfolio.TotalPortfolioValue, 306)
 
+    def test_security_is_resolved_lazily(self):
+        abc = Symbol('abc')
+        position = Position(abc, 1, 5.0)
+        self.assertIsNone(position.Security)
+        Singleton.QCAlgorithm.Securities[abc] = Security(abc, price=6)
+        self.assertIs(position.Security, Singleton.QCAlgorithm.Securities[abc])
+        self.assertEqual(position.UnrealizedProfit, 1.0)
+
+        # resolved once per symbol, until the universe changes
+        Singleton.QCAlgorithm.Securities = InternalSecurityManager([(abc, 4)])
+        Singleton.InvalidateStep()
+        self.assertEqual(position.Price, 6.0)
+        self.assertEqual(Position(abc, 2, 5.0).Price, 6.0)
+        Singleton.SecurityCache.pop(abc)
+        self.assertEqual(position.Price, 4.0)
+
     def test_buy_existing_position(self):
         self.portfolio._fill_order(FOO, 1.0, 9.0)
         self.assertEqual(self.portfolio['foo'].Quantity, 13)
@@ -117,6 +136,50 @@ class TestPortfolioWithMultiplePositions(unittest.TestCase):
         self.assertEqual(self.portfolio.Cash, 318)
 
 
+class TestRealizedProfit(unittest.TestCase):
+    def setUp(self):
+        SetupSingleton(securities=[(FOO, 20), (BAR, 10)])
+
+    def trade(self, position):
+        position._fill(10.0, 10.0)
+        position._fill(10.0, 16.0, 1.0)
+        position._fill(-15.0, 20.0, 1.0)
+
+    def test_average_cost(self):
+        position = Position(FOO, 0, 0)
+        self.trade(position)
+        self.assertEqual(position.Quantity, 5)
+        self.assertEqual(position.AveragePrice, 13.0)
+        self.assertEqual(position.RealizedProfit, 15 * 7.0)
+        self.assertEqual(position.UnrealizedProfit, 5 * 7.0)
+        self.assertEqual(position.NetProfit, 15 * 7.0 - 2.0)
+        self.assertEqual(position.Lots, [(5.0, 13.0)])
+
+    def test_fifo(self):
+        position = Position(FOO, 0, 0, cost_basis=FIFO)
+        self.trade(position)
+        self.assertEqual(position.Lots, [(5.0, 16.0)])
+        self.assertEqual(position.AveragePrice, 16.0)
+        self.assertEqual(position.RealizedProfit, 10 * 10.0 + 5 * 4.0)
+        self.assertEqual(position.UnrealizedProfit, 5 * 4.0)
+
+        position._fill(-5.0, 10.0)
+        self.assertEqual(position.Lots, [])
+        self.assertEqual(position.RealizedProfit, 120.0 - 30.0)
+
+    def test_portfolio(self):
+        portfolio = Portfolio(cash=1000.0)
+        portfolio.CostBasis = FIFO
+        portfolio._fill_order(FOO, 10.0, 10.0, 1.0)
+        portfolio._fill_order(FOO, 10.0, 16.0)
+        portfolio._fill_order(FOO, -10.0, 20.0)
+        portfolio._fill_order(BAR, 4.0, 5.0, 1.0)
+        self.assertEqual(portfolio[FOO].CostBasis, FIFO)
+        self.assertEqual(portfolio.RealizedProfit, 100.0)
+        self.assertEqual(portfolio.TotalProfit, 100.0)
+        self.assertEqual(portfolio.NetProfit, 98.0)
+        self.assertEqual(portfolio.UnrealizedProfit, 10 * 4.0 + 4 * 5.0)
+
 class TestHelpers(unittest.TestCase):
     def assert_portfolio(self, portfolio, cash, args):
         # self.assertTrue(isclose(portfolio.Cash, cash))
@@ -171,6 +234,54 @@ class TestMarketOrders(TestHelpers):
         self.assert_orders(Singleton.Broker._submitted, {})
         self.assert_portfolio(self.portfolio, 100, {FOO:0, BAR:0, XYZ:1})
 
+    def test_open_quantity_excludes_fills(self):
+        order = InternalOrder(self.portfolio, FOO, 10)
+        Singleton.Broker.ExecuteOrder(order)
+        order_event = OrderEvent(order.Ticket.OrderId, FOO, 10.0, 1.0, status=OrderStatus.PartiallyFilled)
+        order_event.FillQuantity = 4.0
+        Singleton.Broker.HandleOrderEvent(order_event)
+        self.assertEqual(self.portfolio[FOO].Quantity, 4)
+        self.assertEqual(order.Filled, 4)
+        self.assertEqual(Singleton.Broker.OpenQuantity(self.portfolio, FOO), 6)
+
+    def test_execute_orders_nets_and_waits_for_cash(self):
+        self.portfolio[BAR] = Position(BAR, 20, 10)
+        Singleton.QCAlgorithm.Time = datetime(2019, 1, 2, 10, 0)
+        broker = Singleton.Broker
+        broker.ExecuteOrders([InternalOrder(self.portfolio, XYZ, 1), InternalOrder(self.portfolio, FOO, 50),
+                              InternalOrder(self.portfolio, XYZ, 2), InternalOrder(self.portfolio, BAR, -10)])
+        transactions = Singleton.QCAlgorithm.Transactions
+        self.assertEqual([(x.Symbol, x.Quantity) for x in transactions.values()], [(BAR, -10), (FOO, 50)])
+        self.assertEqual(broker.HeldQuantity(self.portfolio, XYZ), 3)
+
+        # the sell fills and frees enough cash
+        Singleton.QCAlgorithm.Portfolio.SetCash(300.0)
+        sell = next(order for order in broker._submitted.values() if order.Symbol == BAR)
+        broker.HandleOrderEvent(OrderEvent(sell.Ticket.OrderId, BAR, -10.0, 10.0, status=OrderStatus.Filled))
+        self.assertEqual([(x.Symbol, x.Quantity) for x in transactions.values()][-1], (XYZ, 3))
+        self.assertEqual(broker.Held, [])
+        self.assertEqual(self.portfolio[BAR].Quantity, 10)
+
+    def test_held_buys_ignore_other_sells_and_expire(self):
+        self.portfolio[BAR] = Position(BAR, 20, 10)
+        Singleton.QCAlgorithm.Time = datetime(2019, 1, 2, 10, 0)
+        broker = Singleton.Broker
+        transactions = Singleton.QCAlgorithm.Transactions
+
+        # a resting stop-loss does not hold back later buys
+        broker._execute_order(InternalOrder(self.portfolio, BAR, -5, order_type=OrderType.StopMarket, stop_price=8))
+        broker.ExecuteOrders([InternalOrder(self.portfolio, XYZ, 3)])
+        self.assertEqual([(x.Symbol, x.Quantity) for x in transactions.values()][-1], (XYZ, 3))
+
+        broker.ExecuteOrders([InternalOrder(self.portfolio, BAR, -10), InternalOrder(self.portfolio, XYZ, 5)])
+        self.assertEqual(broker.HeldQuantity(self.portfolio, XYZ), 5)
+        broker.ExecuteOrders([])
+        self.assertEqual(len(broker.Held), 1)
+        Singleton.QCAlgorithm.Time += Broker.HoldTimeout
+        broker.ExecuteOrders([])
+        self.assertEqual(broker.Held, [])
+        self.assertEqual(len(transactions), 3)
+
 
 class TestImportFromBroker(TestHelpers):
     def test_securities(self):
@@ -198,6 +309,60 @@ class TestImportFromBroker(TestHelpers):
         Singleton.Broker.ImportFromBroker()
         self.assert_portfolio(Singleton.Broker.Portfolio, 200, {BTCUSD: 0.123})
 
+    def test_multiple_currencies(self):
+        brokerage_portfolio = Portfolio(cash=Cash('USD', 200.0, 1.0))
+        brokerage_portfolio.CashBook['EUR'] = Cash('EUR', 100.0, 1.1)
+        brokerage_portfolio.CashBook['USDT'] = Cash('USDT', 50.0, 1.0)
+        brokerage_portfolio.CashBook['BTC'] = Cash('BTC', 0.5, 50_000)
+
+        SetupSingleton(brokerage_portfolio=brokerage_portfolio,
+                       securities=[(BTCUSD, 50_000), (USDTUSD, 1), (BTCEUR, 40_000)])
+        Singleton.Broker.ImportFromBroker()
+        portfolio = Singleton.Broker.Portfolio
+        self.assert_portfolio(portfolio, 200, {BTCUSD: 0.5, USDTUSD: 50})
+        self.assertEqual(set(portfolio.CashBook.Keys), {'USD', 'EUR'})
+        self.assertAlmostEqual(portfolio.TotalPortfolioValue, 25_000 + 50 + 200 + 110)
+
+        # rates follow LEAN's cash book on every bar
+        Singleton.QCAlgorithm.Portfolio.CashBook['EUR'] = Cash('EUR', 100.0, 1.2)
+        Singleton.ConversionRates.Update()
+        self.assertAlmostEqual(portfolio.CashBook.TotalValueInAccountCurrency, 200 + 120)
+
+        # holdings quoted in another currency are converted too
+        Singleton.QCAlgorithm.Securities[BTCEUR].QuoteCurrency = Currency('EUR')
+        portfolio[BTCEUR] = Position(BTCEUR, 0.1, 40_000)
+        self.assertAlmostEqual(portfolio.TotalHoldingsValue, 25_000 + 50 + 4_000 * 1.2)
+
+        # a currency seen for the first time starts at LEAN's rate, never at 0
+        Singleton.QCAlgorithm.Portfolio.CashBook['GBP'] = Cash('GBP', 0.0, 1.3)
+        self.assertEqual(Singleton.ConversionRates.Rate('GBP'), 1.3)
+        with self.assertRaises(KeyError):
+            Singleton.ConversionRates.Rate('JPY')
+
+    def test_account_currency(self):
+        brokerage_portfolio = Portfolio(cash=Cash('USD', 200.0, 1.0))
+        brokerage_portfolio.CashBook['EUR'] = Cash('EUR', 1_000.0, 1.0)
+
+        SetupSingleton(brokerage_portfolio=brokerage_portfolio, securities=[(BTCEUR, 4_000)])
+        Singleton.QCAlgorithm.Securities[BTCEUR].QuoteCurrency = Currency('EUR')
+        Singleton.Broker.ImportFromBroker(currency='EUR')
+        portfolio = Singleton.Broker.Portfolio
+        self.assertEqual(portfolio.AccountCurrency, 'EUR')
+        self.assertEqual(portfolio.CashBook['EUR'], 1_000)
+        self.assertEqual(portfolio.CashBook['USD'], 200)
+        self.assertEqual(portfolio.Cash, 1_000)
+
+        # fills move cash in the quote currency
+        portfolio._fill_order(BTCEUR, 0.1, 4_000.0, fees=1.0)
+        self.assertEqual(portfolio.CashBook['EUR'], 599)
+        self.assertEqual(portfolio.CashBook['USD'], 200)
+        self.assertEqual(portfolio.Cash, 599)
+
+        algorithm = Algorithm(name="alg1")
+        algorithm.Portfolio.SetAccountCurrency('EUR')
+        algorithm.Portfolio.SetCash(100.0)
+        self.assertEqual(dict(algorithm.Portfolio.CashBook), {'EUR': 100})
+
 class TestBrokerPortfolio(TestHelpers):
     def setUp(self):
         brokerage_portfolio = Portfolio(cash=Cash('USD', 100.0, 1.0))
@@ -0,0 +1,96 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from datetime import datetime
+
+from mocked import Symbol, InternalSecurityManager, OrderBookSimulator, OrderStatus, OrderType, TradeBar, LocalEngine
+from market import Broker, InternalOrder
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+def bar(symbol, open_, high, low, close, volume=1000):
+    return TradeBar(datetime(2019, 3, 4), symbol, open_, high, low, close, volume)
+
+
+class TestOrderBookSimulator(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 10), (BAR, 20)])
+        self.qc.Time = datetime(2019, 3, 4, 10, 0)
+        self.qc.OrderBook = OrderBookSimulator(self.qc, participation=0.1)
+        Singleton.Setup(self.qc, broker=Broker())
+        self.algorithm = Algorithm(name="alg1", allocation=1.0)
+        self.qc.registerAlgorithms([self.algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm.Portfolio.SetCash(100_000.0)
+
+    def submit(self, quantity, order_type=OrderType.Limit, limit_price=None, stop_price=None, symbol=FOO):
+        order = InternalOrder(self.algorithm.Portfolio, symbol, quantity, order_type=order_type,
+                              limit_price=limit_price, stop_price=stop_price)
+        Singleton.Broker.ExecuteOrder(order)
+        return order
+
+    def test_limits_match_best_price_first(self):
+        low = self.submit(50, limit_price=9.0)
+        high = self.submit(50, limit_price=9.5)
+        self.assertEqual(len(self.qc.OrderBook), 2)
+
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 10, 10, 9.4, 9.8))
+        self.assertEqual(high.Ticket.Status, OrderStatus.Filled)
+        self.assertEqual(low.Ticket.Status, OrderStatus.Submitted)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 50)
+        self.assertEqual(self.algorithm.Portfolio[FOO].AveragePrice, 9.5)
+        self.assertNotIn(high.Ticket.OrderId, Singleton.Broker._submitted)
+
+        # gaps fill at the open
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 8.5, 8.8, 8.4, 8.6))
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 100)
+        self.assertEqual([e.FillPrice for e in low.Ticket.OrderEvents], [8.5])
+
+    def test_partial_fills(self):
+        order = self.submit(250, order_type=OrderType.Market)
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 10, 10, 10, 10))
+        self.assertEqual(order.Ticket.Status, OrderStatus.PartiallyFilled)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 100)
+        self.assertIn(order.Ticket.OrderId, Singleton.Broker._submitted)
+        self.assertEqual(self.algorithm.TotalOrders, 0)
+
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 11, 11, 11, 11))
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 12, 12, 12, 12))
+        self.assertEqual([e.FillQuantity for e in order.Ticket.OrderEvents], [100, 100, 50])
+        self.assertEqual(order.Ticket.Status, OrderStatus.Filled)
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 250)
+        self.assertEqual(self.algorithm.Portfolio.Cash, 100_000 - 1000 - 1100 - 600)
+        self.assertNotIn(order.Ticket.OrderId, Singleton.Broker._submitted)
+        self.assertEqual(self.algorithm.TotalOrders, 1)
+
+    def test_stops(self):
+        self.algorithm.Portfolio._fill_order(FOO, 100.0, 10.0)
+        stop = self.submit(-100, order_type=OrderType.StopMarket, stop_price=9.0)
+        stop_limit = self.submit(10, order_type=OrderType.StopLimit, stop_price=11.0, limit_price=11.5)
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 10, 10.5, 9.5, 10))
+        self.assertEqual(stop.Ticket.OrderEvents, [])
+
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 8.5, 12, 8, 11.8, volume=2000))
+        self.assertEqual([e.FillPrice for e in stop.Ticket.OrderEvents], [8.5])
+        self.assertEqual([e.FillPrice for e in stop_limit.Ticket.OrderEvents], [11.0])
+        self.assertEqual(self.algorithm.Portfolio[FOO].Quantity, 10)
+
+    def test_canceled_orders_are_skipped(self):
+        order = self.submit(10, limit_price=9.0)
+        order.Ticket.Cancel()
+        self.qc.OrderBook.OnBar(FOO, bar(FOO, 9, 9, 8, 8))
+        self.assertEqual(order.Ticket.OrderEvents, [])
+        self.assertEqual(len(self.qc.OrderBook), 0)
+
+    def test_local_engine(self):
+        self.submit(10, limit_price=19.0, symbol=BAR)
+        LocalEngine(self.qc).Step(datetime(2019, 3, 4, 11, 0), {BAR: bar(BAR, 20, 20, 18, 19)})
+        self.assertEqual(self.algorithm.Portfolio[BAR].Quantity, 10)
+        self.assertEqual(self.qc.Securities[BAR].Price, 19)
+
+
+if __name__ == '__main__':
+    unittest.main()
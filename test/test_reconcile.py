@@ -0,0 +1,108 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+
+from mocked import Symbol, InternalSecurityManager, OrderEvent, OrderStatus, Currency
+from market import Broker, Portfolio, Position, Cash
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from reconcile import Reconciler
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+class TestReconciler(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        Singleton.Setup(self.qc, broker=Broker(portfolio=Portfolio(cash=100.0)))
+        self.algorithm1 = Algorithm(name="alg1", allocation=0.5)
+        self.algorithm2 = Algorithm(name="alg2", allocation=0.5)
+        self.qc.registerAlgorithms([self.algorithm1, self.algorithm2],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm1.Portfolio.SetCash(500.0)
+        self.algorithm2.Portfolio.SetCash(400.0)
+        self.algorithm1.Portfolio[FOO] = Position(FOO, 10, 5)
+        self.algorithm2.Portfolio[FOO] = Position(FOO, 5, 5)
+        Singleton.Broker.Portfolio[BAR] = Position(BAR, 2, 50)
+
+        # what the brokerage holds
+        self.brokerage(FOO, 15)
+        self.brokerage(BAR, 2)
+        self.qc.Portfolio.CashBook['USD'] = Cash('USD', 1000.0)
+
+        self.reconciler = Reconciler()
+        self.qc.SetReconciler(self.reconciler)
+
+    def brokerage(self, symbol, quantity):
+        self.qc.Portfolio[symbol] = Position(symbol, quantity, 5)
+
+    def test_totals(self):
+        self.assertEqual(self.reconciler.Quantities, {FOO: 15.0, BAR: 2.0})
+        self.assertEqual(self.reconciler.Cash, 1000.0)
+        self.assertEqual(self.reconciler.Reconcile(), {})
+        self.assertEqual(self.reconciler.Dirty, set())
+
+    def test_only_changed_symbols(self):
+        self.reconciler.Reconcile()
+        self.brokerage(BAR, 3)
+        self.algorithm1.Portfolio._fill_order(FOO, 2.0, 5.0)
+        self.brokerage(FOO, 17)
+        self.qc.Portfolio.CashBook['USD'] = Cash('USD', 990.0)
+        self.assertEqual(self.reconciler.Dirty, {FOO})
+        self.assertEqual(self.reconciler.Reconcile(), {})
+        self.assertEqual(self.reconciler.CashDrift, 0.0)
+
+        # a brokerage event marks BAR dirty even without a managed order
+        Singleton.Broker.HandleOrderEvent(OrderEvent(99, BAR, 1, 50, status=OrderStatus.Filled))
+        self.assertEqual(self.reconciler.Reconcile(), {BAR: 1.0})
+
+    def test_full(self):
+        self.reconciler.Reconcile()
+        self.brokerage(BAR, 1)
+        self.assertEqual(self.reconciler.Reconcile(), {})
+        self.assertEqual(self.reconciler.Reconcile(full=True), {BAR: -1.0})
+
+    def test_adjust_unmanaged(self):
+        self.reconciler.Adjust = True
+        self.brokerage(BAR, 5)
+        self.qc.Portfolio.CashBook['USD'] = Cash('USD', 1010.0)
+        self.reconciler.MarkDirty(BAR)
+        self.qc.OnBrokerageReconnect()
+        self.assertEqual(Singleton.Broker.Portfolio[BAR].Quantity, 5)
+        self.assertEqual(Singleton.Broker.Portfolio.Cash, 110.0)
+        self.assertEqual(self.reconciler.Reconcile(full=True), {})
+        self.assertEqual(self.reconciler.CashDrift, 0.0)
+
+    def test_other_currencies(self):
+        self.qc.Portfolio.CashBook['EUR'] = Cash('EUR', 100.0, 1.1)
+        Singleton.Broker.Portfolio.CashBook['EUR'] = Cash('EUR', 100.0)
+        self.qc.SetReconciler(self.reconciler)
+        self.assertAlmostEqual(self.reconciler.Cash, 1000.0 + 110.0)
+
+        # FOO is quoted in EUR, so is its cash
+        self.qc.Securities[FOO].QuoteCurrency = Currency('EUR')
+        self.algorithm1.Portfolio._fill_order(FOO, 2.0, 5.0)
+        self.brokerage(FOO, 17)
+        self.qc.Portfolio.CashBook['EUR'] = Cash('EUR', 90.0, 1.1)
+        self.assertEqual(self.reconciler.Reconcile(), {})
+        self.assertEqual(self.reconciler.CashDrift, 0.0)
+
+        self.reconciler.Adjust = True
+        self.qc.Portfolio.CashBook['EUR'] = Cash('EUR', 80.0, 1.1)
+        self.reconciler.Reconcile()
+        self.assertEqual(self.reconciler.CashDrifts, {'EUR': -10.0})
+        self.assertAlmostEqual(self.reconciler.CashDrift, -11.0)
+        self.assertEqual(Singleton.Broker.Portfolio.CashBook['EUR'], 90.0)
+        self.assertEqual(Singleton.Broker.Portfolio.Cash, 100.0)
+
+    def test_cannot_adjust_below_zero(self):
+        self.reconciler.Adjust = True
+        self.brokerage(FOO, 12)
+        self.assertEqual(self.reconciler.Reconcile(full=True), {FOO: -3.0})
+        self.assertNotIn(FOO, Singleton.Broker.Portfolio)
+        self.assertEqual(self.reconciler.Reconcile(full=True), {FOO: -3.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from datetime import datetime
+
+from mocked import Symbol, InternalSecurityManager
+from market import Broker, InternalOrder, Position
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from risk import RiskEngine, RiskLimits, GLOBAL
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+class TestRiskEngine(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Securities = InternalSecurityManager([(FOO, 10), (BAR, 20)])
+        self.qc.Time = datetime(2019, 3, 4, 16, 0)
+        Singleton.Setup(self.qc, broker=Broker())
+        self.algorithm1 = Algorithm(name="alg1", allocation=0.5)
+        self.algorithm2 = Algorithm(name="alg2", allocation=0.5)
+        self.qc.registerAlgorithms([self.algorithm1, self.algorithm2],
+                                   plot_orders=False, plot_value=False, plot_allocation=False)
+        self.algorithm1.Portfolio.SetCash(800.0)
+        self.algorithm1.Portfolio[FOO] = Position(FOO, 20, 10)
+        self.algorithm2.Portfolio.SetCash(1000.0)
+
+        self.risk = RiskEngine()
+        self.qc.SetRiskEngine(self.risk)
+        self.executed = []
+        Singleton.Broker.ExecuteOrder = self.executed.append
+
+    def execute(self, *orders):
+        Singleton.Broker.ExecuteOrders(list(orders))
+        return [(o.Portfolio.Algorithm.Name, o.Symbol, o.Quantity) for o in self.executed]
+
+    def order(self, algorithm, symbol, quantity):
+        return InternalOrder(algorithm.Portfolio, symbol, quantity)
+
+    def test_aggregates(self):
+        self.assertEqual(self.risk.Equity, {GLOBAL: 2000.0, "alg1": 1000.0, "alg2": 1000.0})
+        self.assertEqual(self.risk.Gross, {GLOBAL: 200.0, "alg1": 200.0, "alg2": 0.0})
+        self.assertEqual(self.risk.Exposure[("alg1", FOO)], 200.0)
+
+    def test_position_weight(self):
+        self.risk.SetLimits("alg1", RiskLimits(max_position_weight=0.25))
+        self.assertEqual(self.execute(self.order(self.algorithm1, FOO, 10), self.order(self.algorithm2, FOO, 50)),
+                         [("alg2", FOO, 50.0)])
+        self.assertEqual(self.risk.Rejected, 1)
+        self.assertEqual(self.risk.Exposure[(GLOBAL, FOO)], 700.0)
+
+    def test_burst_sees_earlier_orders(self):
+        self.risk.Limits = RiskLimits(max_gross_exposure=0.5)
+        orders = [self.order(self.algorithm2, BAR, 20), self.order(self.algorithm1, BAR, 20),
+                  self.order(self.algorithm2, FOO, 40)]
+        # both BAR orders pass and go out as one
+        self.assertEqual(self.execute(*orders), [("alg2", BAR, 40.0)])
+        self.assertEqual(self.risk.Gross[GLOBAL], 1000.0)
+
+    def test_sells_first_free_room(self):
+        self.risk.SetLimits("alg1", RiskLimits(max_gross_exposure=0.2))
+        executed = self.execute(self.order(self.algorithm1, BAR, 10), self.order(self.algorithm1, FOO, -20))
+        self.assertEqual(executed, [("alg1", FOO, -20.0), ("alg1", BAR, 10.0)])
+
+    def test_turnover_and_order_notional(self):
+        self.risk.SetLimits("alg2", RiskLimits(max_daily_turnover=0.3, max_order_notional=250))
+        executed = self.execute(self.order(self.algorithm2, BAR, 10), self.order(self.algorithm2, FOO, 15))
+        self.assertEqual(executed, [("alg2", FOO, 15.0)])
+
+        # a new day starts a new turnover budget
+        self.qc.OnEndOfDay()
+        self.assertEqual(self.execute(self.order(self.algorithm2, FOO, 30))[-1], ("alg2", FOO, 15.0))
+        self.assertEqual(self.execute(self.order(self.algorithm2, BAR, 10))[-1], ("alg2", BAR, 10.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
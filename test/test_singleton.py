@@ -1,9 +1,12 @@
 # pylint: disable=C0111,C0103,C0112,W0201,W0212
+import os
+import tempfile
 import unittest
 
-from datetime import date
+from datetime import date, datetime, timedelta
 from market import Singleton
-from algorithm import AlgorithmManager as QCAlgorithm
+from singleton import Email, Digest, FileTransport
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
 
 
 def assert_log_level_error(test):
@@ -86,5 +89,160 @@ class TestSingletonLogLevelWithCustomDateRanges(unittest.TestCase):
         assert_log_level_error(self)
 
 
+class TestSingletonDelegation(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Time = datetime(2019, 1, 2)
+        Singleton.Setup(self.qc)
+
+    def advance(self, time):
+        # LEAN moves Time forward without going through Python's setattr
+        object.__setattr__(self.qc, 'Time', time)
+
+    def test_resolves_once(self):
+        self.assertEqual(Singleton.Time, datetime(2019, 1, 2))
+        self.assertIs(Singleton.Securities, self.qc.Securities)
+        self.assertIn('Securities', Singleton._delegated_values)
+        self.assertEqual(Singleton.Plot, self.qc.Plot)
+        self.assertIn('Plot', vars(Singleton))
+
+    def test_values_follow_time(self):
+        algorithm = Algorithm(name="alg")
+        self.qc.registerAlgorithms([algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+        securities = Singleton.Securities
+        self.assertEqual(algorithm.Time, datetime(2019, 1, 2))
+
+        # e.g. a consolidator handler LEAN calls before the manager's OnData
+        object.__setattr__(self.qc, 'Securities', {})
+        self.advance(datetime(2019, 1, 3))
+        self.assertEqual(algorithm.Time, datetime(2019, 1, 3))
+        self.assertIsNot(Singleton.Securities, securities)
+        self.assertIs(Singleton.Securities, self.qc.Securities)
+
+    def test_methods_survive_steps(self):
+        Singleton.Plot
+        Singleton.InvalidateStep()
+        self.assertIn('Plot', vars(Singleton))
+        Singleton.Setup(QCAlgorithm())
+        self.assertNotIn('Plot', vars(Singleton))
+
+    def test_values_are_kept_for_one_step(self):
+        securities = self.qc.Securities
+        self.assertIs(Singleton.Securities, securities)
+        self.qc.Securities = {}
+        self.assertIs(Singleton.Securities, securities)
+        Singleton.InvalidateStep()
+        self.assertIs(Singleton.Securities, self.qc.Securities)
+
+        # LEAN advancing Time starts a new step too
+        self.qc.Securities = securities
+        self.qc.Time += timedelta(minutes=1)
+        self.assertIs(Singleton.Securities, securities)
+
+    def test_missing_attributes(self):
+        with self.assertRaises(AttributeError):
+            Singleton.DoesNotExist
+        with self.assertRaises(AttributeError):
+            Algorithm(name="alg").DoesNotExist
+        self.assertFalse(hasattr(Singleton, 'DoesNotExist'))
+
+
+class RecordingTransport(object):
+    def __init__(self):
+        self.Messages = []
+
+    def Send(self, address, subject, body):
+        self.Messages.append((address, subject, body))
+
+
+class TestEmail(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        self.qc.Time = datetime(2019, 1, 2, 16, 0)
+        self.transport = RecordingTransport()
+        Singleton.Setup(self.qc, email_addr="me@example.com", email_transport=self.transport)
+
+    def test_ignored_without_address(self):
+        email = Email()
+        email.AppendText("hello")
+        self.assertFalse(email.HasContent)
+
+    def test_merges_rows_per_key(self):
+        email = Email()
+        email.SetEmailAddress("me@example.com")
+        email.AppendText("started")
+        email.AppendKeyValue("foo", "10%")
+        email.AppendKeyValue("bar", "5%")
+        email.AppendKeyValue("foo", "0%")
+        self.assertEqual(email.Content,
+                         "<tr><td colspan=\"2\">started</td></tr>\n"
+                         "<tr><td>foo</td><td>0%</td></tr>\n"
+                         "<tr><td>bar</td><td>5%</td></tr>\n")
+        email.Send("subject", transport=self.transport)
+        self.assertFalse(email.HasContent)
+        self.assertEqual(self.transport.Messages[0][:2], ("me@example.com", "subject"))
+
+    def test_digest_is_rate_limited(self):
+        digest = Singleton.Email
+        email1 = Email()
+        email2 = Email()
+        for email in (email1, email2):
+            email.SetEmailAddress(digest.Address)
+        email1.AppendKeyValue("foo", "10%")
+        email2.AppendKeyValue("bar", "20%")
+        self.assertTrue(digest.Send("day 1", [("alg1", email1), ("alg2", email2), ("alg3", Email())]))
+        self.assertEqual(len(self.transport.Messages), 1)
+        body = self.transport.Messages[0][2]
+        self.assertIn("<h3>alg1</h3>", body)
+        self.assertIn("<h3>alg2</h3>", body)
+        self.assertNotIn("alg3", body)
+
+        self.qc.Time += timedelta(hours=2)
+        email1.AppendKeyValue("foo", "15%")
+        self.assertFalse(digest.Send("later", [("alg1", email1)]))
+        self.assertTrue(email1.HasContent)
+        self.assertTrue(digest.Send("forced", [("alg1", email1)], force=True))
+
+        self.qc.Time += timedelta(days=1)
+        email1.AppendKeyValue("foo", "20%")
+        self.assertTrue(digest.Send("day 2", [("alg1", email1)]))
+        self.assertFalse(digest.Send("empty", [("alg1", email1)]))
+        self.assertEqual([message[1] for message in self.transport.Messages], ["day 1", "forced", "day 2"])
+
+    def test_manager_sends_one_digest_per_day(self):
+        algorithms = [Algorithm(name="alg1"), Algorithm(name="alg2")]
+        self.qc.registerAlgorithms(algorithms, plot_orders=False, plot_value=False, plot_allocation=False)
+        self.assertEqual([message[1] for message in self.transport.Messages], ["Started"])
+
+        for i in algorithms:
+            i.Email.AppendKeyValue("foo", "50%")
+        self.qc.OnEndOfDay()
+        self.qc.OnEndOfDay()
+        self.assertEqual([message[1] for message in self.transport.Messages], ["Started", "Daily digest 2019-01-02"])
+        self.qc.OnEndOfAlgorithm()
+        self.assertEqual(len(self.transport.Messages), 3)
+
+    def test_file_transport(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            transport = FileTransport(path)
+            Digest("me@example.com", transport=transport).Send("subject", [("alg", self.email_with("row"))])
+            with open(path) as f:
+                content = f.read()
+            self.assertTrue(content.startswith("To: me@example.com\nSubject: subject\n"))
+            self.assertIn("<td colspan=\"2\">row</td>", content)
+            self.assertEqual(transport.Sent, 1)
+        finally:
+            os.remove(path)
+
+    @classmethod
+    def email_with(cls, text):
+        email = Email()
+        email.SetEmailAddress("me@example.com")
+        email.AppendText(text)
+        return email
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,244 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from datetime import datetime, timedelta
+
+from mocked import Symbol, InternalSecurityManager, OrderType, TradeBar
+from market import Portfolio, Position, Broker, InternalOrder, Cash, FIFO
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from snapshot import Snapshot
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+
+
+def SetupManager(brokerage_portfolio=None):
+    qc = QCAlgorithm()
+    qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+    qc.Time = datetime(2019, 3, 4, 16, 0)
+    if brokerage_portfolio is not None:
+        qc.Portfolio = brokerage_portfolio
+    Singleton.Setup(qc, broker=Broker())
+    algorithm1 = Algorithm(name="alg1", allocation=0.5)
+    algorithm2 = Algorithm(name="alg2", allocation=0.5)
+    qc.SetCash(1000.0)
+    qc.registerAlgorithms([algorithm1, algorithm2], plot_orders=False, plot_value=False, plot_allocation=False)
+    qc.SetSnapshotKey("snapshot")
+    return qc, algorithm1, algorithm2
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.qc, self.algorithm1, self.algorithm2 = SetupManager()
+        self.algorithm1.Portfolio.SetCash(200.0)
+        self.algorithm1.Portfolio.SetCost(400.0)
+        self.algorithm1.Portfolio[FOO] = Position(FOO, 10, 4.5, 1.25)
+        self.algorithm1.TotalOrders = 7
+        self.algorithm2.Portfolio.SetCash(300.0)
+        self.algorithm2.Portfolio[BAR] = Position(BAR, 3, 48)
+
+        order = InternalOrder(self.algorithm2.Portfolio, FOO, 2, order_type=OrderType.Limit, limit_price=4.0, tag="x")
+        Singleton.Broker._execute_order(order)
+        self.order_id = order.Ticket.OrderId
+
+    def test_round_trip(self):
+        Singleton.Broker._submitted[self.order_id].Filled = 1.0
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm1, self.algorithm2], Singleton.Broker, {"cost": 12.5})
+
+        algorithm1 = Algorithm(name="alg1", allocation=0.1)
+        algorithm2 = Algorithm(name="alg2", allocation=0.1)
+        broker = Broker()
+        snapshot = Snapshot.Load(data, [algorithm1, algorithm2], broker)
+
+        self.assertEqual(snapshot.Time, self.qc.Time)
+        self.assertEqual(snapshot.Metrics, {"cost": 12.5})
+        self.assertEqual(algorithm1.Allocation, 0.5)
+        self.assertEqual(algorithm1.TotalOrders, 7)
+        self.assertEqual(algorithm1.Portfolio.Cash, 200.0)
+        self.assertEqual(algorithm1.Portfolio.Cost, 400.0)
+        self.assertEqual(algorithm1.Portfolio[FOO].Quantity, 10)
+        self.assertEqual(algorithm1.Portfolio[FOO].AveragePrice, 4.5)
+        self.assertEqual(algorithm1.Portfolio[FOO].TotalFees, 1.25)
+        self.assertEqual(algorithm2.Portfolio[BAR].Quantity, 3)
+
+        order = broker._submitted[self.order_id]
+        self.assertIs(order.Portfolio, algorithm2.Portfolio)
+        self.assertEqual((order.Symbol, order.Quantity, order.OrderType, order.LimitPrice, order.tag),
+                         (FOO, 2.0, OrderType.Limit, 4.0, "x"))
+        self.assertEqual(order.Filled, 1.0)
+
+    def test_cash_in_other_currencies(self):
+        self.algorithm1.Portfolio.CashBook['EUR'] = Cash('EUR', 50.0)
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm1, self.algorithm2], Singleton.Broker, {})
+
+        algorithm1 = Algorithm(name="alg1")
+        Snapshot.Load(data, [algorithm1, Algorithm(name="alg2")], Broker())
+        self.assertEqual(dict(algorithm1.Portfolio.CashBook), {'USD': 200.0, 'EUR': 50.0})
+        self.assertEqual(algorithm1.Portfolio.Cash, 200.0)
+
+    def test_fifo_lots(self):
+        position = Position(FOO, 5, 10.0, cost_basis=FIFO)
+        position._fill(10.0, 20.0)
+        position.RealizedProfit = 100.0
+        self.algorithm1.Portfolio[FOO] = position
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm1, self.algorithm2], Singleton.Broker, {})
+
+        algorithm1 = Algorithm(name="alg1")
+        algorithm1.Portfolio.CostBasis = FIFO
+        Snapshot.Load(data, [algorithm1, Algorithm(name="alg2")], Broker())
+        restored = algorithm1.Portfolio[FOO]
+        self.assertEqual(restored.Lots, [(5.0, 10.0), (10.0, 20.0)])
+        self.assertEqual(restored.RealizedProfit, 100.0)
+        restored._fill(-5.0, 30.0)
+        self.assertEqual(restored.RealizedProfit, 200.0)
+
+    def test_shared_order(self):
+        Singleton.Broker._submitted[self.order_id].Allocations = [(self.algorithm1.Portfolio, 0.25),
+                                                                  (self.algorithm2.Portfolio, 0.75)]
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm1, self.algorithm2], Singleton.Broker, {})
+
+        algorithm1 = Algorithm(name="alg1")
+        algorithm2 = Algorithm(name="alg2")
+        broker = Broker()
+        Snapshot.Load(data, [algorithm1, algorithm2], broker)
+        order = broker._submitted[self.order_id]
+        self.assertEqual(order.Allocations, [(algorithm1.Portfolio, 0.25), (algorithm2.Portfolio, 0.75)])
+        self.assertEqual(order.Share(algorithm1.Portfolio), 0.25)
+
+    def test_drops_orders_whose_ticket_changed(self):
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm1, self.algorithm2], Singleton.Broker, {})
+        ticket = self.qc.Transactions.GetOrderTicket(self.order_id)
+        algorithm1 = Algorithm(name="alg1")
+        algorithm2 = Algorithm(name="alg2")
+
+        for attribute, value in (("Symbol", BAR), ("Quantity", 3), ("Tag", "y")):
+            original = getattr(ticket.Order, attribute)
+            setattr(ticket.Order, attribute, value)
+            broker = Broker()
+            Snapshot.Load(data, [algorithm1, algorithm2], broker)
+            self.assertNotIn(self.order_id, broker._submitted, attribute)
+            setattr(ticket.Order, attribute, original)
+
+        broker = Broker()
+        Snapshot.Load(data, [algorithm1, algorithm2], broker)
+        self.assertIs(broker._submitted[self.order_id].Ticket, ticket)
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            Snapshot.Load(b"nope", [], Broker())
+
+    def test_live_restart_keeps_attribution(self):
+        self.qc.SaveSnapshot()
+        data = self.qc.ObjectStore.ReadBytes("snapshot")
+
+        brokerage_portfolio = Portfolio(cash=1000.0)
+        brokerage_portfolio[FOO] = Position(FOO, 10, 5)
+        brokerage_portfolio[BAR] = Position(BAR, 5, 50)
+        qc, algorithm1, algorithm2 = SetupManager(brokerage_portfolio)
+        qc.ObjectStore.SaveBytes("snapshot", data)
+        qc.LiveMode = True
+        qc.OnWarmupFinished()
+
+        self.assertEqual(algorithm1.Portfolio.Cash, 200.0)
+        self.assertEqual(algorithm1.Portfolio[FOO].Quantity, 10)
+        self.assertEqual(algorithm2.Portfolio[BAR].Quantity, 3)
+        self.assertEqual(Singleton.Broker.Portfolio.Cash, 500.0)
+        self.assertEqual(Singleton.Broker.Portfolio[FOO].Quantity, 0)
+        self.assertEqual(Singleton.Broker.Portfolio[BAR].Quantity, 2)
+
+
+class WindowAlgorithm(Algorithm):
+    def Initialize(self):
+        self.SetWarmUp(timedelta(200))
+        self.Window = self.CreateRollingWindow(FOO, 3)
+
+
+class ReorderedWindowAlgorithm(Algorithm):
+    def Initialize(self):
+        self.SetWarmUp(timedelta(200))
+        self.Other = self.CreateRollingWindow(BAR, 2)
+        self.Window = self.CreateRollingWindow(FOO, 3)
+
+
+class ResizedWindowAlgorithm(Algorithm):
+    def Initialize(self):
+        self.SetWarmUp(timedelta(200))
+        self.Window = self.CreateRollingWindow(FOO, 5)
+
+
+class TestRollingWindowSnapshot(unittest.TestCase):
+    def setUp(self):
+        qc = QCAlgorithm()
+        qc.Securities = InternalSecurityManager([(FOO, 5)])
+        qc.Time = datetime(2019, 3, 4, 16, 0)
+        Singleton.Setup(qc, broker=Broker())
+        self.qc = qc
+        self.algorithm = WindowAlgorithm(name="window")
+        for day in range(1, 5):
+            self._update(datetime(2019, 3, day), float(day))
+
+    @classmethod
+    def _update(cls, time, price):
+        bar = TradeBar(time, FOO, price, price, price, price, 100.0)
+        for consolidator in Singleton.SubscriptionManager.Consolidators[FOO]:
+            consolidator.Update(bar)
+
+    def test_restore_windows_and_shorten_warm_up(self):
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm], Singleton.Broker, {})
+
+        qc = QCAlgorithm()
+        qc.Securities = InternalSecurityManager([(FOO, 5)])
+        qc.Time = datetime(2019, 3, 7, 9, 30)
+        Singleton.Setup(qc, broker=Broker())
+        restarted = WindowAlgorithm(name="window")
+        other = Algorithm(name="other")
+        other.SetWarmUp(20)
+        self.assertEqual(Singleton._warm_up, 200)
+
+        qc.ObjectStore.SaveBytes("snapshot", data)
+        qc.LiveMode = True
+        qc.SetSnapshotKey("snapshot")
+        qc.registerAlgorithms([restarted, other], plot_orders=False, plot_value=False, plot_allocation=False)
+
+        self.assertEqual([bar.Close for bar in restarted.Window], [4.0, 3.0, 2.0])
+        self.assertEqual(restarted.WarmUpPeriod, 3)
+        self.assertEqual(other.WarmUpPeriod, 20)
+        self.assertEqual(Singleton._warm_up, 20)
+
+    def restart(self, data, algorithm_class):
+        qc = QCAlgorithm()
+        qc.Securities = InternalSecurityManager([(FOO, 5), (BAR, 50)])
+        qc.Time = datetime(2019, 3, 7, 9, 30)
+        Singleton.Setup(qc, broker=Broker())
+        restarted = algorithm_class(name="window")
+        qc.ObjectStore.SaveBytes("snapshot", data)
+        qc.LiveMode = True
+        qc.SetSnapshotKey("snapshot")
+        qc.registerAlgorithms([restarted], plot_orders=False, plot_value=False, plot_allocation=False)
+        return restarted
+
+    def test_windows_are_matched_by_symbol_and_size(self):
+        # BAR's window was created after FOO's, then removed again
+        self.algorithm.CreateRollingWindow(BAR, 2)
+        data = Snapshot.Dump(self.qc.Time, [self.algorithm], Singleton.Broker, {})
+        self.algorithm.RemoveRollingWindows(BAR)
+        shortened = Snapshot.Dump(self.qc.Time, [self.algorithm], Singleton.Broker, {})
+
+        for snapshot in (data, shortened):
+            restarted = self.restart(snapshot, ReorderedWindowAlgorithm)
+            self.assertEqual([bar.Close for bar in restarted.Window], [4.0, 3.0, 2.0])
+            self.assertEqual(restarted.Other.Count, 0)
+            self.assertEqual(restarted.WarmUpPeriod, 3)
+
+        restarted = self.restart(data, ResizedWindowAlgorithm)
+        self.assertEqual(restarted.Window.Count, 0)
+        self.assertEqual(restarted.WarmUpPeriod, 200)
+
+    def test_replayed_bars_are_not_duplicated(self):
+        self._update(datetime(2019, 3, 4), 4.0)
+        self._update(datetime(2019, 3, 5), 5.0)
+        self.assertEqual([bar.Close for bar in self.algorithm.Window], [5.0, 4.0, 3.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
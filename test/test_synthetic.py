@@ -0,0 +1,67 @@
+# pylint: disable=C0111,C0103
+import unittest
+import numpy as np
+
+from mocked import LocalEngine
+from market import Portfolio, Broker
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from synthetic import SyntheticMarket, UniverseRamp, FlashCrash, IlliquidLots
+
+
+class TestSyntheticMarket(unittest.TestCase):
+    def test_deterministic(self):
+        first = SyntheticMarket(symbols=20, days=30, seed=3).Generate()
+        second = SyntheticMarket(symbols=20, days=30, seed=3).Generate()
+        np.testing.assert_array_equal(first.Close, second.Close)
+
+    def test_ohlc_consistency(self):
+        data = SyntheticMarket(symbols=50, days=60, jump_intensity=5.0).Generate()
+        self.assertEqual(data.Close.shape, (60, 50))
+        self.assertTrue(np.all(data.High >= np.maximum(data.Open, data.Close)))
+        self.assertTrue(np.all(data.Low <= np.minimum(data.Open, data.Close)))
+        self.assertTrue(np.all(data.Low > 0))
+        np.testing.assert_array_equal(data.Open[1:], data.Close[:-1])
+
+    def test_correlated_returns(self):
+        data = SyntheticMarket(symbols=2, days=2000, correlation=0.8).Generate()
+        returns = np.diff(np.log(data.Close), axis=0)
+        self.assertGreater(np.corrcoef(returns.T)[0, 1], 0.7)
+
+    def test_flash_crash(self):
+        calm = SyntheticMarket(symbols=10, days=40).Generate()
+        crash = SyntheticMarket(symbols=10, days=40, scenarios=[FlashCrash(20, depth=0.5, recovery=5)]).Generate()
+        np.testing.assert_allclose(crash.Close[20] / calm.Close[20], 0.5)
+        np.testing.assert_allclose(crash.Close[30] / calm.Close[30], 1.0)
+
+    def test_universe_ramp(self):
+        data = SyntheticMarket(symbols=100, days=10, scenarios=[UniverseRamp(0.1, 1.0)]).Generate()
+        active = data.Active.sum(axis=1)
+        self.assertEqual(active[0], 10)
+        self.assertEqual(active[-1], 100)
+        self.assertTrue(np.all(np.diff(active) >= 0))
+        self.assertEqual(len(data.Bars(0)), 10)
+
+    def test_illiquid_lots_reach_securities(self):
+        data = SyntheticMarket(symbols=20, days=5, scenarios=[IlliquidLots(1.0)]).Generate()
+        securities = data.SecurityManager()
+        self.assertEqual(securities[data.Symbols[0]].SymbolProperties.LotSize, 0.001)
+
+
+class TestSyntheticRun(unittest.TestCase):
+    def test_runs_through_local_engine(self):
+        data = SyntheticMarket(symbols=5, days=20, steps_per_day=2).Generate()
+        qc = QCAlgorithm()
+        qc.Securities = data.SecurityManager()
+        qc.Portfolio = Portfolio(cash=1000.0)
+        Singleton.Setup(qc, broker=Broker(), log_level=Singleton.ERROR)
+        algorithm = Algorithm(name="alg")
+        qc.registerAlgorithms([algorithm], plot_orders=False, plot_value=False, plot_allocation=False)
+
+        LocalEngine(qc).Run(data.Steps())
+        self.assertEqual(qc.Time, data.Times[-1])
+        self.assertEqual(qc.Securities[data.Symbols[3]].Price, data.Close[-1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
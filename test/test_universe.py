@@ -0,0 +1,104 @@
+# pylint: disable=C0111,C0103,W0212
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from mocked import Symbol, CoarseFundamental
+from algorithm import Algorithm, AlgorithmManager as QCAlgorithm
+from singleton import Singleton
+from universe import CoarseUniverse, FineUniverse, select
+
+FOO = Symbol('foo')
+BAR = Symbol('bar')
+XYZ = Symbol('xyz')
+ABC = Symbol('abc')
+
+COARSE = [
+    CoarseFundamental(FOO, 10.0, 1000),
+    CoarseFundamental(BAR, 2.0, 50000),
+    CoarseFundamental(XYZ, 50.0, 10, has_fundamental_data=False),
+    CoarseFundamental(ABC, 5.0, 3000),
+]
+
+
+class LiquidAlgorithm(Algorithm):
+    def CoarseSelectionFunction(self, coarse):
+        return coarse.Top(coarse.DollarVolume, 2, mask=coarse.HasFundamentalData)
+
+
+class CheapAlgorithm(Algorithm):
+    def CoarseSelectionFunction(self, coarse):
+        return coarse.Select(coarse.Price < 6.0)
+
+
+class LegacyAlgorithm(Algorithm):
+    def CoarseSelectionFunction(self, coarse):
+        return [c.Symbol for c in sorted(coarse, key=lambda c: c.Price)][:1]
+
+    def FineSelectionFunction(self, fine):
+        return [f.Symbol for f in fine if f.MarketCap > 1e9]
+
+
+class TestUniverse(unittest.TestCase):
+    def test_columns(self):
+        universe = CoarseUniverse(iter(COARSE))
+        self.assertEqual(len(universe), 4)
+        np.testing.assert_array_equal(universe.Price, [10.0, 2.0, 50.0, 5.0])
+        np.testing.assert_array_equal(universe.DollarVolume, [10000.0, 100000.0, 500.0, 15000.0])
+        np.testing.assert_array_equal(universe.HasFundamentalData, [True, True, False, True])
+        self.assertIs(universe.Price, universe.Price)
+        with self.assertRaises(ValueError):
+            universe.Price[0] = 1.0
+
+    def test_top_and_select(self):
+        universe = CoarseUniverse(COARSE)
+        self.assertEqual(universe.Top(universe.DollarVolume, 3), [BAR, ABC, FOO])
+        self.assertEqual(universe.Top(universe.Price, 2, mask=universe.HasFundamentalData), [FOO, ABC])
+        self.assertEqual(universe.Top(universe.Price, 10, mask=universe.Price > 100), [])
+        self.assertEqual(universe.Select(universe.Price > 9), [FOO, XYZ])
+        self.assertIs(universe[0], COARSE[0])
+
+    def test_missing_fine_values(self):
+        fine = FineUniverse([
+            SimpleNamespace(Symbol=FOO, MarketCap=2e9, ValuationRatios=SimpleNamespace(PERatio=15.0)),
+            SimpleNamespace(Symbol=BAR, MarketCap=None, ValuationRatios=SimpleNamespace(PERatio=None)),
+            SimpleNamespace(Symbol=XYZ, MarketCap=5e8),
+        ])
+        pe = fine.Column("ValuationRatios.PERatio")
+        self.assertEqual(pe[0], 15.0)
+        self.assertTrue(np.isnan(pe[1]) and np.isnan(pe[2]))
+        self.assertEqual(fine.Top(-pe, 3), [FOO])
+        self.assertEqual(fine.Select(fine.MarketCap > 1e9), [FOO])
+
+
+class TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.qc = QCAlgorithm()
+        Singleton.Setup(self.qc)
+        self.algorithms = [LiquidAlgorithm(name="liquid"), CheapAlgorithm(name="cheap"),
+                           LegacyAlgorithm(name="legacy"), Algorithm(name="none")]
+        self.qc.registerAlgorithms(self.algorithms, plot_orders=False, plot_value=False, plot_allocation=False)
+
+    def test_deduplicated_in_order(self):
+        self.assertEqual(self.qc.CoarseSelectionFunction(COARSE), [BAR, ABC])
+
+    def test_parallel(self):
+        self.qc.SetSelectionWorkers(4)
+        self.assertEqual(self.qc.CoarseSelectionFunction(COARSE), [BAR, ABC])
+
+    def test_skips_algorithms_without_selection(self):
+        self.assertEqual(len(self.qc._AlgorithmManager__coarse_algorithms), 3)
+        self.assertEqual(self.qc._AlgorithmManager__fine_algorithms, [self.algorithms[2]])
+
+    def test_fine(self):
+        fine = [SimpleNamespace(Symbol=FOO, MarketCap=2e9), SimpleNamespace(Symbol=BAR, MarketCap=1e6)]
+        self.assertEqual(self.qc.FineSelectionFunction(fine), [FOO])
+
+    def test_select_keeps_duplicates_out(self):
+        calls = [SimpleNamespace(Select=lambda universe: [FOO, BAR]), SimpleNamespace(Select=lambda universe: [BAR])]
+        self.assertEqual(select(calls, "Select", None, workers=2), [FOO, BAR])
+
+
+if __name__ == '__main__':
+    unittest.main()
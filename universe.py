@@ -0,0 +1,106 @@
+# pylint: disable=C0111,C0103,R0903
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+import numpy as np
+
+
+class Universe(object):
+    '''Fundamentals of one selection step, with NumPy columns built once and shared by all algorithms.
+
+    Iterating it yields the original fundamental objects, so selection functions written
+    against LEAN's list keep working.
+    '''
+
+    def __init__(self, fundamentals):
+        self.Fundamentals = fundamentals if isinstance(fundamentals, list) else list(fundamentals)
+        self.Symbols = np.empty(len(self.Fundamentals), dtype=object)
+        self.Symbols[:] = [f.Symbol for f in self.Fundamentals]
+        self.__columns = {}
+
+    def __iter__(self):
+        return iter(self.Fundamentals)
+
+    def __len__(self):
+        return len(self.Fundamentals)
+
+    def __getitem__(self, index):
+        return self.Fundamentals[index]
+
+    def Column(self, name, dtype=float):
+        """Values of a (dotted) attribute, e.g. "ValuationRatios.PERatio"; missing floats are NaN."""
+        column = self.__columns.get(name)
+        if column is None:
+            getter = attrgetter(name)
+            missing = np.nan if np.dtype(dtype).kind == 'f' else 0
+
+            def get(fundamental):
+                try:
+                    value = getter(fundamental)
+                except AttributeError:
+                    return missing
+                return missing if value is None else value
+
+            column = np.fromiter((get(f) for f in self.Fundamentals), dtype=dtype, count=len(self.Fundamentals))
+            column.setflags(write=False)
+            self.__columns[name] = column
+        return column
+
+    def Select(self, mask):
+        """Symbols where mask is True."""
+        return list(self.Symbols[mask])
+
+    def Top(self, scores, count, mask=None):
+        """Symbols with the highest scores, best first; NaN scores are never selected."""
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        count = min(count, int(np.count_nonzero(scores > -np.inf)))
+        if count <= 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return list(self.Symbols[best])
+
+
+class CoarseUniverse(Universe):
+    @property
+    def Price(self):
+        return self.Column("Price")
+
+    @property
+    def DollarVolume(self):
+        return self.Column("DollarVolume")
+
+    @property
+    def Volume(self):
+        return self.Column("Volume")
+
+    @property
+    def HasFundamentalData(self):
+        return self.Column("HasFundamentalData", dtype=bool)
+
+
+class FineUniverse(Universe):
+    @property
+    def MarketCap(self):
+        return self.Column("MarketCap")
+
+
+def select(algorithms, method, universe, workers=1):
+    """Call method on every algorithm and return the selected symbols without duplicates.
+
+    With workers > 1, algorithms score in a thread pool; NumPy releases the GIL on large columns.
+    """
+    calls = [getattr(i, method) for i in algorithms]
+    if workers > 1 and len(calls) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda call: call(universe), calls))
+    else:
+        results = [call(universe) for call in calls]
+
+    # keep the order of first selection
+    selected = {}
+    for symbols in results:
+        for symbol in symbols:
+            selected[symbol] = None
+    return list(selected)